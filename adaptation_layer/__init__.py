@@ -23,7 +23,7 @@ from flask.cli import with_appcontext
 from adaptation_layer.repository.sqlite import NFVO, NFVO_CREDENTIALS, RANO, \
     RANO_CREDENTIALS
 # import sqlite
-from . import tasks
+from . import cluster, deadline, request_cache, tasks
 from .config import Config
 from .db import MsoloDB
 from .error_handler import init_errorhandler
@@ -42,10 +42,25 @@ def create_app(test_config=None):
     app = Flask(__name__, instance_relative_config=True)
     app.config.from_object(Config)
     init_errorhandler(app)
+
+    # bound the time spent on backend calls by each request
+    @app.before_request
+    def start_deadline():
+        deadline.set_deadline(deadline.Deadline())
+        request_cache.set_cache(request_cache.RequestCache())
+
+    @app.teardown_request
+    def clear_deadline(exc):
+        deadline.set_deadline(None)
+        request_cache.set_cache(None)
+
     database.init_app(app)
     IWFREPO = os.getenv('IWFREPO', 'false').lower()
-    if IWFREPO == 'true':
+    # sent once by all the uWSGI workers starting together
+    if IWFREPO == 'true' and cluster.run_once('startup_tasks', cluster.STARTUP_WINDOW):
+        tasks.sync_inventory.delay(True)
         tasks.post_osm_vims.delay()
+        tasks.reconcile_subscriptions.delay()
     # ensure the instance folder exists
     try:
         os.makedirs(app.instance_path)
@@ -57,6 +72,7 @@ def create_app(test_config=None):
     # register blueprints
     app.register_blueprint(mso_lo_app.nfvo_bp)
     app.register_blueprint(mso_lo_app.rano_bp)
+    app.register_blueprint(mso_lo_app.stats_bp)
 
     return app
 
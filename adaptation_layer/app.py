@@ -12,21 +12,42 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+from functools import wraps
+
 from flask import (
     Blueprint, request, jsonify,
     abort, make_response
 )
 
 import adaptation_layer.driver.manager as manager
+import adaptation_layer.driver.osm as osm
+from adaptation_layer import bulkhead
 from adaptation_layer import database
+from adaptation_layer import polling
+from adaptation_layer import subscription_index
 from adaptation_layer import tasks
 from adaptation_layer.error_handler import Unauthorized, BadRequest, \
     ServerError, NfvoNotFound, NsNotFound, NsdNotFound, \
     NsOpNotFound, NfvoCredentialsNotFound, SubscriptionNotFound, Forbidden, \
-    Conflict, Unprocessable
+    Conflict, Unprocessable, GatewayTimeout, ServiceUnavailable
 
 nfvo_bp = Blueprint('nfvo', __name__, url_prefix='/nfvo')
 rano_bp = Blueprint('rano', __name__, url_prefix='/rano')
+stats_bp = Blueprint('stats', __name__, url_prefix='/stats')
+
+
+def with_bulkhead(func):
+    """Serve the route within the concurrency limit of its orchestrator."""
+
+    @wraps(func)
+    def wrapper(**kwargs):
+        try:
+            with bulkhead.slot(request.blueprint, kwargs['orc_id']):
+                return func(**kwargs)
+        except ServiceUnavailable as e:
+            abort(503, description=e.description, retry_after=e.retry_after)
+
+    return wrapper
 
 
 @nfvo_bp.route('/', methods=['GET'])
@@ -41,6 +62,8 @@ def get_orchestrator_list():
         abort(401, description=e.description)
     except ServerError as e:
         abort(500, description=e.description)
+    except GatewayTimeout as e:
+        abort(504, description=e.description)
 
 
 @nfvo_bp.route('/<orc_id>', methods=['GET'])
@@ -57,10 +80,13 @@ def get_nfvo(orc_id):
         abort(404, description=e.description)
     except ServerError as e:
         abort(500, description=e.description)
+    except GatewayTimeout as e:
+        abort(504, description=e.description)
 
 
 @nfvo_bp.route('/<orc_id>/ns_instances', methods=['POST'])
 @rano_bp.route('/<orc_id>/ns_instances', methods=['POST'])
+@with_bulkhead
 def create_ns(orc_id):
     try:
         driver = manager.get_driver(request.blueprint, orc_id, database.msolo_db)
@@ -70,6 +96,7 @@ def create_ns(orc_id):
     except BadRequest as e:
         abort(400, description=e.description)
     except Unauthorized as e:
+        manager.invalidate_driver(request.blueprint, orc_id)
         abort(401, description=e.description)
     except Forbidden as e:
         abort(403, description=e.description)
@@ -81,10 +108,15 @@ def create_ns(orc_id):
         abort(422, description=e.description)
     except ServerError as e:
         abort(500, description=e.description)
+    except ServiceUnavailable as e:
+        abort(503, description=e.description, retry_after=e.retry_after)
+    except GatewayTimeout as e:
+        abort(504, description=e.description)
 
 
 @nfvo_bp.route('/<orc_id>/ns_instances', methods=['GET'])
 @rano_bp.route('/<orc_id>/ns_instances', methods=['GET'])
+@with_bulkhead
 def get_ns_list(orc_id):
     try:
         driver = manager.get_driver(request.blueprint, orc_id, database.msolo_db)
@@ -93,15 +125,21 @@ def get_ns_list(orc_id):
     except BadRequest as e:
         abort(400, description=e.description)
     except Unauthorized as e:
+        manager.invalidate_driver(request.blueprint, orc_id)
         abort(401, description=e.description)
     except (NfvoNotFound, NfvoCredentialsNotFound) as e:
         abort(404, description=e.description)
     except ServerError as e:
         abort(500, description=e.description)
+    except ServiceUnavailable as e:
+        abort(503, description=e.description, retry_after=e.retry_after)
+    except GatewayTimeout as e:
+        abort(504, description=e.description)
 
 
 @nfvo_bp.route('/<orc_id>/ns_instances/<ns_id>', methods=['GET'])
 @rano_bp.route('/<orc_id>/ns_instances/<ns_id>', methods=['GET'])
+@with_bulkhead
 def get_ns(orc_id, ns_id):
     try:
         driver = manager.get_driver(request.blueprint, orc_id, database.msolo_db)
@@ -110,15 +148,21 @@ def get_ns(orc_id, ns_id):
     except BadRequest as e:
         abort(400, description=e.description)
     except Unauthorized as e:
+        manager.invalidate_driver(request.blueprint, orc_id)
         abort(401, description=e.description)
     except (NfvoNotFound, NfvoCredentialsNotFound, NsNotFound) as e:
         abort(404, description=e.description)
     except ServerError as e:
         abort(500, description=e.description)
+    except ServiceUnavailable as e:
+        abort(503, description=e.description, retry_after=e.retry_after)
+    except GatewayTimeout as e:
+        abort(504, description=e.description)
 
 
 @nfvo_bp.route('/<orc_id>/ns_instances/<ns_id>', methods=['DELETE'])
 @rano_bp.route('/<orc_id>/ns_instances/<ns_id>', methods=['DELETE'])
+@with_bulkhead
 def delete_ns(orc_id, ns_id):
     try:
         driver = manager.get_driver(request.blueprint, orc_id, database.msolo_db)
@@ -128,6 +172,7 @@ def delete_ns(orc_id, ns_id):
     except BadRequest as e:
         abort(400, description=e.description)
     except Unauthorized as e:
+        manager.invalidate_driver(request.blueprint, orc_id)
         abort(401, description=e.description)
     except Forbidden as e:
         abort(403, description=e.description)
@@ -135,20 +180,28 @@ def delete_ns(orc_id, ns_id):
         abort(404, description=e.description)
     except ServerError as e:
         abort(500, description=e.description)
+    except ServiceUnavailable as e:
+        abort(503, description=e.description, retry_after=e.retry_after)
+    except GatewayTimeout as e:
+        abort(504, description=e.description)
 
 
 @nfvo_bp.route('/<orc_id>/ns_instances/<ns_id>/instantiate', methods=['POST'])
 @rano_bp.route('/<orc_id>/ns_instances/<ns_id>/instantiate', methods=['POST'])
+@with_bulkhead
 def instantiate_ns(orc_id, ns_id):
     try:
         driver = manager.get_driver(request.blueprint, orc_id, database.msolo_db)
         empty_body, headers = driver.instantiate_ns(
             ns_id,
             args={'payload': request.json, 'args': request.args.to_dict()})
+        if request.blueprint == 'nfvo':
+            polling.wake(orc_id)
         return make_response('', 202, headers)
     except BadRequest as e:
         abort(400, description=e.description)
     except Unauthorized as e:
+        manager.invalidate_driver(request.blueprint, orc_id)
         abort(401, description=e.description)
     except Forbidden as e:
         abort(403, description=e.description)
@@ -160,20 +213,28 @@ def instantiate_ns(orc_id, ns_id):
         abort(422, description=e.description)
     except ServerError as e:
         abort(500, description=e.description)
+    except ServiceUnavailable as e:
+        abort(503, description=e.description, retry_after=e.retry_after)
+    except GatewayTimeout as e:
+        abort(504, description=e.description)
 
 
 @nfvo_bp.route('/<orc_id>/ns_instances/<ns_id>/terminate', methods=['POST'])
 @rano_bp.route('/<orc_id>/ns_instances/<ns_id>/terminate', methods=['POST'])
+@with_bulkhead
 def terminate_ns(orc_id, ns_id):
     try:
         driver = manager.get_driver(request.blueprint, orc_id, database.msolo_db)
         empty_body, headers = driver.terminate_ns(
             ns_id,
             args={'args': request.args.to_dict()})
+        if request.blueprint == 'nfvo':
+            polling.wake(orc_id)
         return make_response('', 202, headers)
     except BadRequest as e:
         abort(400, description=e.description)
     except Unauthorized as e:
+        manager.invalidate_driver(request.blueprint, orc_id)
         abort(401, description=e.description)
     except Forbidden as e:
         abort(403, description=e.description)
@@ -185,20 +246,28 @@ def terminate_ns(orc_id, ns_id):
         abort(422, description=e.description)
     except ServerError as e:
         abort(500, description=e.description)
+    except ServiceUnavailable as e:
+        abort(503, description=e.description, retry_after=e.retry_after)
+    except GatewayTimeout as e:
+        abort(504, description=e.description)
 
 
 @nfvo_bp.route('/<orc_id>/ns_instances/<ns_id>/scale', methods=['POST'])
 @rano_bp.route('/<orc_id>/ns_instances/<ns_id>/scale', methods=['POST'])
+@with_bulkhead
 def scale_ns(orc_id, ns_id):
     try:
         driver = manager.get_driver(request.blueprint, orc_id, database.msolo_db)
         empty_body, headers = driver.scale_ns(
             ns_id,
             args={'payload': request.json, 'args': request.args.to_dict()})
+        if request.blueprint == 'nfvo':
+            polling.wake(orc_id)
         return make_response('', 202, headers)
     except BadRequest as e:
         abort(400, description=e.description)
     except Unauthorized as e:
+        manager.invalidate_driver(request.blueprint, orc_id)
         abort(401, description=e.description)
     except Forbidden as e:
         abort(403, description=e.description)
@@ -210,10 +279,15 @@ def scale_ns(orc_id, ns_id):
         abort(422, description=e.description)
     except ServerError as e:
         abort(500, description=e.description)
+    except ServiceUnavailable as e:
+        abort(503, description=e.description, retry_after=e.retry_after)
+    except GatewayTimeout as e:
+        abort(504, description=e.description)
 
 
 @nfvo_bp.route('/<orc_id>/ns_lcm_op_occs', methods=['GET'])
 @rano_bp.route('/<orc_id>/ns_lcm_op_occs', methods=['GET'])
+@with_bulkhead
 def get_op_list(orc_id):
     try:
         driver = manager.get_driver(request.blueprint, orc_id, database.msolo_db)
@@ -222,15 +296,21 @@ def get_op_list(orc_id):
     except BadRequest as e:
         abort(400, description=e.description)
     except Unauthorized as e:
+        manager.invalidate_driver(request.blueprint, orc_id)
         abort(401, description=e.description)
     except (NfvoNotFound, NfvoCredentialsNotFound, NsNotFound) as e:
         abort(404, description=e.description)
     except ServerError as e:
         abort(500, description=e.description)
+    except ServiceUnavailable as e:
+        abort(503, description=e.description, retry_after=e.retry_after)
+    except GatewayTimeout as e:
+        abort(504, description=e.description)
 
 
 @nfvo_bp.route('/<orc_id>/ns_lcm_op_occs/<nsLcmOpId>', methods=['GET'])
 @rano_bp.route('/<orc_id>/ns_lcm_op_occs/<nsLcmOpId>', methods=['GET'])
+@with_bulkhead
 def get_op(orc_id, nsLcmOpId):
     try:
         driver = manager.get_driver(request.blueprint, orc_id, database.msolo_db)
@@ -239,12 +319,17 @@ def get_op(orc_id, nsLcmOpId):
     except BadRequest as e:
         abort(400, description=e.description)
     except Unauthorized as e:
+        manager.invalidate_driver(request.blueprint, orc_id)
         abort(401, description=e.description)
     except (NfvoNotFound, NfvoCredentialsNotFound,
             NsNotFound, NsOpNotFound) as e:
         abort(404, description=e.description)
     except ServerError as e:
         abort(500, description=e.description)
+    except ServiceUnavailable as e:
+        abort(503, description=e.description, retry_after=e.retry_after)
+    except GatewayTimeout as e:
+        abort(504, description=e.description)
 
 
 @nfvo_bp.route('/<orc_id>/subscriptions', methods=['GET'])
@@ -257,12 +342,16 @@ def get_subscription_list(orc_id):
         abort(404, description=e.description)
     except ServerError as e:
         abort(500, description=e.description)
+    except GatewayTimeout as e:
+        abort(504, description=e.description)
 
 
 @nfvo_bp.route('/<orc_id>/subscriptions', methods=['POST'])
 def create_subscription(orc_id):
     try:
-        return make_response(jsonify(database.msolo_db.create_subscription(orc_id, request.json)), 201)
+        sub = database.msolo_db.create_subscription(orc_id, request.json)
+        subscription_index.add(sub)
+        return make_response(jsonify(sub), 201)
     except BadRequest as e:
         abort(400, description=e.description)
     except Unauthorized as e:
@@ -277,6 +366,8 @@ def create_subscription(orc_id):
         abort(422, description=e.description)
     except ServerError as e:
         abort(500, description=e.description)
+    except GatewayTimeout as e:
+        abort(504, description=e.description)
 
 
 @nfvo_bp.route('/<orc_id>/subscriptions/<subscriptionId>', methods=['GET'])
@@ -289,12 +380,15 @@ def get_subscription(orc_id, subscriptionId):
         abort(404, description=e.description)
     except ServerError as e:
         abort(500, description=e.description)
+    except GatewayTimeout as e:
+        abort(504, description=e.description)
 
 
 @nfvo_bp.route('/<orc_id>/subscriptions/<subscriptionId>', methods=['DELETE'])
 def delete_subscription(orc_id, subscriptionId):
     try:
         database.msolo_db.delete_subscription(subscriptionId)
+        subscription_index.remove(subscriptionId)
         return make_response('', 204)
     except Unauthorized as e:
         abort(401, description=e.description)
@@ -302,12 +396,39 @@ def delete_subscription(orc_id, subscriptionId):
         abort(404, description=e.description)
     except ServerError as e:
         abort(500, description=e.description)
+    except GatewayTimeout as e:
+        abort(504, description=e.description)
 
 
 @nfvo_bp.route('/<orc_id>/notifications', methods=['POST'])
 def post_notification(orc_id):
+    if request.json.get('notificationType') in osm.VNFPKG_NOTIFICATION_TYPES:
+        if 'vnfPkgId' not in request.json:
+            abort(400, 'vnfPkgId is missing')
+        osm.invalidate_vnfpkg(orc_id, request.json['vnfPkgId'])
+        return make_response('', 204)
     required = ('nsInstanceId', 'operation', 'operationState')
     if not all(k in request.json for k in required):
         abort(400, 'One of {0} is missing'.format(str(required)))
     tasks.forward_notification.delay(request.json)
+    # the NFVO is running operations, catch the next changes quickly
+    polling.wake(orc_id)
     return make_response('', 204)
+
+
+@stats_bp.route('/polling', methods=['GET'])
+def get_polling_stats():
+    try:
+        return make_response(jsonify(polling.stats()), 200)
+    except ServiceUnavailable as e:
+        abort(503, description=e.description)
+
+
+@stats_bp.route('/drivers', methods=['GET'])
+def get_driver_cache_stats():
+    return make_response(jsonify(manager.driver_cache_stats()), 200)
+
+
+@stats_bp.route('/vnfpkg-cache', methods=['GET'])
+def get_vnfpkg_cache_stats():
+    return make_response(jsonify(osm.vnfpkg_cache_stats()), 200)
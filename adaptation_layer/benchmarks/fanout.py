@@ -0,0 +1,115 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# Latency of a cold OSM NS list for several OSM_FANOUT_WORKERS values.
+#
+# A local stand-in OSM answers every GET after --delay seconds. Each NS has
+# one VNF built from its own package, so a cold list fetches one package
+# per NS. The workers bound the calls of one process, see the README.
+#
+#   python -m adaptation_layer.benchmarks.fanout -n 100 --delay 0.02
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
+
+from adaptation_layer import transport
+from adaptation_layer.driver import osm
+
+PKG = {'vdu': [{'id': 'vdu1', 'interface': [{'name': 'eth0', 'external-connection-point-ref': 'cp0'}]}]}
+
+
+def _ns(k):
+    return {'id': 'ns{}'.format(k), 'name': 'ns{}'.format(k), 'description': '', 'nsd-ref': 'nsd',
+            '_admin': {'nsState': 'INSTANTIATED'}, 'constituent-vnfr-ref': ['vnf{}'.format(k)]}
+
+
+def _vnf(k):
+    return {'id': 'vnf{}'.format(k), 'nsr-id-ref': 'ns{}'.format(k), 'vnfd-ref': 'vnfd',
+            'vnfd-id': 'pkg{}'.format(k), 'vim-account-id': 'vim',
+            'vdur': [{'vdu-id-ref': 'vdu1', 'interfaces': [
+                {'name': 'eth0', 'ip-address': '10.0.0.1', 'mac-address': 'fa:16:3e:00:00:01'}]}]}
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    delay = 0.0
+    ns_list = []
+    vnfs = []
+
+    def _send(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        url = urlsplit(self.path)
+        if url.path.endswith('/nslcm/v1/ns_instances'):
+            self._send(self.ns_list)
+        elif url.path.endswith('/nslcm/v1/vnf_instances'):
+            ns_ids = parse_qs(url.query)['nsr-id-ref'][0].split(',')
+            self._send([vnf for vnf in self.vnfs if vnf['nsr-id-ref'] in ns_ids])
+        else:
+            self._send(PKG)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='cold OSM NS list by OSM_FANOUT_WORKERS')
+    parser.add_argument('-n', type=int, default=100, help='NSs in the list')
+    parser.add_argument('--delay', type=float, default=0.02, help='seconds the stand-in OSM takes per GET')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 8, 32])
+    args = parser.parse_args()
+
+    _Handler.delay = args.delay
+    _Handler.ns_list = [_ns(k) for k in range(args.n)]
+    _Handler.vnfs = [_vnf(k) for k in range(args.n)]
+    server = _Server(('127.0.0.1', 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # plain HTTP towards PRISM_ALIAS, without login
+    osm.TESTING, osm.PRISM_ALIAS = 'true', '127.0.0.1'
+    print('{0} NSs, {1:.0f} ms per OSM call'.format(args.n, args.delay * 1000))
+    try:
+        for workers in args.workers:
+            osm.OSM_FANOUT_WORKERS = workers
+            osm.vnfpkg_cache.clear()
+            driver = osm.OSM({'nfvo_id': 'bench{}'.format(workers), 'host': '127.0.0.1',
+                              'port': server.server_port, 'user': 'admin', 'password': 'admin',
+                              'project': 'admin'})
+            start = time.perf_counter()
+            ns_list, headers = driver.get_ns_list()
+            assert len(ns_list) == args.n
+            print('{0:>3} workers  {1:6.3f} s'.format(workers, time.perf_counter() - start))
+    finally:
+        server.shutdown()
+        transport.close_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# Redis round trips and wall time of the operation state diff done by
+# tasks.osm_notifications: one GET/SETEX per operation vs. MGET + pipeline.
+#
+# Needs a Redis server, e.g. `docker run -p 6379:6379 -d redis`:
+#
+#   python -m adaptation_layer.benchmarks.redis_diff --host localhost -n 10000
+
+import argparse
+import time
+import uuid
+
+import redis
+from redis.connection import Connection
+
+from adaptation_layer import tasks
+
+
+class _CountingConnection(Connection):
+    round_trips = 0
+
+    def send_packed_command(self, command, check_health=True):
+        _CountingConnection.round_trips += 1
+        super().send_packed_command(command, check_health)
+
+
+def _ops(n):
+    return [{'id': 'bench-{}'.format(uuid.uuid4()), 'operationState': 'PROCESSING'} for i in range(n)]
+
+
+def _per_op(ops):
+    changed = []
+    for op in ops:
+        last_s = tasks.redis_client.get(op['id'])
+        if not last_s or last_s != op['operationState']:
+            tasks.redis_client.setex(op['id'], tasks.KEY_TTL, op['operationState'])
+            changed.append(op)
+    return changed
+
+
+def _measure(diff, ops, changes):
+    # the first poll stores every state, the second one finds `changes` of them changed
+    diff(ops)
+    for op in ops[:changes]:
+        op['operationState'] = 'COMPLETED'
+    _CountingConnection.round_trips = 0
+    start = time.perf_counter()
+    changed = diff(ops)
+    elapsed = time.perf_counter() - start
+    assert len(changed) == changes
+    return _CountingConnection.round_trips, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='per operation GET/SETEX vs. MGET + pipelined SETEX')
+    parser.add_argument('-n', type=int, default=10000, help='operations per poll')
+    parser.add_argument('--changed', type=float, default=0.1, help='share of operations changing state')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--db', type=int, default=15, help='scratch database, keys are deleted')
+    args = parser.parse_args()
+
+    tasks.redis_client = redis.Redis(connection_pool=redis.ConnectionPool(
+        connection_class=_CountingConnection, host=args.host, port=args.port, db=args.db,
+        decode_responses=True))
+    tasks.redis_client.ping()
+    changes = int(args.n * args.changed)
+    results = {}
+    for name, diff in (('per-op', _per_op), ('batched', tasks._changed_ops)):
+        ops = _ops(args.n)
+        try:
+            results[name] = _measure(diff, ops, changes)
+        finally:
+            tasks.redis_client.delete(*[op['id'] for op in ops])
+    print('{0} operations, {1} changed, redis at {2}:{3}'.format(args.n, changes, args.host, args.port))
+    for name, (round_trips, elapsed) in results.items():
+        print('{0:<8} {1:6d} round trips  {2:8.1f} ms'.format(name, round_trips, elapsed * 1000))
+    print('wall time drop: {0:.1f}%'.format(100 * (1 - results['batched'][1] / results['per-op'][1])))
+
+
+if __name__ == '__main__':
+    main()
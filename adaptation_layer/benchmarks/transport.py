@@ -0,0 +1,114 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# Per-request latency of bare requests calls vs. pooled transport sessions.
+#
+# A local stand-in server answers with a small JSON body. Use --certfile and
+# --keyfile to serve over TLS, which is what OSM exposes on port 9999:
+#
+#   openssl req -x509 -newkey rsa:2048 -nodes -subj /CN=localhost \
+#       -keyout key.pem -out cert.pem
+#   python -m adaptation_layer.benchmarks.transport --certfile cert.pem --keyfile key.pem
+
+import argparse
+import json
+import ssl
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import requests
+import urllib3
+from urllib3.exceptions import InsecureRequestWarning
+
+from adaptation_layer import transport
+
+urllib3.disable_warnings(InsecureRequestWarning)
+BODY = json.dumps({'id': 'bench', 'operationState': 'COMPLETED'}).encode()
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, avoid delayed ACK stalls
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve(certfile=None, keyfile=None):
+    server = _Server(('127.0.0.1', 0), _Handler)
+    scheme = 'http'
+    if certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = 'https'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, '{0}://127.0.0.1:{1}/osm/nslcm/v1/ns_instances'.format(scheme, server.server_port)
+
+
+def _measure(call, url, n):
+    samples = []
+    for i in range(n):
+        start = time.perf_counter()
+        call(url, verify=False).json()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(name, samples):
+    samples = sorted(samples)
+    print('{0:<10} mean {1:7.3f} ms  p50 {2:7.3f} ms  p95 {3:7.3f} ms'.format(
+        name, statistics.mean(samples), samples[len(samples) // 2],
+        samples[int(len(samples) * 0.95) - 1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='bare requests calls vs. pooled transport sessions')
+    parser.add_argument('-n', type=int, default=500, help='requests per run')
+    parser.add_argument('--certfile')
+    parser.add_argument('--keyfile')
+    args = parser.parse_args()
+
+    server, url = _serve(args.certfile, args.keyfile)
+    try:
+        bare = _measure(requests.get, url, args.n)
+        pooled = _measure(transport.get_session(url).get, url, args.n)
+    finally:
+        server.shutdown()
+        transport.close_all()
+    print('{0} requests to {1}'.format(args.n, url))
+    _report('bare', bare)
+    _report('pooled', pooled)
+    print('mean latency drop: {0:.1f}%'.format(
+        100 * (1 - statistics.mean(pooled) / statistics.mean(bare))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# module to limit the concurrent requests towards each orchestrator
+
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from redis import RedisError
+
+from adaptation_layer import deadline, transport
+from adaptation_layer.error_handler import ServiceUnavailable
+
+logger = logging.getLogger('app.bulkhead')
+
+# concurrent requests served for one orchestrator by all workers, 0 disables the limit
+BULKHEAD_LIMIT = int(os.getenv('BULKHEAD_LIMIT')) if os.getenv('BULKHEAD_LIMIT') else 3
+# per orchestrator limits overriding BULKHEAD_LIMIT, e.g. 'nfvo:1=2,rano:1=1'
+BULKHEAD_LIMITS = os.getenv('BULKHEAD_LIMITS', '')
+# seconds a request waits for a free slot before failing with 503
+BULKHEAD_WAIT = float(os.getenv('BULKHEAD_WAIT')) if os.getenv('BULKHEAD_WAIT') else 2
+# seconds between two attempts to take a slot
+POLL_INTERVAL = 0.05
+# seconds after which the slot of a crashed worker is reclaimed
+SLOT_TTL = int(deadline.REQUEST_DEADLINE) + 10
+# seconds the bulkheads stop contacting redis after an error
+REDIS_RETRY_INTERVAL = 5
+
+redis_client = transport.get_redis(5)
+_redis_down_until = 0.0
+
+# slots are members of a sorted set scored by the time they were taken
+_ACQUIRE = redis_client.register_script("""
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', tonumber(ARGV[1]) - tonumber(ARGV[2]))
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4])
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+""")
+
+
+def _parse_limits(limits: str) -> Dict[str, int]:
+    parsed = {}
+    for item in limits.split(','):
+        if item.strip():
+            name, limit = item.rsplit('=', 1)
+            parsed[name.strip()] = int(limit)
+    return parsed
+
+
+_limits = _parse_limits(BULKHEAD_LIMITS)
+
+
+def get_limit(orc_type: str, orc_id) -> int:
+    return _limits.get('{}:{}'.format(orc_type, orc_id), BULKHEAD_LIMIT)
+
+
+def _redis_failed(e: RedisError) -> None:
+    global _redis_down_until
+    logger.warning('bulkheads disabled for {}s, redis error: {}'.format(REDIS_RETRY_INTERVAL, str(e)))
+    _redis_down_until = time.monotonic() + REDIS_RETRY_INTERVAL
+
+
+def acquire(orc_type: str, orc_id, wait: float = BULKHEAD_WAIT) -> Optional[str]:
+    """Take a slot of the orchestrator, waiting at most wait seconds.
+
+    Return the slot to release, None when no slot is needed, e.g. the limit
+    is disabled or redis is not reachable.
+    """
+    limit = get_limit(orc_type, orc_id)
+    if limit <= 0 or time.monotonic() < _redis_down_until:
+        return None
+    key = 'bulkhead:{}:{}'.format(orc_type, orc_id)
+    slot = '{}|{}'.format(key, uuid.uuid4().hex)
+    give_up = time.monotonic() + wait
+    while True:
+        try:
+            if _ACQUIRE(keys=[key], args=[time.time(), SLOT_TTL, limit, slot]):
+                return slot
+        except RedisError as e:
+            _redis_failed(e)
+            return None
+        if time.monotonic() >= give_up:
+            raise ServiceUnavailable(
+                description='Too many concurrent requests for {} {}.'.format(orc_type, orc_id),
+                retry_after=1)
+        time.sleep(POLL_INTERVAL)
+
+
+def release(slot: Optional[str]) -> None:
+    if slot is None:
+        return
+    key = slot.split('|', 1)[0]
+    try:
+        redis_client.zrem(key, slot)
+    except RedisError as e:
+        logger.warning('cannot release slot {}: {}'.format(slot, str(e)))
+
+
+@contextmanager
+def slot(orc_type: str, orc_id):
+    """Hold a slot of the orchestrator for the duration of the block."""
+    taken = acquire(orc_type, orc_id)
+    try:
+        yield taken
+    finally:
+        release(taken)
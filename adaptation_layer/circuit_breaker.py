@@ -0,0 +1,198 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# module to stop calling orchestrators that keep failing
+
+import logging
+import math
+import os
+import threading
+import time
+from functools import wraps
+from typing import Callable, Dict, Tuple
+
+from redis import RedisError
+
+from adaptation_layer import transport
+from adaptation_layer.error_handler import GatewayTimeout, ServerError, ServiceUnavailable
+
+logger = logging.getLogger('app.circuit_breaker')
+
+# consecutive failures opening the circuit of an orchestrator, 0 disables the breakers
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES')) if os.getenv('BREAKER_FAILURES') else 5
+# seconds an open circuit rejects calls before letting a probe through
+BREAKER_RESET_TIMEOUT = int(os.getenv('BREAKER_RESET_TIMEOUT')) if os.getenv('BREAKER_RESET_TIMEOUT') else 30
+# TTL (seconds) for key in redis, forgets failures of orchestrators no longer called
+KEY_TTL = 3600
+# seconds the breakers stop contacting redis after an error
+REDIS_RETRY_INTERVAL = 5
+# errors telling that the orchestrator is unhealthy, others mean it answered
+FAILURES = (ServerError, GatewayTimeout)
+
+redis_client = transport.get_redis(4)
+_redis_down_until = 0.0
+_breakers: Dict[str, 'CircuitBreaker'] = {}
+_lock = threading.Lock()
+
+
+def _redis_available() -> bool:
+    return time.monotonic() >= _redis_down_until
+
+
+def _redis_failed(e: RedisError) -> None:
+    global _redis_down_until
+    logger.warning('circuit breakers disabled for {}s, redis error: {}'.format(REDIS_RETRY_INTERVAL, str(e)))
+    _redis_down_until = time.monotonic() + REDIS_RETRY_INTERVAL
+
+
+class CircuitBreaker(object):
+    """Circuit breaker whose state is shared among workers through redis.
+
+    While closed, calls go through and consecutive failures are counted.
+    After `failures` of them the circuit opens and calls are rejected with
+    ServiceUnavailable for `reset_timeout` seconds. Then it is half-open: a
+    single probe call goes through and closes or reopens the circuit.
+    Calls are let through when redis is not reachable.
+    """
+
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, reset_timeout: int = BREAKER_RESET_TIMEOUT,
+                 subject: str = None):
+        self.name = name
+        # the service behind the circuit, as named in the errors
+        self.subject = subject or 'Orchestrator {}'.format(name)
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self._failures_key = 'breaker:{}:failures'.format(name)
+        self._open_key = 'breaker:{}:open'.format(name)
+        self._probe_key = 'breaker:{}:probe'.format(name)
+        # local copy of the open state, rejects calls without a redis round trip
+        self._open_until = 0.0
+
+    def _reject(self, retry_after: float):
+        raise ServiceUnavailable(
+            description='{} is unavailable, circuit open.'.format(self.subject),
+            retry_after=max(1, math.ceil(retry_after)))
+
+    def _before_call(self) -> Tuple[bool, bool]:
+        """Return (probe, failing), raise ServiceUnavailable while open."""
+        now = time.monotonic()
+        if now < self._open_until:
+            self._reject(self._open_until - now)
+        if not _redis_available():
+            return False, False
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.pttl(self._open_key)
+            pipe.get(self._failures_key)
+            open_ttl, failures = pipe.execute()
+            if open_ttl > 0:
+                self._open_until = now + open_ttl / 1000
+                self._reject(open_ttl / 1000)
+            if failures is None:
+                return False, False
+            if int(failures) < self.failures:
+                return False, True
+            # half-open, a single worker probes the orchestrator
+            if not redis_client.set(self._probe_key, 1, nx=True, ex=self.reset_timeout):
+                self._reject(1)
+            logger.info('circuit {} half-open, probing'.format(self.name))
+            return True, True
+        except RedisError as e:
+            _redis_failed(e)
+            return False, False
+
+    def _on_success(self, probe: bool, failing: bool) -> None:
+        if not failing or not _redis_available():
+            return
+        try:
+            redis_client.delete(self._failures_key, self._probe_key)
+        except RedisError as e:
+            _redis_failed(e)
+            return
+        if probe:
+            logger.info('circuit {} closed'.format(self.name))
+
+    def _on_failure(self, probe: bool) -> None:
+        if not _redis_available():
+            return
+        try:
+            pipe = redis_client.pipeline()
+            pipe.incr(self._failures_key)
+            pipe.expire(self._failures_key, KEY_TTL)
+            failures, _ = pipe.execute()
+            if probe or failures >= self.failures:
+                pipe.set(self._open_key, 1, ex=self.reset_timeout)
+                pipe.delete(self._probe_key)
+                pipe.execute()
+                self._open_until = time.monotonic() + self.reset_timeout
+                logger.warning('circuit {} open after {} failures'.format(self.name, failures))
+        except RedisError as e:
+            _redis_failed(e)
+
+    def call(self, func: Callable, *args, **kwargs):
+        probe, failing = self._before_call()
+        try:
+            result = func(*args, **kwargs)
+        except FAILURES:
+            self._on_failure(probe)
+            raise
+        except Exception:
+            # the orchestrator answered, e.g. with a 404
+            self._on_success(probe, failing)
+            raise
+        self._on_success(probe, failing)
+        return result
+
+
+class GuardedDriver(object):
+    """Proxy running the public methods of a driver through a circuit breaker."""
+
+    def __init__(self, driver, breaker: CircuitBreaker):
+        self._driver = driver
+        self._breaker = breaker
+
+    def __getattr__(self, name):
+        attr = getattr(self._driver, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        @wraps(attr)
+        def guarded(*args, **kwargs):
+            return self._breaker.call(attr, *args, **kwargs)
+
+        return guarded
+
+
+def get_breaker(orc_type: str, orc_id) -> CircuitBreaker:
+    name = '{}:{}'.format(orc_type, orc_id)
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _lock:
+            subject = 'Callback {}'.format(orc_id) if orc_type == 'callback' else None
+            breaker = _breakers.setdefault(name, CircuitBreaker(name, subject=subject))
+    return breaker
+
+
+def call_guarded(orc_type: str, orc_id, func: Callable, *args, **kwargs):
+    """Call func through the circuit breaker of orc_id, directly when the breakers are disabled."""
+    if BREAKER_FAILURES <= 0:
+        return func(*args, **kwargs)
+    return get_breaker(orc_type, orc_id).call(func, *args, **kwargs)
+
+
+def guard(driver, orc_type: str, orc_id):
+    """Return driver guarded by the circuit breaker of its orchestrator."""
+    if BREAKER_FAILURES <= 0:
+        return driver
+    return GuardedDriver(driver, get_breaker(orc_type, orc_id))
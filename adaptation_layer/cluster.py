@@ -0,0 +1,190 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# module to coordinate the celery workers: beat leader election and
+# consistent-hash sharding of the orchestrators among the live workers
+
+import bisect
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from celery.beat import PersistentScheduler
+from celery.utils import worker_direct
+from kombu import Queue
+from redis import RedisError
+
+from adaptation_layer import transport
+
+logger = logging.getLogger('app.cluster')
+
+# seconds between two heartbeats of a worker
+CLUSTER_HEARTBEAT = float(os.getenv('CLUSTER_HEARTBEAT')) if os.getenv('CLUSTER_HEARTBEAT') else 5
+# seconds after which a worker missing heartbeats leaves the ring
+MEMBER_TTL = 3 * CLUSTER_HEARTBEAT
+# seconds a beat keeps the leadership without renewing it
+LEADER_TTL = float(os.getenv('LEADER_TTL')) if os.getenv('LEADER_TTL') else 30
+# points of each worker on the hash ring, evens out the shards
+VNODES = 64
+# seconds in which the startup tasks are sent once, whatever the number of app workers
+STARTUP_WINDOW = 60
+MEMBERS_KEY = 'cluster:members'
+
+redis_client = transport.get_redis(8)
+# take the lease if free, renew it if held by the caller
+_ACQUIRE_LEASE = redis_client.register_script("""
+local holder = redis.call('GET', KEYS[1])
+if not holder then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+if holder == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+""")
+
+_identity = None
+_identity_pid = None
+_heartbeat_stop = threading.Event()
+
+
+def identity() -> str:
+    """Return the identity of this process, a new one after a fork."""
+    global _identity, _identity_pid
+    if _identity_pid != os.getpid():
+        _identity = '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        _identity_pid = os.getpid()
+    return _identity
+
+
+def is_leader(name: str, ttl: float = LEADER_TTL) -> bool:
+    """Take or renew the lease name, True if this process holds it.
+
+    Without redis every process behaves as the leader.
+    """
+    try:
+        return bool(_ACQUIRE_LEASE(keys=['cluster:leader:{}'.format(name)], args=[identity(), int(ttl * 1000)]))
+    except RedisError as e:
+        logger.warning('cannot check leadership of {}: {}'.format(name, str(e)))
+        return True
+
+
+def run_once(name: str, ttl: float) -> bool:
+    """Return True to the first caller of name in a window of ttl seconds."""
+    try:
+        return bool(redis_client.set('cluster:once:{}'.format(name), identity(), nx=True, px=int(ttl * 1000)))
+    except RedisError as e:
+        logger.warning('cannot deduplicate {}: {}'.format(name, str(e)))
+        return True
+
+
+def heartbeat(node: str) -> None:
+    try:
+        now = time.time()
+        pipe = redis_client.pipeline()
+        pipe.zadd(MEMBERS_KEY, {node: now})
+        pipe.zremrangebyscore(MEMBERS_KEY, '-inf', now - MEMBER_TTL)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning('heartbeat of {} failed: {}'.format(node, str(e)))
+
+
+def start_heartbeat(node: str) -> None:
+    """Keep node in the ring until stop_heartbeat is called or the process dies."""
+    def beat():
+        while not _heartbeat_stop.wait(CLUSTER_HEARTBEAT):
+            heartbeat(node)
+
+    _heartbeat_stop.clear()
+    heartbeat(node)
+    threading.Thread(target=beat, name='cluster-heartbeat', daemon=True).start()
+
+
+def stop_heartbeat(node: str) -> None:
+    _heartbeat_stop.set()
+    try:
+        redis_client.zrem(MEMBERS_KEY, node)
+    except RedisError as e:
+        logger.warning('cannot remove {} from the ring: {}'.format(node, str(e)))
+
+
+def members() -> List[str]:
+    """Return the live workers, sorted."""
+    return sorted(redis_client.zrangebyscore(MEMBERS_KEY, time.time() - MEMBER_TTL, '+inf'))
+
+
+def _hash(key: str) -> int:
+    return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    """Consistent-hash ring, a worker joining or leaving moves only its own keys."""
+
+    def __init__(self, nodes: List[str], vnodes: int = VNODES):
+        points = sorted((_hash('{}#{}'.format(node, i)), node) for node in nodes for i in range(vnodes))
+        self._hashes = [h for h, node in points]
+        self._nodes = [node for h, node in points]
+
+    def owner(self, key) -> str:
+        i = bisect.bisect(self._hashes, _hash(str(key))) % len(self._hashes)
+        return self._nodes[i]
+
+
+def shard(items: List, key: Callable) -> Optional[Dict[str, List]]:
+    """Split items among the live workers by key, None if the workers are unknown."""
+    try:
+        nodes = members()
+    except RedisError as e:
+        logger.warning('cannot read the workers: {}'.format(str(e)))
+        return None
+    if not nodes:
+        return None
+    ring = HashRing(nodes)
+    shards = {}
+    for item in items:
+        shards.setdefault(ring.owner(key(item)), []).append(item)
+    return shards
+
+
+def direct_queue(node: str) -> Queue:
+    """Return the queue consumed only by node, see the worker_direct setting."""
+    return worker_direct(node)
+
+
+class LeaderScheduler(PersistentScheduler):
+    """Beat scheduler sending due tasks only from the leader among the beats.
+
+    Every worker may run with -B, the other beats advance their schedule
+    without sending and take over when the lease of the leader expires.
+    """
+
+    _leader = False
+
+    def apply_entry(self, entry, producer=None):
+        if self._leader:
+            super().apply_entry(entry, producer=producer)
+        else:
+            logger.debug('not the beat leader, skip {}'.format(entry.name))
+
+    def tick(self, *args, **kwargs):
+        self._leader = is_leader('beat')
+        # wake up often enough to renew the lease
+        return min(super().tick(*args, **kwargs), LEADER_TTL / 3)
@@ -14,7 +14,7 @@
 
 import os
 from flask_migrate import Migrate
-from adaptation_layer.repository import sqlite, iwf_repository
+from adaptation_layer.repository import sqlite, iwf_inventory
 from flask import current_app, _app_ctx_stack
 
 
@@ -29,7 +29,7 @@ class MsoloDB(object):
         IWFREPO = os.getenv('IWFREPO', 'false').lower()
         if IWFREPO == 'true':
             self.app.logger.info('using iwf repository')
-            self.msolo_db = iwf_repository
+            self.msolo_db = iwf_inventory
         else:
             self.app.logger.info('using sqlite')
             sqlite.db.init_app(self.app)
@@ -0,0 +1,104 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# module to bound the time spent on backend calls
+
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+from requests import Timeout
+
+from adaptation_layer import request_cache
+
+# budget (seconds) of an API request, keep it below nginx uwsgi_read_timeout
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE')) if os.getenv('REQUEST_DEADLINE') else 60
+# connect timeout (seconds) of a backend hop
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT')) if os.getenv('HTTP_CONNECT_TIMEOUT') else 5
+# read timeout (seconds) of a backend hop issued without deadline, e.g. by celery tasks
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT')) if os.getenv('HTTP_READ_TIMEOUT') else 30
+
+_local = threading.local()
+
+
+class DeadlineExceeded(Timeout):
+    """Raised instead of sending a backend request once the deadline is over."""
+
+
+class Deadline(object):
+
+    def __init__(self, budget: float = REQUEST_DEADLINE):
+        self.budget = budget
+        self.expires = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+def current() -> Optional[Deadline]:
+    return getattr(_local, 'deadline', None)
+
+
+def set_deadline(deadline: Optional[Deadline]) -> None:
+    _local.deadline = deadline
+
+
+@contextmanager
+def bound(deadline: Optional[Deadline]):
+    """Install deadline in the running thread, e.g. a worker of a thread pool."""
+    previous = current()
+    set_deadline(deadline)
+    try:
+        yield deadline
+    finally:
+        set_deadline(previous)
+
+
+def submit_bound(pool: Executor, fn: Callable, *args) -> Future:
+    """Submit fn(*args) to pool, run with the deadline and the request cache of the caller.
+
+    Pool threads do not inherit thread-locals: without them the calls made by
+    fn would ignore the deadline of the request and bypass its cache.
+    """
+    deadline, cache = current(), request_cache.current()
+
+    def call():
+        with bound(deadline), request_cache.bound(cache):
+            return fn(*args)
+
+    return pool.submit(call)
+
+
+def map_bound(pool: Executor, fn: Callable, items: Iterable) -> Iterator:
+    """Like pool.map, each call runs with the deadline and the request cache of the caller."""
+    futures = [submit_bound(pool, fn, item) for item in items]
+    return (f.result() for f in futures)
+
+
+def timeout() -> Tuple[float, float]:
+    """Return the (connect, read) timeout of the next backend hop."""
+    deadline = current()
+    if deadline is None:
+        return HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded('request deadline of {}s exceeded'.format(deadline.budget))
+    return min(HTTP_CONNECT_TIMEOUT, remaining), remaining
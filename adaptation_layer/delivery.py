@@ -0,0 +1,138 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# module to deliver notifications to the callbacks of subscribers
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from urllib.parse import urlsplit
+
+from redis import RedisError
+from requests import RequestException, Timeout
+
+from adaptation_layer import circuit_breaker, deadline, transport
+from adaptation_layer.error_handler import BadRequest, GatewayTimeout, ServerError, ServiceUnavailable
+
+logger = logging.getLogger('app.delivery')
+
+# callbacks notified concurrently
+DELIVERY_WORKERS = int(os.getenv('DELIVERY_WORKERS')) if os.getenv('DELIVERY_WORKERS') else 16
+# read timeout (seconds) of a callback
+DELIVERY_TIMEOUT = float(os.getenv('DELIVERY_TIMEOUT')) if os.getenv('DELIVERY_TIMEOUT') else 5
+# attempts to deliver a notification before dropping it
+DELIVERY_MAX_ATTEMPTS = int(os.getenv('DELIVERY_MAX_ATTEMPTS')) if os.getenv('DELIVERY_MAX_ATTEMPTS') else 6
+# seconds before the first retry, doubled at each attempt
+DELIVERY_BACKOFF = float(os.getenv('DELIVERY_BACKOFF')) if os.getenv('DELIVERY_BACKOFF') else 2
+DELIVERY_MAX_BACKOFF = 300
+# seconds between two runs of the retry task
+RETRY_INTERVAL = 5.0
+# retries sent by a run of the retry task
+RETRY_BATCH = 100
+RETRY_KEY = 'delivery_retries'
+
+redis_client = transport.get_redis(6)
+# retries are members of a sorted set scored by the time they are due
+_POP_DUE = redis_client.register_script("""
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, member in ipairs(due) do
+    redis.call('ZREM', KEYS[1], member)
+end
+return due
+""")
+# created on first use, celery workers are forked after import
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=DELIVERY_WORKERS, thread_name_prefix='delivery')
+        return _pool
+
+
+def _post(callback_uri: str, notification: Dict) -> None:
+    try:
+        resp = transport.get_session(callback_uri).post(
+            callback_uri, json=notification, timeout=(deadline.HTTP_CONNECT_TIMEOUT, DELIVERY_TIMEOUT))
+    except Timeout as e:
+        raise GatewayTimeout(str(e))
+    except RequestException as e:
+        raise ServerError(str(e))
+    if resp.status_code >= 500 or resp.status_code == 429:
+        raise ServerError('{} {}'.format(resp.status_code, resp.text))
+    if resp.status_code >= 400:
+        raise BadRequest('{} {}'.format(resp.status_code, resp.text))
+
+
+def _schedule_retry(delivery: Dict, retry_after: float = None) -> None:
+    attempt = delivery['attempt'] + 1
+    if attempt >= DELIVERY_MAX_ATTEMPTS:
+        logger.error('drop notification to {} after {} attempts'.format(delivery['callbackUri'], attempt))
+        return
+    delay = min(DELIVERY_BACKOFF * 2 ** (attempt - 1), DELIVERY_MAX_BACKOFF)
+    if retry_after:
+        delay = max(delay, retry_after)
+    # the id keeps apart equal deliveries in the sorted set
+    member = json.dumps(dict(delivery, attempt=attempt, id=uuid.uuid4().hex))
+    try:
+        redis_client.zadd(RETRY_KEY, {member: time.time() + delay})
+        logger.info('retry notification to {} in {}s'.format(delivery['callbackUri'], delay))
+    except RedisError as e:
+        logger.error('cannot schedule retry of notification to {}: {}'.format(delivery['callbackUri'], str(e)))
+
+
+def _deliver(delivery: Dict) -> bool:
+    callback_uri = delivery['callbackUri']
+    try:
+        circuit_breaker.call_guarded('callback', urlsplit(callback_uri).netloc,
+                                     _post, callback_uri, delivery['notification'])
+    except BadRequest as e:
+        logger.error('Notification rejected by {0}: {1}'.format(callback_uri, str(e)))
+        return False
+    except (ServerError, GatewayTimeout, ServiceUnavailable) as e:
+        logger.warning('Cannot send notification to {0}: {1}'.format(callback_uri, str(e)))
+        _schedule_retry(delivery, getattr(e, 'retry_after', None))
+        return False
+    logger.info('Notification sent to {0}'.format(callback_uri))
+    return True
+
+
+def _dispatch(deliveries: List[Dict]) -> List[bool]:
+    if len(deliveries) <= 1:
+        return [_deliver(d) for d in deliveries]
+    return list(_get_pool().map(_deliver, deliveries))
+
+
+def deliver(callback_uris: List[str], notification: Dict) -> List[bool]:
+    """Send notification to the callbacks concurrently, failed ones are retried later."""
+    return _dispatch([{'callbackUri': uri, 'notification': notification, 'attempt': 0} for uri in callback_uris])
+
+
+def retry_due() -> int:
+    """Send the retries that are due, return their number."""
+    try:
+        due = _POP_DUE(keys=[RETRY_KEY], args=[time.time(), RETRY_BATCH])
+    except RedisError as e:
+        logger.error('cannot read notification retries: {}'.format(str(e)))
+        return 0
+    _dispatch([json.loads(member) for member in due])
+    return len(due)
@@ -18,12 +18,13 @@ import re
 from typing import Dict, Tuple
 from urllib.parse import urlencode
 
-import requests
 import urllib3
+from requests import Timeout
 from urllib3.exceptions import InsecureRequestWarning
 
+from adaptation_layer import transport
 from adaptation_layer.error_handler import ResourceNotFound, NsNotFound, \
-    BadRequest, ServerError, NsOpNotFound, NsdNotFound
+    BadRequest, ServerError, NsOpNotFound, NsdNotFound, GatewayTimeout
 from .interface import Driver, Headers, BodyList, Body
 
 urllib3.disable_warnings(InsecureRequestWarning)
@@ -45,12 +46,15 @@ class EVER(Driver):
             self._base_path = 'http://{0}:{1}'.format(self._host, self._port)
         else:
             self._base_path = 'http://{0}:{1}'.format(PRISM_ALIAS, 9999)
+        self._session = transport.get_session(self._base_path)
 
     def _exec_delete(self, url=None, params=None, headers=None):
         logger.debug('#############execute delete######')
         logger.debug('url= ' + url)
         try:
-            resp = requests.delete(url, params=params, verify=False, headers=headers)
+            resp = self._session.delete(url, params=params, verify=False, headers=headers)
+        except Timeout as e:
+            raise GatewayTimeout(str(e))
         except Exception as e:
             raise ServerError(str(e))
 
@@ -76,7 +80,9 @@ class EVER(Driver):
         logger.debug('#############execute post######')
         logger.debug('url= ' + url)
         try:
-            resp = requests.post(url, data=data, json=json, verify=False, headers=headers)
+            resp = self._session.post(url, data=data, json=json, verify=False, headers=headers)
+        except Timeout as e:
+            raise GatewayTimeout(str(e))
         except Exception as e:
             raise ServerError(str(e))
 
@@ -110,7 +116,9 @@ class EVER(Driver):
         logger.debug('#############execute get######')
         logger.debug('url= ' + url)
         try:
-            resp = requests.get(url, params=params, verify=False, headers=headers)
+            resp = self._session.get(url, params=params, verify=False, headers=headers)
+        except Timeout as e:
+            raise GatewayTimeout(str(e))
         except Exception as e:
             raise ServerError(str(e))
 
@@ -20,12 +20,14 @@ import unittest
 import uuid
 from typing import Dict, Tuple, List
 
-import requests
 import json
 import re
 
+from requests import Timeout
+
 from adaptation_layer.error_handler import ResourceNotFound, NsNotFound, \
-  BadRequest, ServerError, NsOpNotFound, NsdNotFound
+  BadRequest, ServerError, NsOpNotFound, NsdNotFound, GatewayTimeout
+from adaptation_layer import transport
 from .interface import Driver, Headers, BodyList, Body
 
 from urllib.parse import urlencode
@@ -55,11 +57,14 @@ class FIVEGR_SO(Driver):
       self._base_path = 'http://{0}:{1}/5gt/so/v1'.format(self._host, self._port)
     else:
       self._base_path = 'http://{0}:{1}'.format(PRISM_ALIAS, 9999)
+    self._session = transport.get_session(self._base_path)
 
   def _exec_delete(self, url=None, params=None, headers=None):
 
     try:
-      resp = requests.delete(url, params=params, verify=False, headers=headers)
+      resp = self._session.delete(url, params=params, verify=False, headers=headers)
+    except Timeout as e:
+      raise GatewayTimeout(str(e))
     except Exception as e:
       raise ServerError(str(e))
 
@@ -81,7 +86,9 @@ class FIVEGR_SO(Driver):
   def _exec_post(self, url=None, data=None, json=None, headers=None):
 
     try:
-      resp = requests.post(url, data=data, json=json, verify=False, headers=headers)
+      resp = self._session.post(url, data=data, json=json, verify=False, headers=headers)
+    except Timeout as e:
+      raise GatewayTimeout(str(e))
     except Exception as e:
       raise ServerError(str(e))
 
@@ -106,7 +113,9 @@ class FIVEGR_SO(Driver):
   def _exec_get(self, url=None, params=None, headers=None):
 
     try:
-      resp = requests.get(url, params=params, verify=False, headers=headers)
+      resp = self._session.get(url, params=params, verify=False, headers=headers)
+    except Timeout as e:
+      raise GatewayTimeout(str(e))
     except Exception as e:
       raise ServerError(str(e))
 
@@ -128,7 +137,9 @@ class FIVEGR_SO(Driver):
   def _exec_put(self, url=None, data=None, json=None, params=None, headers=None):
 
     try:
-      resp = requests.put(url, params=params, verify=False, headers=headers, json=json)
+      resp = self._session.put(url, params=params, verify=False, headers=headers, json=json)
+    except Timeout as e:
+      raise GatewayTimeout(str(e))
     except Exception as e:
       raise ServerError(str(e))
 
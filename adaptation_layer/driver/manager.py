@@ -12,14 +12,52 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import os
+from typing import Dict
+
+from adaptation_layer import circuit_breaker
+from adaptation_layer.cache import TTLCache
 from .interface import Driver
 from .onap import ONAP
 from .osm import OSM
 from .ever import EVER
 from .fivegr_so import FIVEGR_SO
 
+DRIVER_CACHE_SIZE = int(os.getenv('DRIVER_CACHE_SIZE')) if os.getenv('DRIVER_CACHE_SIZE') else 64
+# TTL (seconds) of a constructed driver, bounds the use of stale credentials
+DRIVER_CACHE_TTL = int(os.getenv('DRIVER_CACHE_TTL')) if os.getenv('DRIVER_CACHE_TTL') else 300
+
+_drivers = TTLCache(maxsize=DRIVER_CACHE_SIZE, ttl=DRIVER_CACHE_TTL)
+
 
 def get_driver(orc_type: str, orc_id: int, db) -> Driver:
+    key = (orc_type, str(orc_id))
+    # repositories replicated by each worker tell when the credentials change
+    version = db.driver_version(orc_type, orc_id) if hasattr(db, 'driver_version') else None
+    cached = _drivers.get(key)
+    if cached is None or (version is not None and cached[0] != version):
+        driver = circuit_breaker.guard(_build_driver(orc_type, orc_id, db), orc_type, orc_id)
+        cached = (version, driver)
+        _drivers.set(key, cached)
+    return cached[1]
+
+
+def invalidate_driver(orc_type: str = None, orc_id: int = None) -> None:
+    """Drop cached drivers, e.g. when orchestrator credentials change.
+
+    Without arguments every cached driver is dropped.
+    """
+    if orc_type is None:
+        _drivers.clear()
+    else:
+        _drivers.pop((orc_type, str(orc_id)))
+
+
+def driver_cache_stats() -> Dict:
+    return _drivers.stats()
+
+
+def _build_driver(orc_type: str, orc_id: int, db) -> Driver:
     if orc_type == 'nfvo':
         nfvo = db.get_nfvo_by_id(orc_id)
         nfvo_type = nfvo['type'].casefold()
@@ -17,12 +17,13 @@ import re
 from typing import Dict, Tuple
 from urllib.parse import urlencode
 
-import requests
 import urllib3
+from requests import Timeout
 from urllib3.exceptions import InsecureRequestWarning
 
+from adaptation_layer import transport
 from adaptation_layer.error_handler import ResourceNotFound, NsNotFound, \
-    BadRequest, ServerError, NsOpNotFound, NsdNotFound
+    BadRequest, ServerError, NsOpNotFound, NsdNotFound, GatewayTimeout
 from .interface import Driver, Headers, BodyList, Body
 
 urllib3.disable_warnings(InsecureRequestWarning)
@@ -43,11 +44,14 @@ class ONAP(Driver):
             self._base_path = 'http://{0}:{1}'.format(self._host, self._port)
         else:
             self._base_path = 'http://{0}:{1}'.format(PRISM_ALIAS, 9999)
+        self._session = transport.get_session(self._base_path)
 
     def _exec_delete(self, url=None, params=None, headers=None):
 
         try:
-            resp = requests.delete(url, params=params, verify=False, headers=headers)
+            resp = self._session.delete(url, params=params, verify=False, headers=headers)
+        except Timeout as e:
+            raise GatewayTimeout(str(e))
         except Exception as e:
             raise ServerError(str(e))
 
@@ -69,7 +73,9 @@ class ONAP(Driver):
     def _exec_post(self, url=None, data=None, json=None, headers=None):
 
         try:
-            resp = requests.post(url, data=data, json=json, verify=False, headers=headers)
+            resp = self._session.post(url, data=data, json=json, verify=False, headers=headers)
+        except Timeout as e:
+            raise GatewayTimeout(str(e))
         except Exception as e:
             raise ServerError(str(e))
 
@@ -94,7 +100,9 @@ class ONAP(Driver):
     def _exec_get(self, url=None, params=None, headers=None):
 
         try:
-            resp = requests.get(url, params=params, verify=False, headers=headers)
+            resp = self._session.get(url, params=params, verify=False, headers=headers)
+        except Timeout as e:
+            raise GatewayTimeout(str(e))
         except Exception as e:
             raise ServerError(str(e))
 
@@ -17,21 +17,27 @@ import json
 import logging
 import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from functools import wraps
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Tuple
 from urllib.parse import urlencode
 
 import urllib3
 import yaml as YAML
-from requests import ConnectionError, HTTPError, Timeout, TooManyRedirects, URLRequired, api, delete, get, post
+from requests import ConnectionError, HTTPError, Timeout, TooManyRedirects, URLRequired, api
 from urllib3.exceptions import InsecureRequestWarning
 
-import redis
-from adaptation_layer.error_handler import (BadRequest, Conflict, Forbidden, MethodNotAllowed, NsdNotFound, NsNotFound,
-                                            NsOpNotFound, ResourceNotFound, ServerError, Unauthorized, Unprocessable,
-                                            VimNetworkNotFound, VimNotFound, VnfNotFound, VnfPkgNotFound)
-from adaptation_layer.repository import iwf_repository
+from adaptation_layer import deadline, transport
+from adaptation_layer.cache import TTLCache
+from adaptation_layer.error_handler import (BadRequest, Conflict, Forbidden, GatewayTimeout, MethodNotAllowed,
+                                            NsdNotFound, NsNotFound, NsOpNotFound, ResourceNotFound, ServerError,
+                                            Unauthorized, Unprocessable, VimNetworkNotFound, VimNotFound, VnfNotFound,
+                                            VnfPkgNotFound)
+from adaptation_layer.repository import iwf_inventory
+from redis import RedisError
 
 from .interface import Body, BodyList, Driver, Headers
 
@@ -40,42 +46,207 @@ TESTING = os.getenv('TESTING', 'false').lower()
 PRISM_ALIAS = os.getenv("PRISM_ALIAS", "prism-osm")
 
 IWFREPO = os.getenv('IWFREPO', 'false').lower()
-redis_host = os.getenv('REDIS_HOST') if os.getenv('REDIS_HOST') else 'redis'
-redis_port = int(os.getenv('REDIS_PORT')) if os.getenv('REDIS_PORT') else 6379
 # TTL (seconds) for key in redis
 KEY_TTL = 3599
-redis_client = redis.Redis(
-    host=redis_host, port=redis_port, db=2, decode_responses=True)
+# seconds before expiry when an OSM token gets refreshed
+TOKEN_REFRESH_MARGIN = int(os.getenv('TOKEN_REFRESH_MARGIN')) if os.getenv('TOKEN_REFRESH_MARGIN') else 60
+# seconds a worker waits for another one logging in to the same NFVO
+TOKEN_LOCK_TIMEOUT = int(os.getenv('TOKEN_LOCK_TIMEOUT')) if os.getenv('TOKEN_LOCK_TIMEOUT') else 10
+redis_client = transport.get_redis(2)
+
+VNFPKG_CACHE_SIZE = int(os.getenv('VNFPKG_CACHE_SIZE')) if os.getenv('VNFPKG_CACHE_SIZE') else 256
+# TTL (seconds) of a cached VNF package, VNFDs do not change once onboarded
+VNFPKG_CACHE_TTL = int(os.getenv('VNFPKG_CACHE_TTL')) if os.getenv('VNFPKG_CACHE_TTL') else 3600
+# share cached VNF packages among workers through redis
+VNFPKG_CACHE_REDIS = os.getenv('VNFPKG_CACHE_REDIS', 'false').lower()
+# TTL (seconds) of the process-local copy, a notification invalidates the package
+# only in the worker receiving it, so this bounds how long the others keep it
+VNFPKG_CACHE_LOCAL_TTL = int(os.getenv('VNFPKG_CACHE_LOCAL_TTL')) if os.getenv('VNFPKG_CACHE_LOCAL_TTL') else 60
+VNFPKG_NOTIFICATION_TYPES = ('VnfPackageOnboardingNotification',
+                             'VnfPackageChangeNotification')
+vnfpkg_cache = TTLCache(maxsize=VNFPKG_CACHE_SIZE, ttl=min(VNFPKG_CACHE_TTL, VNFPKG_CACHE_LOCAL_TTL))
+vnfpkg_redis_client = transport.get_redis(3)
+_vnfpkg_redis_stats = {'hits': 0, 'misses': 0}
+_vnfpkg_stats_lock = threading.Lock()
+
+# max concurrent calls towards one OSM from this process while enriching NS records,
+# each uWSGI process has its own pools, 1 disables the fan-out
+OSM_FANOUT_WORKERS = int(os.getenv('OSM_FANOUT_WORKERS')) if os.getenv('OSM_FANOUT_WORKERS') else 8
+_fanout_pools: Dict[str, ThreadPoolExecutor] = {}
+_fanout_lock = threading.Lock()
+# NS ids per nsr-id-ref query, 50 ids keep the query string below 2 KB
+NS_IDS_PER_QUERY = int(os.getenv('NS_IDS_PER_QUERY')) if os.getenv('NS_IDS_PER_QUERY') else 50
 
 logger = logging.getLogger('app.driver.osm')
 
 
+def _vnfpkg_key(nfvo_id, vnfpkg_id) -> str:
+    return 'vnfpkg_{0}_{1}'.format(nfvo_id, vnfpkg_id)
+
+
+def _redis_get_vnfpkg(key: str):
+    try:
+        s_vnfpkg = vnfpkg_redis_client.get(key)
+    except RedisError as e:
+        logger.warning('cannot read vnf package cache: {}'.format(e))
+        return None
+    with _vnfpkg_stats_lock:
+        _vnfpkg_redis_stats['hits' if s_vnfpkg else 'misses'] += 1
+    return json.loads(s_vnfpkg) if s_vnfpkg else None
+
+
+def _redis_set_vnfpkg(key: str, vnfpkg: Dict) -> None:
+    try:
+        vnfpkg_redis_client.setex(key, VNFPKG_CACHE_TTL, json.dumps(vnfpkg))
+    except RedisError as e:
+        logger.warning('cannot write vnf package cache: {}'.format(e))
+
+
+def invalidate_vnfpkg(nfvo_id, vnfpkg_id) -> None:
+    key = _vnfpkg_key(nfvo_id, vnfpkg_id)
+    vnfpkg_cache.pop(key)
+    if VNFPKG_CACHE_REDIS == 'true':
+        try:
+            vnfpkg_redis_client.delete(key)
+        except RedisError as e:
+            logger.warning('cannot invalidate vnf package cache: {}'.format(e))
+    logger.info('vnf package {0} of nfvo {1} invalidated'.format(vnfpkg_id, nfvo_id))
+
+
+def _fanout_pool(nfvo_id) -> ThreadPoolExecutor:
+    """Return the pool of nfvo_id, shared by the requests of this process so the cap holds per NFVO."""
+    key = str(nfvo_id)
+    pool = _fanout_pools.get(key)
+    if pool is None:
+        with _fanout_lock:
+            pool = _fanout_pools.get(key)
+            if pool is None:
+                pool = ThreadPoolExecutor(max_workers=OSM_FANOUT_WORKERS)
+                _fanout_pools[key] = pool
+    return pool
+
+
+def vnfpkg_cache_stats() -> Dict:
+    stats = vnfpkg_cache.stats()
+    with _vnfpkg_stats_lock:
+        stats['redisHits'] = _vnfpkg_redis_stats['hits']
+        stats['redisMisses'] = _vnfpkg_redis_stats['misses']
+    return stats
+
+
+class TokenManager(object):
+    """OSM tokens shared by drivers, kept in process memory and then in redis.
+
+    Tokens are refreshed TOKEN_REFRESH_MARGIN seconds ahead of their expiry.
+    A redis lock lets a single worker log in to a NFVO: the others keep
+    using a token that is still valid, or wait and read the new one.
+    """
+
+    def __init__(self):
+        self._tokens = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    @staticmethod
+    def _valid(token, margin=0) -> bool:
+        return token is not None and token['expires'] - margin > time.time()
+
+    def _local_lock(self, token_key: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(token_key, threading.Lock())
+
+    def _load(self, token_key: str):
+        try:
+            s_token = redis_client.get(token_key)
+        except RedisError as e:
+            logger.warning('cannot read token cache: {}'.format(e))
+            return None
+        return json.loads(str(s_token)) if s_token else None
+
+    def _store(self, token_key: str, token: Dict) -> None:
+        self._tokens[token_key] = token
+        ttl = min(KEY_TTL, int(token['expires'] - time.time()))
+        if ttl <= 0:
+            return
+        try:
+            redis_client.setex(token_key, ttl, json.dumps(token))
+        except RedisError as e:
+            logger.warning('cannot write token cache: {}'.format(e))
+
+    def get(self, token_key: str, login: Callable[[], Dict]) -> Dict:
+        token = self._tokens.get(token_key)
+        if self._valid(token, TOKEN_REFRESH_MARGIN):
+            return token
+        with self._local_lock(token_key):
+            token = self._tokens.get(token_key)
+            if self._valid(token, TOKEN_REFRESH_MARGIN):
+                return token
+            stored = self._load(token_key)
+            if self._valid(stored, TOKEN_REFRESH_MARGIN):
+                self._tokens[token_key] = stored
+                return stored
+            if stored is not None and (token is None or stored['expires'] > token['expires']):
+                token = stored
+            return self._refresh(token_key, token, login)
+
+    def _refresh(self, token_key: str, token, login: Callable[[], Dict]) -> Dict:
+        lock = redis_client.lock('lock_' + token_key, timeout=TOKEN_LOCK_TIMEOUT,
+                                 blocking_timeout=TOKEN_LOCK_TIMEOUT)
+        try:
+            # with a valid token do not wait, someone else is refreshing it
+            acquired = lock.acquire(blocking=not self._valid(token))
+        except RedisError as e:
+            # without redis, workers log in on their own
+            logger.warning('cannot lock token cache: {}'.format(e))
+            acquired = False
+            lock = None
+        if lock is not None and not acquired and self._valid(token):
+            return token
+        try:
+            stored = self._load(token_key)
+            if self._valid(stored, TOKEN_REFRESH_MARGIN):
+                self._tokens[token_key] = stored
+                return stored
+            logger.info('login to {}'.format(token_key))
+            token = login()
+            self._store(token_key, token)
+            return token
+        finally:
+            if acquired:
+                try:
+                    lock.release()
+                except RedisError as e:
+                    logger.warning('cannot unlock token cache: {}'.format(e))
+
+    def invalidate(self, token_key: str, token: Dict) -> None:
+        """Forget token, e.g. after OSM rejected it."""
+        if self._tokens.get(token_key) is token:
+            del self._tokens[token_key]
+        try:
+            stored = self._load(token_key)
+            if stored and stored['id'] == token['id']:
+                redis_client.delete(token_key)
+        except RedisError as e:
+            logger.warning('cannot invalidate token cache: {}'.format(e))
+
+
+token_manager = TokenManager()
+
+
 def _authenticate(func):
     @wraps(func)
     def wrapper(self, *args, **kwargs):
         if TESTING == 'true':
-            pass
-        else:
-            token_key = 'nfvo_' + str(self._nfvoId)
-            if not self._token:
-                s_token = redis_client.get(token_key)
-                if s_token:
-                    self._token = json.loads(str(s_token))
-            if not self._token or datetime.utcfromtimestamp(
-                    self._token["expires"]) < datetime.utcnow():
-                auth_payload = {'username': self._user,
-                                'password': self._password,
-                                'project_id': self._project}
-                token_url = "{0}/{1}".format(self._base_path,
-                                             self._token_endpoint)
-                self._token, headers = OSM._request(
-                    post, token_url, json=auth_payload)
-                t_val = json.dumps(self._token)
-                redis_client.setex(token_key, KEY_TTL, t_val)
-            self._headers["Authorization"] = 'Bearer {}'.format(
-                self._token['id'])
-
-        return func(self, *args, **kwargs)
+            return func(self, *args, **kwargs)
+        token_key = 'nfvo_' + str(self._nfvoId)
+        self._token = token_manager.get(token_key, self._login)
+        self._headers["Authorization"] = 'Bearer {}'.format(
+            self._token['id'])
+        try:
+            return func(self, *args, **kwargs)
+        except Unauthorized:
+            token_manager.invalidate(token_key, self._token)
+            raise
 
     return wrapper
 
@@ -100,13 +271,26 @@ class OSM(Driver):
         else:
             self._base_path = 'https://{0}:{1}/osm'.format(self._host,
                                                            self._so_port)
+        self._session = transport.get_session(self._base_path)
+
+    def _login(self) -> Dict:
+        auth_payload = {'username': self._user,
+                        'password': self._password,
+                        'project_id': self._project}
+        token_url = "{0}/{1}".format(self._base_path, self._token_endpoint)
+        token, headers = self._request(
+            self._session.post, token_url, json=auth_payload)
+        return token
 
     @staticmethod
     def _request(req: api.request, url, json=None, params=None, headers=None):
         try:
+            # body is read eagerly so the connection goes back to the pool
             resp = req(url, json=json, params=params, headers=headers,
-                       verify=False, stream=True)
-        except (ConnectionError, Timeout, TooManyRedirects, URLRequired) as e:
+                       verify=False)
+        except Timeout as e:
+            raise GatewayTimeout('OSM timeout: ' + str(e))
+        except (ConnectionError, TooManyRedirects, URLRequired) as e:
             raise ServerError('OSM connection error: ' + str(e))
         try:
             resp.raise_for_status()
@@ -143,14 +327,25 @@ class OSM(Driver):
     def _get_vnf_list(self, args=None):
         _url = "{0}/nslcm/v1/vnf_instances".format(self._base_path)
         _url = self._build_url_query(_url, args)
-        return self._request(get, _url, headers=self._headers)
+        return self._request(self._session.get, _url, headers=self._headers)
+
+    def _get_vnfs_by_ns(self, osm_ns_list: List[Dict]) -> Dict[str, Dict]:
+        """Fetch the VNF records of the NSs, NS_IDS_PER_QUERY NSs per query, keyed by VNF id."""
+        ns_ids = [osm_ns['id'] for osm_ns in osm_ns_list
+                  if osm_ns.get('constituent-vnfr-ref')]
+        osm_vnfs = {}
+        for i in range(0, len(ns_ids), NS_IDS_PER_QUERY):
+            vnf_list, headers = self._get_vnf_list(
+                args={'args': {'nsr-id-ref': ','.join(ns_ids[i:i + NS_IDS_PER_QUERY])}})
+            osm_vnfs.update((osm_vnf['id'], osm_vnf) for osm_vnf in vnf_list)
+        return osm_vnfs
 
     @_authenticate
     def _get_vnf(self, vnfId: str, args=None):
         _url = "{0}/nslcm/v1/vnf_instances/{1}".format(self._base_path, vnfId)
         _url = self._build_url_query(_url, args)
         try:
-            return self._request(get, _url, headers=self._headers)
+            return self._request(self._session.get, _url, headers=self._headers)
         except ResourceNotFound:
             raise VnfNotFound(vnf_id=vnfId)
 
@@ -158,7 +353,7 @@ class OSM(Driver):
     def get_vim_list(self):
         _url = "{0}/admin/v1/vims".format(self._base_path)
         _url = self._build_url_query(_url)
-        return self._request(get, _url, headers=self._headers)
+        return self._request(self._session.get, _url, headers=self._headers)
 
     @_authenticate
     def _get_vnfpkg(self, vnfPkgId, args=None):
@@ -166,15 +361,50 @@ class OSM(Driver):
             self._base_path, vnfPkgId)
         _url = self._build_url_query(_url, args)
         try:
-            return self._request(get, _url, headers=self._headers)
+            return self._request(self._session.get, _url, headers=self._headers)
         except ResourceNotFound:
             raise VnfPkgNotFound(vnfpkg_id=vnfPkgId)
 
+    def _get_vnfpkg_cached(self, vnfPkgId) -> Tuple[Dict, Dict[Tuple[str, str], str]]:
+        """Return a VNF package with its connection point index."""
+        key = _vnfpkg_key(self._nfvoId, vnfPkgId)
+        cached = vnfpkg_cache.get(key)
+        if cached is not None:
+            return cached
+        vnfpkg = None
+        if VNFPKG_CACHE_REDIS == 'true':
+            vnfpkg = _redis_get_vnfpkg(key)
+        if vnfpkg is None:
+            vnfpkg, headers = self._get_vnfpkg(vnfPkgId)
+            if VNFPKG_CACHE_REDIS == 'true':
+                _redis_set_vnfpkg(key, vnfpkg)
+        cached = (vnfpkg, self._cp_index(vnfpkg))
+        vnfpkg_cache.set(key, cached)
+        return cached
+
+    @staticmethod
+    def _cp_index(vnfpkg: Dict) -> Dict[Tuple[str, str], str]:
+        """Map (vdu id, interface name) to the connection point of a VNF package."""
+        cp_index = {}
+        for vdu in vnfpkg.get("vdu", []):
+            for if_pkg in vdu.get("interface", []):
+                cps = [val for key, val in if_pkg.items()
+                       if key.endswith("-connection-point-ref")]
+                if not cps:
+                    continue
+                if_key = (vdu["id"], if_pkg["name"])
+                if if_key in cp_index:
+                    logger.warning('duplicate interface {0} in vdu {1}, keep the first one'.format(
+                        if_pkg["name"], vdu["id"]))
+                    continue
+                cp_index[if_key] = cps[0]
+        return cp_index
+
     @_authenticate
     def _get_nsdpkg(self, args=None):
         _url = "{0}/nsd/v1/ns_descriptors".format(self._base_path)
         _url = self._build_url_query(_url, args)
-        nsdpkg_list, headers = self._request(get, _url, headers=self._headers)
+        nsdpkg_list, headers = self._request(self._session.get, _url, headers=self._headers)
         if not nsdpkg_list:
             raise NsdNotFound(nsd_id=args["args"]["id"])
         elif len(nsdpkg_list) > 1:
@@ -187,11 +417,11 @@ class OSM(Driver):
     def get_ns_list(self, args=None) -> Tuple[BodyList, Headers]:
         _url = "{0}/nslcm/v1/ns_instances".format(self._base_path)
         _url = self._build_url_query(_url, args)
-        osm_ns_list, osm_headers = self._request(get, _url,
+        osm_ns_list, osm_headers = self._request(self._session.get, _url,
                                                  headers=self._headers)
-        sol_ns_list = []
-        for osm_ns in osm_ns_list:
-            sol_ns_list.append(self._ns_im_converter(osm_ns))
+        osm_vnfs = self._get_vnfs_by_ns(osm_ns_list)
+        sol_ns_list = self._map_concurrent(
+            lambda osm_ns: self._ns_im_converter(osm_ns, osm_vnfs), osm_ns_list)
         headers = self._build_headers(osm_headers)
         return sol_ns_list, headers
 
@@ -205,7 +435,7 @@ class OSM(Driver):
             logger.info('no vimAccountId set, select first in NFVO')
             args['payload']['vimAccountId'] = self._select_vim()
         osm_ns, osm_headers = self._request(
-            post, _url, json=args['payload'], headers=self._headers)
+            self._session.post, _url, json=args['payload'], headers=self._headers)
         # Get location header from OSM
         headers = self._build_headers(osm_headers)
         # Get NS info from OSM
@@ -218,7 +448,7 @@ class OSM(Driver):
         _url = "{0}/nslcm/v1/ns_instances/{1}".format(self._base_path, nsId)
         _url = self._build_url_query(_url, args)
         try:
-            osm_ns, osm_headers = self._request(get, _url,
+            osm_ns, osm_headers = self._request(self._session.get, _url,
                                                 headers=self._headers)
         except ResourceNotFound:
             raise NsNotFound(ns_id=nsId)
@@ -243,7 +473,7 @@ class OSM(Driver):
             pass
         try:
             empty_body, osm_headers = self._request(
-                delete, _url, params=None, headers=req_headers)
+                self._session.delete, _url, params=None, headers=req_headers)
         except ResourceNotFound:
             raise NsNotFound(ns_id=nsId)
         headers = self._build_headers(osm_headers)
@@ -287,7 +517,7 @@ class OSM(Driver):
 
         try:
             empty_body, osm_headers = self._request(
-                post, _url, json=instantiate_payload, headers=self._headers)
+                self._session.post, _url, json=instantiate_payload, headers=self._headers)
         except ResourceNotFound as e:
             print(e)
             raise NsNotFound(ns_id=nsId)
@@ -310,7 +540,7 @@ class OSM(Driver):
         except KeyError:
             pass
         try:
-            emtpy_body, osm_headers = self._request(post, _url,
+            emtpy_body, osm_headers = self._request(self._session.post, _url,
                                                     headers=req_headers)
         except ResourceNotFound:
             raise NsNotFound(ns_id=nsId)
@@ -324,7 +554,7 @@ class OSM(Driver):
         _url = self._build_url_query(_url, args)
         try:
             empty_body, osm_headers = self._request(
-                post, _url, json=args['payload'], headers=self._headers)
+                self._session.post, _url, json=args['payload'], headers=self._headers)
         except ResourceNotFound:
             raise NsNotFound(ns_id=id)
         headers = self._build_headers(osm_headers)
@@ -334,7 +564,7 @@ class OSM(Driver):
     def get_op_list(self, args: Dict = None) -> Tuple[BodyList, Headers]:
         _url = "{0}/nslcm/v1/ns_lcm_op_occs".format(self._base_path)
         _url = self._build_url_query(_url, args)
-        osm_op_list, osm_headers = self._request(get, _url,
+        osm_op_list, osm_headers = self._request(self._session.get, _url,
                                                  headers=self._headers)
         sol_op_list = []
         for op in osm_op_list:
@@ -348,7 +578,7 @@ class OSM(Driver):
             self._base_path, nsLcmOpId)
         _url = self._build_url_query(_url, args)
         try:
-            osm_op, osm_headers = self._request(get, _url,
+            osm_op, osm_headers = self._request(self._session.get, _url,
                                                 headers=self._headers)
         except ResourceNotFound:
             raise NsOpNotFound(ns_op_id=nsLcmOpId)
@@ -358,12 +588,13 @@ class OSM(Driver):
 
     def _force_float_ip(self, ap_vld, osm_ns):
         vnf_items = []
-        if IWFREPO == 'true':
+        if IWFREPO == 'true' and ap_vld:
+            # one index read, then a lookup for each VLD
+            site = iwf_inventory.get_site_networks(self._nfvoId)
             for vld in ap_vld:
-                try:
-                    net = iwf_repository.get_site_network(vld['vim-network-name'],
-                                                          self._nfvoId)
-                except VimNetworkNotFound as e:
+                net = site['networks'].get(vld['vim-network-name'])
+                if net is None:
+                    e = VimNetworkNotFound(vld['vim-network-name'], site['site'])
                     logger.error(e.description)
                     raise Unprocessable(e.description)
                 if net['floating_ip']:
@@ -374,13 +605,9 @@ class OSM(Driver):
     def _force_float_ip_vld_interfaces(self, osm_ns, vld_id):
         res_vnf = []
         nsd = osm_ns["nsd"]
-        osm_vnfs = []
-        for vnf_id in osm_ns["constituent-vnfr-ref"]:
-            try:
-                vnf, headers = self._get_vnf(vnf_id)
-                osm_vnfs.append(vnf)
-            except VnfNotFound:
-                pass
+        vnfs_by_id = self._get_vnfs_by_ns([osm_ns])
+        osm_vnfs = [vnfs_by_id[vnf_id] for vnf_id in osm_ns["constituent-vnfr-ref"]
+                    if vnf_id in vnfs_by_id]
 
         for vld in nsd['vld']:
             if vld["id"] == vld_id:
@@ -410,17 +637,17 @@ class OSM(Driver):
     def _cpinfo_converter(self, osm_vnf: Dict) -> List[Dict]:
         cp_info = []
         try:
-            vnfpkg, headers = self._get_vnfpkg(osm_vnf["vnfd-id"])
+            vnfpkg, cp_index = self._get_vnfpkg_cached(osm_vnf["vnfd-id"])
         except VnfPkgNotFound:
             return cp_info
         for vdur in osm_vnf["vdur"]:
             for if_vdur in vdur["interfaces"]:
-                [if_pkg] = [if_pkg for vdu in vnfpkg["vdu"]
-                            for if_pkg in vdu["interface"]
-                            if vdu["id"] == vdur["vdu-id-ref"]
-                            and if_pkg["name"] == if_vdur["name"]]
-                [cp] = [val for key, val in if_pkg.items(
-                ) if key.endswith("-connection-point-ref")]
+                try:
+                    cp = cp_index[(vdur["vdu-id-ref"], if_vdur["name"])]
+                except KeyError:
+                    logger.debug('no connection point for interface {0} of vdu {1}'.format(
+                        if_vdur["name"], vdur["vdu-id-ref"]))
+                    continue
                 try:
                     (ip_address, mac_address) = (
                         if_vdur["ip-address"], if_vdur["mac-address"])
@@ -446,6 +673,12 @@ class OSM(Driver):
                 })
         return cp_info
 
+    def _map_concurrent(self, func: Callable, items: List) -> List:
+        """Apply func to items on the NFVO pool, results keep the items order."""
+        if OSM_FANOUT_WORKERS <= 1 or len(items) <= 1:
+            return [func(item) for item in items]
+        return list(deadline.map_bound(_fanout_pool(self._nfvoId), func, items))
+
     def _select_vim(self):
         osm_vims, osm_vim_h = self.get_vim_list()
         if osm_vims and len(osm_vims) > 0:
@@ -453,7 +686,7 @@ class OSM(Driver):
         else:
             raise VimNotFound()
 
-    def _ns_im_converter(self, osm_ns: Dict) -> Dict:
+    def _ns_im_converter(self, osm_ns: Dict, osm_vnfs: Dict[str, Dict] = None) -> Dict:
         sol_ns = {
             "id": osm_ns['id'],
             "nsInstanceName": osm_ns['name'],
@@ -463,16 +696,13 @@ class OSM(Driver):
             "vnfInstance": []
         }
 
-        osm_vnfs = []
-        if 'constituent-vnfr-ref' in osm_ns:
-            for vnf_id in osm_ns["constituent-vnfr-ref"]:
-                try:
-                    vnf, headers = self._get_vnf(vnf_id)
-                    osm_vnfs.append(vnf)
-                except VnfNotFound:
-                    pass
+        if osm_vnfs is None:
+            osm_vnfs = self._get_vnfs_by_ns([osm_ns])
+        # VNF records missing in OSM are skipped
+        ns_vnfs = [osm_vnfs[vnf_id] for vnf_id in osm_ns.get('constituent-vnfr-ref', [])
+                   if vnf_id in osm_vnfs]
 
-        for osm_vnf in osm_vnfs:
+        for osm_vnf in ns_vnfs:
             vnf_instance = {
                 "id": osm_vnf["id"],
                 "vnfdId": osm_vnf["vnfd-ref"],
@@ -24,7 +24,10 @@ def init_errorhandler(app):
             "description": e.description,
         }
         app.logger.error('error: {}'.format(data))
-        return make_response(jsonify(data), data['code'])
+        response = make_response(jsonify(data), data['code'])
+        if getattr(e, 'retry_after', None):
+            response.headers['Retry-After'] = str(e.retry_after)
+        return response
 
     # all 4xx and 500
     @app.errorhandler(HTTPException)
@@ -153,3 +156,14 @@ class Unprocessable(Error):
 class ServerError(Error):
     def __init__(self, description='Server error'):
         super().__init__(description=description)
+
+
+class GatewayTimeout(Error):
+    def __init__(self, description='Gateway Timeout'):
+        super().__init__(description=description)
+
+
+class ServiceUnavailable(Error):
+    def __init__(self, description='Service Unavailable', retry_after=None):
+        super().__init__(description=description)
+        self.retry_after = retry_after
@@ -0,0 +1,144 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# module to schedule the polls of each NFVO: fast while it runs operations,
+# backing off exponentially while it is quiet
+
+import logging
+import os
+import time
+from typing import Dict, List
+
+from redis import RedisError
+
+from adaptation_layer import transport
+from adaptation_layer.error_handler import ServiceUnavailable
+
+logger = logging.getLogger('app.polling')
+
+# seconds between two polls of an NFVO running operations, also the beat schedule
+POLL_MIN_INTERVAL = float(os.getenv('POLL_MIN_INTERVAL')) if os.getenv('POLL_MIN_INTERVAL') else 1
+# seconds between two polls of a quiet NFVO at most
+POLL_MAX_INTERVAL = float(os.getenv('POLL_MAX_INTERVAL')) if os.getenv('POLL_MAX_INTERVAL') else 60
+# operation states keeping the polls fast
+ACTIVE_STATES = ('PROCESSING', 'ROLLING_BACK')
+# TTL (seconds) of the running operations, stuck ones stop keeping the polls fast
+ACTIVE_TTL = 21600
+NFVOS_KEY = 'poll_nfvos'
+
+redis_client = transport.get_redis(1)
+# polls started before the last wake up stay fast, the wake up may have been missed
+_RECORD = redis_client.register_script("""
+local now = tonumber(ARGV[1])
+local min_interval = tonumber(ARGV[5])
+local interval = tonumber(redis.call('HGET', KEYS[1], 'interval') or min_interval)
+local woken_at = tonumber(redis.call('HGET', KEYS[1], 'wokenAt') or 0)
+if tonumber(ARGV[3]) > 0 or ARGV[4] == '1' or woken_at >= tonumber(ARGV[2]) then
+    interval = min_interval
+else
+    interval = math.min(interval * 2, tonumber(ARGV[6]))
+end
+redis.call('HSET', KEYS[1], 'interval', interval, 'next', now + interval, 'lastPoll', now,
+           'active', ARGV[3], 'claimedUntil', 0)
+return tostring(interval)
+""")
+
+
+def _key(nfvo_id) -> str:
+    return 'poll:{}'.format(nfvo_id)
+
+
+def claim_due(nfvo_ids: List, hold: float) -> List:
+    """Return the NFVOs due for a poll, claimed for hold seconds.
+
+    Without redis every NFVO is due.
+    """
+    now = time.time()
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for nfvo_id in nfvo_ids:
+            pipe.hmget(_key(nfvo_id), 'next', 'claimedUntil')
+        states = pipe.execute()
+        due = [nfvo_id for nfvo_id, (next_poll, claimed_until) in zip(nfvo_ids, states)
+               if float(next_poll or 0) <= now and float(claimed_until or 0) <= now]
+        if due:
+            pipe = redis_client.pipeline(transaction=False)
+            for nfvo_id in due:
+                pipe.hset(_key(nfvo_id), 'claimedUntil', now + hold)
+            pipe.sadd(NFVOS_KEY, *due)
+            pipe.execute()
+        return due
+    except RedisError as e:
+        logger.warning('polling schedule not available: {}'.format(str(e)))
+        return list(nfvo_ids)
+
+
+def update_active(nfvo_id, changed_ops: List[Dict]) -> int:
+    """Track the operations of the NFVO in ACTIVE_STATES, return how many are running."""
+    key = 'active_{}'.format(nfvo_id)
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for op in changed_ops:
+            if op['operationState'] in ACTIVE_STATES:
+                pipe.sadd(key, op['id'])
+            else:
+                pipe.srem(key, op['id'])
+        pipe.expire(key, ACTIVE_TTL)
+        pipe.scard(key)
+        return pipe.execute()[-1]
+    except RedisError as e:
+        logger.warning('cannot track operations of NFVO {}: {}'.format(nfvo_id, str(e)))
+        return 0
+
+
+def record(nfvo_id, started: float, active: int = 0, changed: bool = False) -> float:
+    """Schedule the next poll of the NFVO after the one started at started, return the interval."""
+    try:
+        return float(_RECORD(keys=[_key(nfvo_id)], args=[
+            time.time(), started, active, 1 if changed else 0, POLL_MIN_INTERVAL, POLL_MAX_INTERVAL]))
+    except RedisError as e:
+        logger.warning('cannot schedule next poll of NFVO {}: {}'.format(nfvo_id, str(e)))
+        return POLL_MIN_INTERVAL
+
+
+def wake(nfvo_id) -> None:
+    """Poll the NFVO at the next beat and keep polling it fast."""
+    now = time.time()
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hset(_key(nfvo_id), mapping={'interval': POLL_MIN_INTERVAL, 'next': now, 'wokenAt': now})
+        pipe.sadd(NFVOS_KEY, nfvo_id)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning('cannot wake up polls of NFVO {}: {}'.format(nfvo_id, str(e)))
+
+
+def stats() -> List[Dict]:
+    try:
+        nfvo_ids = sorted(redis_client.smembers(NFVOS_KEY))
+        pipe = redis_client.pipeline(transaction=False)
+        for nfvo_id in nfvo_ids:
+            pipe.hgetall(_key(nfvo_id))
+        states = pipe.execute()
+    except RedisError as e:
+        raise ServiceUnavailable(description='Polling schedule not available: {}'.format(str(e)))
+    now = time.time()
+    return [{
+        'nfvoId': nfvo_id,
+        'interval': float(state.get('interval', POLL_MIN_INTERVAL)),
+        'nextPollIn': max(0.0, round(float(state.get('next', now)) - now, 3)),
+        'lastPoll': float(state['lastPoll']) if 'lastPoll' in state else None,
+        'activeOperations': int(state.get('active', 0)),
+        'polling': float(state.get('claimedUntil', 0)) > now
+    } for nfvo_id, state in zip(nfvo_ids, states)]
@@ -0,0 +1,313 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# repository serving orchestrators, credentials, sites and networks from a
+# redis replica of the iwf repository, subscriptions go to the iwf repository
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from redis import RedisError
+from requests import HTTPError
+
+from adaptation_layer import deadline, transport
+from adaptation_layer.error_handler import NfvoCredentialsNotFound, RanoCredentialsNotFound, VimNetworkNotFound
+from adaptation_layer.repository import iwf_repository
+# not replicated, read from the iwf repository on each call
+from adaptation_layer.repository.iwf_repository import get_subscription_list, get_all_subscriptions, \
+    create_subscription, get_subscription, delete_subscription, search_subs_by_ns_instance  # noqa: F401
+
+logger = logging.getLogger('app.iwf_inventory')
+
+# seconds between two delta syncs of the replica
+INVENTORY_SYNC_INTERVAL = int(os.getenv('INVENTORY_SYNC_INTERVAL')) if os.getenv('INVENTORY_SYNC_INTERVAL') else 30
+# seconds between two full syncs, reading again the site of every orchestrator
+INVENTORY_FULL_SYNC = int(os.getenv('INVENTORY_FULL_SYNC')) if os.getenv('INVENTORY_FULL_SYNC') else 600
+# seconds an entry is served without being confirmed by a sync, then the iwf repository is read
+INVENTORY_MAX_STALENESS = int(os.getenv('INVENTORY_MAX_STALENESS')) \
+    if os.getenv('INVENTORY_MAX_STALENESS') else 3 * INVENTORY_SYNC_INTERVAL
+# start of the last sync, expires with the replica
+SYNCED_KEY = 'inv:synced'
+FULL_SYNCED_KEY = 'inv:full_synced'
+# NFVO id -> name of its site and networks of the site by vim_network_name
+NETWORKS_KEY = 'inv:site_networks'
+# orchestrator -> hash of its type and credentials, cached drivers are built again when it changes
+VERSIONS_KEY = 'inv:versions'
+# orchestrator kind -> iwf repository collection
+COLLECTIONS = {'nfvo': 'nfvOrchestrators', 'rano': 'ranOrchestrators'}
+SYNC_WORKERS = 8
+
+redis_client = transport.get_redis(9)
+_sync_pool = None
+_sync_pool_lock = threading.Lock()
+
+
+def _key(kind: str) -> str:
+    return 'inv:{}'.format(kind)
+
+
+def _hash(obj) -> str:
+    return hashlib.sha1(json.dumps(obj, sort_keys=True).encode()).hexdigest()
+
+
+def _version(record: Dict) -> str:
+    return _hash([record['type'], record.get('credentials')])
+
+
+def _get_sync_pool() -> ThreadPoolExecutor:
+    global _sync_pool
+    with _sync_pool_lock:
+        if _sync_pool is None:
+            _sync_pool = ThreadPoolExecutor(max_workers=SYNC_WORKERS, thread_name_prefix='inventory')
+        return _sync_pool
+
+
+def _get_record(kind: str, orc_id) -> Dict:
+    if kind == 'nfvo':
+        return iwf_repository._get_nfvo(orc_id)
+    return iwf_repository._get_rano(orc_id)
+
+
+def _get_site(record: Dict) -> Optional[Dict]:
+    """Return the site of the orchestrator record, None if it has none."""
+    try:
+        return iwf_repository._get_site(record['_links']['site']['href'])
+    except HTTPError:
+        return None
+
+
+def _entry(record: Dict, site: Optional[Dict]) -> Dict:
+    return {
+        'record': record,
+        'site': site['_links']['self']['href'] if site else None,
+        'siteName': site['name'] if site else None,
+        'hash': _hash(record),
+        'syncedAt': time.time()
+    }
+
+
+def _networks_entry(site_name: str, networks: List[Dict]) -> Dict:
+    return {'site': site_name, 'networks': {n['vim_network_name']: n for n in networks}}
+
+
+def sync(full: bool = False) -> None:
+    """Align the replica with the iwf repository.
+
+    A delta sync reads the site only of new and changed orchestrators, a full
+    sync of every orchestrator: moving an orchestrator to another site does
+    not change its record. The networks of every site are read each time and
+    indexed by NFVO.
+    """
+    started = time.time()
+    full = full or not redis_client.exists(FULL_SYNCED_KEY)
+    records = {kind: {str(r['id']): r for r in iwf_repository.iter_records(collection)}
+               for kind, collection in COLLECTIONS.items()}
+    sites = {s['_links']['self']['href']: s for s in iwf_repository.iter_records('sites')}
+    pipe = redis_client.pipeline(transaction=False)
+    for kind in COLLECTIONS:
+        pipe.hgetall(_key(kind))
+    pipe.hgetall(NETWORKS_KEY)
+    *stored, stored_networks = pipe.execute()
+    stored = {kind: {orc_id: json.loads(s) for orc_id, s in entries.items()}
+              for kind, entries in zip(COLLECTIONS, stored)}
+
+    changed = [(kind, record) for kind in COLLECTIONS for orc_id, record in records[kind].items()
+               if full or orc_id not in stored[kind] or stored[kind][orc_id]['hash'] != _hash(record)]
+    pool = _get_sync_pool()
+    orc_sites = deadline.map_bound(pool, _get_site, [record for kind, record in changed])
+    site_networks = deadline.map_bound(pool, iwf_repository.get_networks, sites.values())
+
+    pipe = redis_client.pipeline()
+    updated = 0
+    site_hrefs = {orc_id: entry['site'] for orc_id, entry in stored['nfvo'].items()}
+    for (kind, record), site in zip(changed, orc_sites):
+        entry = _entry(record, site)
+        if kind == 'nfvo':
+            site_hrefs[str(record['id'])] = entry['site']
+        previous = stored[kind].get(str(record['id']))
+        if previous is None or previous['hash'] != entry['hash'] or previous['site'] != entry['site']:
+            pipe.hset(_key(kind), record['id'], json.dumps(entry))
+            updated += 1
+        if previous is None or _version(previous['record']) != _version(record):
+            pipe.hset(VERSIONS_KEY, '{}:{}'.format(kind, record['id']), _version(record))
+    removed = 0
+    for kind in COLLECTIONS:
+        for orc_id in stored[kind].keys() - records[kind].keys():
+            pipe.hdel(_key(kind), orc_id)
+            pipe.hdel(VERSIONS_KEY, '{}:{}'.format(kind, orc_id))
+            removed += 1
+    networks_by_site = {href: _networks_entry(site['name'], networks)
+                        for (href, site), networks in zip(sites.items(), site_networks)}
+    indexed = set()
+    for nfvo_id in records['nfvo']:
+        entry = networks_by_site.get(site_hrefs.get(nfvo_id))
+        if entry is None:
+            continue
+        indexed.add(nfvo_id)
+        s_entry = json.dumps(entry, sort_keys=True)
+        if stored_networks.get(nfvo_id) != s_entry:
+            pipe.hset(NETWORKS_KEY, nfvo_id, s_entry)
+    for nfvo_id in stored_networks.keys() - indexed:
+        pipe.hdel(NETWORKS_KEY, nfvo_id)
+    pipe.set(SYNCED_KEY, started, ex=INVENTORY_MAX_STALENESS)
+    if full:
+        pipe.set(FULL_SYNCED_KEY, started, ex=INVENTORY_FULL_SYNC)
+    pipe.execute()
+    logger.info('inventory {} sync: {} orchestrators, {} updated, {} removed, {} sites'.format(
+        'full' if full else 'delta', sum(len(r) for r in records.values()), updated, removed, len(sites)))
+
+
+def _fresh(synced: Optional[str], entry: Dict) -> bool:
+    return max(float(synced or 0), entry['syncedAt']) >= time.time() - INVENTORY_MAX_STALENESS
+
+
+def _refresh(kind: str, orc_id) -> Dict:
+    """Read the orchestrator from the iwf repository and store it in the replica."""
+    record = _get_record(kind, orc_id)
+    entry = _entry(record, _get_site(record))
+    try:
+        pipe = redis_client.pipeline()
+        pipe.hset(_key(kind), record['id'], json.dumps(entry))
+        pipe.hset(VERSIONS_KEY, '{}:{}'.format(kind, record['id']), _version(record))
+        pipe.execute()
+    except RedisError as e:
+        logger.warning('cannot store {} {} in the inventory: {}'.format(kind, orc_id, str(e)))
+    return entry
+
+
+def _get_entry(kind: str, orc_id) -> Dict:
+    """Return the replica entry of the orchestrator, read again from the iwf repository if missing or stale."""
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.get(SYNCED_KEY)
+        pipe.hget(_key(kind), orc_id)
+        synced, s_entry = pipe.execute()
+    except RedisError as e:
+        logger.warning('inventory not available: {}'.format(str(e)))
+        synced, s_entry = None, None
+    if s_entry:
+        entry = json.loads(s_entry)
+        if _fresh(synced, entry):
+            return entry
+    return _refresh(kind, orc_id)
+
+
+def _get_records(kind: str) -> Optional[List[Dict]]:
+    """Return the replicated records of kind sorted by id, None if the replica is stale."""
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.get(SYNCED_KEY)
+        pipe.hvals(_key(kind))
+        synced, s_entries = pipe.execute()
+    except RedisError as e:
+        logger.warning('inventory not available: {}'.format(str(e)))
+        return None
+    if not synced:
+        return None
+    return sorted((json.loads(s) for s in s_entries), key=lambda e: e['record']['id'])
+
+
+def _site_names(entry: Dict) -> Dict[str, Optional[str]]:
+    return {entry['record']['_links']['site']['href']: entry['siteName']}
+
+
+def get_nfvo_by_id(nfvo_id: int) -> Dict:
+    entry = _get_entry('nfvo', nfvo_id)
+    return iwf_repository._convert_nfvo(entry['record'], _site_names(entry))
+
+
+def get_rano_by_id(rano_id: int) -> Dict:
+    entry = _get_entry('rano', rano_id)
+    return iwf_repository._convert_rano(entry['record'], _site_names(entry))
+
+
+def get_nfvo_cred(nfvo_id: int) -> Dict:
+    nfvo = _get_entry('nfvo', nfvo_id)['record']
+    if nfvo['credentials'] is None:
+        raise NfvoCredentialsNotFound(nfvo_id)
+    return iwf_repository.convert_nfvo_cred(nfvo)
+
+
+def get_rano_cred(rano_id: int) -> Dict:
+    rano = _get_entry('rano', rano_id)['record']
+    if rano['credentials'] is None:
+        raise RanoCredentialsNotFound(rano_id)
+    return iwf_repository.convert_rano_cred(rano)
+
+
+def get_nfvo_list() -> List[Dict]:
+    entries = _get_records('nfvo')
+    if entries is None:
+        return iwf_repository.get_nfvo_list()
+    return [iwf_repository._convert_nfvo(e['record'], _site_names(e)) for e in entries]
+
+
+def get_rano_list() -> List[Dict]:
+    entries = _get_records('rano')
+    if entries is None:
+        return iwf_repository.get_rano_list()
+    return [iwf_repository._convert_rano(e['record'], _site_names(e)) for e in entries]
+
+
+def find_nfvos_by_type(nfvo_type: str) -> List[Dict]:
+    entries = _get_records('nfvo')
+    if entries is None:
+        return iwf_repository.find_nfvos_by_type(nfvo_type)
+    return [e['record'] for e in entries if e['record']['type'].casefold() == nfvo_type.casefold()]
+
+
+def get_site_networks(nfvo_id: int) -> Dict:
+    """Return the name of the site of the NFVO and its networks by vim_network_name.
+
+    Read from the iwf repository and indexed if missing from the index.
+    """
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.exists(SYNCED_KEY)
+        pipe.hget(NETWORKS_KEY, nfvo_id)
+        synced, s_entry = pipe.execute()
+    except RedisError as e:
+        logger.warning('inventory not available: {}'.format(str(e)))
+        synced, s_entry = False, None
+    entry = json.loads(s_entry) if synced and s_entry else None
+    if entry is None:
+        entry = _networks_entry(*iwf_repository.get_site_networks(nfvo_id))
+        try:
+            redis_client.hset(NETWORKS_KEY, nfvo_id, json.dumps(entry, sort_keys=True))
+        except RedisError as e:
+            logger.warning('cannot index networks of NFVO {}: {}'.format(nfvo_id, str(e)))
+    return entry
+
+
+def get_site_network(vim_network_name: str, nfvo_id: int) -> Dict:
+    site = get_site_networks(nfvo_id)
+    try:
+        return site['networks'][vim_network_name]
+    except KeyError:
+        raise VimNetworkNotFound(vim_network_name, site['site'])
+
+
+def driver_version(orc_type: str, orc_id) -> Optional[str]:
+    """Return the version of the credentials of the orchestrator, None if unknown."""
+    try:
+        return redis_client.hget(VERSIONS_KEY, '{}:{}'.format(orc_type, orc_id))
+    except RedisError as e:
+        logger.warning('inventory not available: {}'.format(str(e)))
+        return None
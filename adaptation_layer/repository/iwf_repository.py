@@ -11,18 +11,24 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
+import inspect
 import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from functools import wraps
-from typing import List, Dict
+from typing import Dict, Iterator, List, Optional, Tuple
 
-from requests import get, ConnectionError, Timeout, \
-    TooManyRedirects, URLRequired, HTTPError, post, put, delete, patch
+from requests import ConnectionError, Timeout, \
+    TooManyRedirects, URLRequired, HTTPError, Session
 
+from adaptation_layer import deadline, transport
+from adaptation_layer.cache import TTLCache
 from adaptation_layer.error_handler import ServerError, NfvoNotFound, \
     NfvoCredentialsNotFound, Unauthorized, BadRequest, \
     SubscriptionNotFound, Unprocessable, RanoNotFound, RanoCredentialsNotFound, \
-    VimNetworkNotFound
+    VimNetworkNotFound, GatewayTimeout
 
 logger = logging.getLogger('app.iwf_repository')
 IWFREPO_HTTPS = os.getenv('IWFREPO_HTTPS', 'false').lower()
@@ -37,53 +43,126 @@ host = IWFREPO_HOST if IWFREPO_HOST else 'localhost'
 port = int(IWFREPO_PORT) if IWFREPO_PORT else 8087
 interval = int(IWFREPO_INTERVAL) if IWFREPO_INTERVAL else 300
 url = f'{prot}://{host}:{port}'
+# seconds a site name stays cached by each worker
+SITE_CACHE_TTL = int(os.getenv('SITE_CACHE_TTL')) if os.getenv('SITE_CACHE_TTL') else 300
+# concurrent site reads when listing orchestrators with uncached sites
+IWFREPO_FANOUT_WORKERS = int(os.getenv('IWFREPO_FANOUT_WORKERS')) if os.getenv('IWFREPO_FANOUT_WORKERS') else 8
+
+# site names by the href of the site link of an orchestrator
+site_names = TTLCache(maxsize=1024, ttl=SITE_CACHE_TTL)
+_site_pool = None
+_site_pool_lock = threading.Lock()
+
+
+@contextmanager
+def _translate_errors():
+    try:
+        yield
+    except Timeout as e:
+        raise GatewayTimeout(f'iwf repository timeout: {str(e)}')
+    except (ConnectionError, TooManyRedirects, URLRequired) as e:
+        raise ServerError(f'problem contacting iwf repository: {str(e)}')
 
 
 def _server_error(func):
+    # generators fail while iterated, not when called
+    if inspect.isgeneratorfunction(func):
+        @wraps(func)
+        def gen_wrapper(*args, **kwargs):
+            with _translate_errors():
+                yield from func(*args, **kwargs)
+
+        return gen_wrapper
+
     @wraps(func)
     def wrapper(*args, **kwargs):
-        try:
+        with _translate_errors():
             return func(*args, **kwargs)
-        except (ConnectionError, Timeout, TooManyRedirects, URLRequired) as e:
-            raise ServerError(f'problem contacting iwf repository: {str(e)}')
 
     return wrapper
 
 
+def _session() -> Session:
+    """Return the pooled session of the iwf repository, bounded by the request deadline."""
+    return transport.get_session(url)
+
+
+@_server_error
+def iter_records(collection: str, href: str = None, params: Dict = None) -> Iterator[Dict]:
+    """Yield the records of collection, reading the next page only when the previous one is consumed.
+
+    href defaults to the collection itself, e.g. a search resource returning
+    collection records may be given. The HAL next links are followed.
+    """
+    next_href = href if href else f'{url}/{collection}'
+    while next_href:
+        try:
+            resp = _session().get(next_href, params=params, headers=accept_h)
+            resp.raise_for_status()
+        except HTTPError as e:
+            if e.response.status_code == 401:
+                raise Unauthorized()
+            else:
+                raise
+        body = resp.json()
+        yield from body.get('_embedded', {}).get(collection, [])
+        next_href = body['_links']['next']['href'] if 'next' in body.get('_links', {}) else None
+        # the next links carry the query
+        params = None
+
+
+def convert_osm_vim(osm_vim: Dict) -> Dict:
+    return {
+        'vimAccountNfvoId': osm_vim['_id'],
+        'name': osm_vim['name'],
+        'type': osm_vim['vim_type'],
+        'uri': osm_vim['vim_url'],
+        'tenant': osm_vim['vim_tenant_name'],
+    }
+
+
 @_server_error
 def post_vim_safe(osm_vim: Dict, nfvo_self: str):
-    vim_found = get(f'{url}/vimAccounts/search/findByVimAccountNfvoId', params={'uuid': osm_vim['_id']},
-                    headers=accept_h)
+    vim_found = _session().get(f'{url}/vimAccounts/search/findByVimAccountNfvoId',
+                               params={'uuid': osm_vim['_id']}, headers=accept_h)
     vim_found.raise_for_status()
     if vim_found.json()['_embedded']['vimAccounts']:
         logger.info(f'vim {osm_vim["_id"]} found in iwf repository, skip')
     else:
-        payload = {
-            'vimAccountNfvoId': osm_vim['_id'],
-            'name': osm_vim['name'],
-            'type': osm_vim['vim_type'],
-            'uri': osm_vim['vim_url'],
-            'tenant': osm_vim['vim_tenant_name'],
-        }
-        new_vim = post(f'{url}/vimAccounts', json=payload, headers=accept_h)
-        new_vim.raise_for_status()
-        logger.info(f'created new vimAccount with id {new_vim.json()["vimAccountNfvoId"]}')
-        put(new_vim.json()['_links']['nfvOrchestrators']['href'], data=nfvo_self,
-            headers={**texturi_h, **accept_h}).raise_for_status()
-        logger.info(f'associated vimAccount to {nfvo_self}')
+        create_vim(convert_osm_vim(osm_vim), nfvo_self)
 
 
 @_server_error
-def find_nfvos_by_type(nfvo_type: str):
-    response = get(f'{url}/nfvOrchestrators/search/findByTypeIgnoreCase', params={'type': nfvo_type}, headers=accept_h)
-    response.raise_for_status()
-    return response.json()['_embedded']['nfvOrchestrators']
+def create_vim(payload: Dict, nfvo_self: str):
+    new_vim = _session().post(f'{url}/vimAccounts', json=payload, headers=accept_h)
+    new_vim.raise_for_status()
+    logger.info(f'created new vimAccount with id {new_vim.json()["vimAccountNfvoId"]}')
+    _session().put(new_vim.json()['_links']['nfvOrchestrators']['href'], data=nfvo_self,
+                   headers={**texturi_h, **accept_h}).raise_for_status()
+    logger.info(f'associated vimAccount to {nfvo_self}')
+
+
+@_server_error
+def update_vim(vim: Dict, payload: Dict):
+    _session().patch(vim['_links']['self']['href'], json=payload, headers=accept_h).raise_for_status()
+    logger.info(f'updated vimAccount with id {payload["vimAccountNfvoId"]}')
+
+
+@_server_error
+def delete_vim(vim: Dict):
+    _session().delete(vim['_links']['self']['href']).raise_for_status()
+    logger.info(f'deleted vimAccount with id {vim["vimAccountNfvoId"]}')
+
+
+def find_nfvos_by_type(nfvo_type: str) -> List[Dict]:
+    return list(iter_records('nfvOrchestrators', f'{url}/nfvOrchestrators/search/findByTypeIgnoreCase',
+                             {'type': nfvo_type}))
 
 
 @_server_error
 def _get_nfvo(nfvo_id) -> Dict:
     try:
-        resp = get(f'{url}/nfvOrchestrators/{nfvo_id}', headers=accept_h)
+        resp = _session().get(f'{url}/nfvOrchestrators/{nfvo_id}', headers=accept_h)
         resp.raise_for_status()
     except HTTPError as e:
         if e.response.status_code == 404:
@@ -98,7 +177,7 @@ def _get_nfvo(nfvo_id) -> Dict:
 @_server_error
 def _get_rano(rano_id) -> Dict:
     try:
-        resp = get(f'{url}/ranOrchestrators/{rano_id}', headers=accept_h)
+        resp = _session().get(f'{url}/ranOrchestrators/{rano_id}', headers=accept_h)
         resp.raise_for_status()
     except HTTPError as e:
         if e.response.status_code == 404:
@@ -112,22 +191,76 @@ def _get_rano(rano_id) -> Dict:
 
 @_server_error
 def _get_site(site_href: str):
-    resp = get(site_href, headers=accept_h)
+    resp = _session().get(site_href, headers=accept_h)
     resp.raise_for_status()
     return resp.json()
 
 
+def _get_site_pool() -> ThreadPoolExecutor:
+    global _site_pool
+    with _site_pool_lock:
+        if _site_pool is None:
+            _site_pool = ThreadPoolExecutor(max_workers=IWFREPO_FANOUT_WORKERS, thread_name_prefix='iwf-site')
+        return _site_pool
+
+
+def _inline_site_name(orc: Dict) -> Optional[str]:
+    """Return the site name embedded in orc by a projection of the repository, if any."""
+    site = orc.get('site') or orc.get('_embedded', {}).get('site')
+    if isinstance(site, dict):
+        return site.get('name')
+    return site if isinstance(site, str) else None
+
+
 @_server_error
-def _convert_nfvo(nfvo: Dict) -> Dict:
-    try:
-        site = _get_site(nfvo['_links']['site']['href'])['name']
-    except HTTPError:
-        site = None
+def _get_site_name(site_href: str) -> Optional[str]:
+    name = site_names.get(site_href)
+    if name is None:
+        try:
+            name = _get_site(site_href)['name']
+        except HTTPError:
+            return None
+        site_names.set(site_href, name)
+    return name
+
+
+def _resolve_site_names(orcs: List[Dict]) -> Dict[str, Optional[str]]:
+    """Return the site names of orcs by site href.
+
+    The href is the association link of each orchestrator, e.g.
+    /nfvOrchestrators/1/site, so orchestrators sharing a site are not
+    deduplicated: the href of the site itself is known only once read.
+    Embedded and cached sites cost no call, the others are read
+    concurrently, so a list costs one round trip more at most.
+    """
+    names = {}
+    missing = set()
+    for orc in orcs:
+        href = orc['_links']['site']['href']
+        name = _inline_site_name(orc)
+        if name is None:
+            name = site_names.get(href)
+        if name is None:
+            missing.add(href)
+        else:
+            site_names.set(href, name)
+            names[href] = name
+    if len(missing) > 1 and IWFREPO_FANOUT_WORKERS > 1:
+        missing = list(missing)
+        names.update(zip(missing, deadline.map_bound(_get_site_pool(), _get_site_name, missing)))
+    else:
+        names.update((href, _get_site_name(href)) for href in missing)
+    return names
+
+
+def _convert_nfvo(nfvo: Dict, site_names_by_href: Dict[str, Optional[str]] = None) -> Dict:
+    if site_names_by_href is None:
+        site_names_by_href = _resolve_site_names([nfvo])
     conv = {
         'id': nfvo['id'],
         'name': nfvo['name'],
         'type': nfvo['type'],
-        'site': site
+        'site': site_names_by_href.get(nfvo['_links']['site']['href'])
     }
     if nfvo['uri'] is not None:
         conv['uri'] = nfvo['uri']
@@ -138,17 +271,14 @@ def _convert_nfvo(nfvo: Dict) -> Dict:
     return conv
 
 
-@_server_error
-def _convert_rano(rano: Dict) -> Dict:
-    try:
-        site = _get_site(rano['_links']['site']['href'])['name']
-    except HTTPError:
-        site = None
+def _convert_rano(rano: Dict, site_names_by_href: Dict[str, Optional[str]] = None) -> Dict:
+    if site_names_by_href is None:
+        site_names_by_href = _resolve_site_names([rano])
     conv = {
         'id': rano['id'],
         'name': rano['name'],
         'type': rano['type'],
-        'site': site
+        'site': site_names_by_href.get(rano['_links']['site']['href'])
     }
     if rano['uri'] is not None:
         conv['uri'] = rano['uri']
@@ -156,17 +286,17 @@ def _convert_rano(rano: Dict) -> Dict:
 
 
 def convert_nfvo_cred(orc):
-    del orc['credentials']['id']
-    orc['credentials']['nfvo_id'] = orc['id']
-    orc['credentials']['user'] = orc['credentials'].pop('username')
-    return orc['credentials']
+    cred = {k: v for k, v in orc['credentials'].items() if k not in ('id', 'username')}
+    cred['nfvo_id'] = orc['id']
+    cred['user'] = orc['credentials']['username']
+    return cred
 
 
 def convert_rano_cred(orc):
-    del orc['credentials']['id']
-    orc['credentials']['rano_id'] = orc['id']
-    orc['credentials']['user'] = orc['credentials'].pop('username')
-    return orc['credentials']
+    cred = {k: v for k, v in orc['credentials'].items() if k not in ('id', 'username')}
+    cred['rano_id'] = orc['id']
+    cred['user'] = orc['credentials']['username']
+    return cred
 
 
 def get_nfvo_by_id(nfvo_id: int) -> Dict:
@@ -195,36 +325,22 @@ def get_rano_cred(rano_id: int) -> Dict:
         return convert_rano_cred(rano)
 
 
-@_server_error
 def get_nfvo_list() -> List[Dict]:
-    try:
-        resp = get(f'{url}/nfvOrchestrators', headers=accept_h)
-        resp.raise_for_status()
-    except HTTPError as e:
-        if e.response.status_code == 401:
-            raise Unauthorized()
-        else:
-            raise
-    return [_convert_nfvo(nfvo) for nfvo in resp.json()['_embedded']['nfvOrchestrators']]
+    nfvos = list(iter_records('nfvOrchestrators'))
+    names = _resolve_site_names(nfvos)
+    return [_convert_nfvo(nfvo, names) for nfvo in nfvos]
 
 
-@_server_error
 def get_rano_list() -> List[Dict]:
-    try:
-        resp = get(f'{url}/ranOrchestrators', headers=accept_h)
-        resp.raise_for_status()
-    except HTTPError as e:
-        if e.response.status_code == 401:
-            raise Unauthorized()
-        else:
-            raise
-    return [_convert_rano(rano) for rano in resp.json()['_embedded']['ranOrchestrators']]
+    ranos = list(iter_records('ranOrchestrators'))
+    names = _resolve_site_names(ranos)
+    return [_convert_rano(rano, names) for rano in ranos]
 
 
 @_server_error
 def get_subscription_list(nfvo_id: int) -> Dict:
     try:
-        resp = get(f'{url}/nfvOrchestrators/{nfvo_id}/subscriptions', headers=accept_h)
+        resp = _session().get(f'{url}/nfvOrchestrators/{nfvo_id}/subscriptions', headers=accept_h)
         resp.raise_for_status()
     except HTTPError as e:
         if e.response.status_code == 401:
@@ -236,14 +352,18 @@ def get_subscription_list(nfvo_id: int) -> Dict:
     return resp.json()
 
 
+def get_all_subscriptions() -> List[Dict]:
+    return list(iter_records('subscriptions'))
+
+
 @_server_error
 def create_subscription(nfvo_id: int, body: Dict):
     try:
-        create = post(f'{url}/subscriptions', json=body, headers=accept_h)
+        create = _session().post(f'{url}/subscriptions', json=body, headers=accept_h)
         create.raise_for_status()
-        associate = put(create.json()['_links']['nfvOrchestrators']['href'],
-                        data=f'{url}/nfvOrchestrators/{nfvo_id}',
-                        headers={**texturi_h, **accept_h})
+        associate = _session().put(create.json()['_links']['nfvOrchestrators']['href'],
+                                   data=f'{url}/nfvOrchestrators/{nfvo_id}',
+                                   headers={**texturi_h, **accept_h})
         associate.raise_for_status()
     except HTTPError as e:
         if e.response.status_code == 400:
@@ -260,7 +380,7 @@ def create_subscription(nfvo_id: int, body: Dict):
 @_server_error
 def get_subscription(nfvo_id: int, subscriptionId: int) -> Dict:
     try:
-        resp = get(f'{url}/nfvOrchestrators/{nfvo_id}/subscriptions/{subscriptionId}', headers=accept_h)
+        resp = _session().get(f'{url}/nfvOrchestrators/{nfvo_id}/subscriptions/{subscriptionId}', headers=accept_h)
         resp.raise_for_status()
     except HTTPError as e:
         if e.response.status_code == 404:
@@ -273,7 +393,7 @@ def get_subscription(nfvo_id: int, subscriptionId: int) -> Dict:
 @_server_error
 def delete_subscription(subscriptionId: int) -> None:
     try:
-        resp = delete(f'{url}/subscriptions/{subscriptionId}')
+        resp = _session().delete(f'{url}/subscriptions/{subscriptionId}')
         resp.raise_for_status()
     except HTTPError as e:
         if e.response.status_code == 404:
@@ -282,15 +402,9 @@ def delete_subscription(subscriptionId: int) -> None:
             raise
 
 
-@_server_error
 def search_subs_by_ns_instance(ns_instance_id: str) -> List[Dict]:
-    try:
-        subs = get(f'{url}/subscriptions/search/findByNsInstanceId', params={'nsInstanceId': ns_instance_id},
-                   headers=accept_h)
-        subs.raise_for_status()
-    except HTTPError:
-        raise
-    return subs.json()['_embedded']['subscriptions'] if subs else []
+    return list(iter_records('subscriptions', f'{url}/subscriptions/search/findByNsInstanceId',
+                             {'nsInstanceId': ns_instance_id}))
 
 
 def add_orc_cred_test(orc_type: str, orc_id: int):
@@ -304,32 +418,39 @@ def add_orc_cred_test(orc_type: str, orc_id: int):
         }
     }
     if orc_type == 'nfvo':
-        resp = patch(f'{url}/nfvOrchestrators/{orc_id}', json=payload, headers=accept_h)
+        resp = _session().patch(f'{url}/nfvOrchestrators/{orc_id}', json=payload, headers=accept_h)
     if orc_type == 'rano':
-        resp = patch(f'{url}/ranOrchestrators/{orc_id}', json=payload, headers=accept_h)
+        resp = _session().patch(f'{url}/ranOrchestrators/{orc_id}', json=payload, headers=accept_h)
     resp.raise_for_status()
 
 
 def add_network_test(json: Dict, site: int):
-    post_resp = post(f"{url}/networks", json=json)
+    post_resp = _session().post(f"{url}/networks", json=json)
     post_resp.raise_for_status()
-    put_resp = put(post_resp.json()["_links"]["site"]["href"],
-                   f"{url}/sites/{site}",
-                   headers={"Content-Type": "text/uri-list"})
+    put_resp = _session().put(post_resp.json()["_links"]["site"]["href"],
+                              f"{url}/sites/{site}",
+                              headers={"Content-Type": "text/uri-list"})
     put_resp.raise_for_status()
 
 
 @_server_error
-def get_site_network(vim_network_name: str, nfvo_id: int):
+def get_networks(site: Dict) -> List[Dict]:
+    resp = _session().get(site['_links']['networks']['href'], headers=accept_h)
+    resp.raise_for_status()
+    return resp.json()['_embedded']['networks']
+
+
+@_server_error
+def get_site_networks(nfvo_id: int) -> Tuple[str, List[Dict]]:
+    """Return the name and the networks of the site of the NFVO."""
     nfvo = _get_nfvo(nfvo_id)
     site = _get_site(nfvo['_links']['site']['href'])
-    try:
-        resp = get(site['_links']['networks']['href'], headers=accept_h)
-        resp.raise_for_status()
-    except HTTPError:
-        raise
-    networks = resp.json()['_embedded']['networks']
+    return site['name'], get_networks(site)
+
+
+def get_site_network(vim_network_name: str, nfvo_id: int):
+    site_name, networks = get_site_networks(nfvo_id)
     try:
         return next((n for n in networks if n['vim_network_name'] == vim_network_name))
     except StopIteration:
-        raise VimNetworkNotFound(vim_network_name, site['name'])
+        raise VimNetworkNotFound(vim_network_name, site_name)
@@ -17,10 +17,19 @@ from typing import List, Dict
 
 from flask_sqlalchemy import SQLAlchemy
 
-from adaptation_layer.error_handler import NfvoNotFound, RanoNotFound
+from adaptation_layer.error_handler import NfvoNotFound, RanoNotFound, \
+    SubscriptionNotFound, BadRequest, Unprocessable
+from adaptation_layer.subscription_filter import NOTIFICATION_TYPES, \
+    OPERATION_TYPES, OPERATION_STATES
 
 db = SQLAlchemy()
 
+# filter attributes of a subscription stored as SUBSCRIPTION_FILTER rows
+FILTER_ATTRIBUTES = {
+    'operationTypes': OPERATION_TYPES,
+    'operationStates': OPERATION_STATES
+}
+
 
 class NFVO(db.Model):
     id = db.Column('id', db.Integer, primary_key=True)
@@ -117,6 +126,59 @@ class RANO_CREDENTIALS(db.Model):
         }
 
 
+class SUBSCRIPTION(db.Model):
+    id = db.Column('id', db.Integer, primary_key=True)
+    nfvo_id = db.Column('nfvo_id', db.Integer, db.ForeignKey('NFVO.id'),
+                        nullable=False, index=True)
+    callback_uri = db.Column('callback_uri', db.String(256), nullable=False)
+    ns_instance_id = db.Column('ns_instance_id', db.String(128),
+                               nullable=False, index=True)
+    notification_types = db.relationship(
+        'SUBSCRIPTION_NOTIFICATION_TYPE', lazy='selectin',
+        cascade='all, delete-orphan')
+    filters = db.relationship(
+        'SUBSCRIPTION_FILTER', lazy='selectin', cascade='all, delete-orphan')
+
+    @property
+    def serialize(self):
+        """Return object data in serializeable format"""
+        sub = {
+            'id': self.id,
+            'callbackUri': self.callback_uri,
+            'nsInstanceId': self.ns_instance_id,
+            'notificationTypes': [t.notification_type
+                                  for t in self.notification_types]
+        }
+        for f in self.filters:
+            sub.setdefault(f.attribute, []).append(f.value)
+        return sub
+
+    def __init__(self, **kwargs):
+        super(SUBSCRIPTION, self).__init__(**kwargs)
+
+    def __repr__(self):
+        return '<SUBSCRIPTION {}>'.format(self.id)
+
+
+class SUBSCRIPTION_NOTIFICATION_TYPE(db.Model):
+    subscription_id = db.Column('subscription_id', db.Integer, db.ForeignKey(
+        'SUBSCRIPTION.id', ondelete='CASCADE'), primary_key=True)
+    notification_type = db.Column('notification_type', db.String(128),
+                                  primary_key=True)
+    # lookups by type join back to the subscription without touching the table
+    __table_args__ = (
+        db.Index('ix_SUBSCRIPTION_NOTIFICATION_TYPE_notification_type',
+                 'notification_type', 'subscription_id'),
+    )
+
+
+class SUBSCRIPTION_FILTER(db.Model):
+    subscription_id = db.Column('subscription_id', db.Integer, db.ForeignKey(
+        'SUBSCRIPTION.id', ondelete='CASCADE'), primary_key=True)
+    attribute = db.Column('attribute', db.String(128), primary_key=True)
+    value = db.Column('value', db.String(128), primary_key=True)
+
+
 def get_nfvo_by_id(nfvo_id: int) -> Dict:
     nfvo = NFVO.query.filter_by(id=nfvo_id).first()
     if nfvo is None:
@@ -154,20 +216,63 @@ def get_rano_cred(rano_id: int) -> Dict:
 
 
 def get_subscription_list(nfvo_id: int) -> Dict:
-    raise NotImplementedError("The method is not implemented")
+    get_nfvo_by_id(nfvo_id)
+    subs = SUBSCRIPTION.query.filter_by(nfvo_id=nfvo_id).all()
+    return {
+        '_embedded': {'subscriptions': [sub.serialize for sub in subs]},
+        '_links': {}
+    }
+
+
+def get_all_subscriptions() -> List[Dict]:
+    return [sub.serialize for sub in SUBSCRIPTION.query.all()]
+
+
+def _filter_values(body: Dict, attribute: str, accepted) -> List[str]:
+    values = body.get(attribute) or []
+    if not isinstance(values, list):
+        raise BadRequest(description='{} must be a list'.format(attribute))
+    unknown = [v for v in values if v not in accepted]
+    if unknown:
+        raise Unprocessable(description='Unknown {} {}'.format(attribute, unknown))
+    return sorted(set(values))
 
 
 def create_subscription(nfvo_id: int, body: Dict) -> Dict:
-    raise NotImplementedError("The method is not implemented")
+    """Store a subscription, every notification type is sent if none is given."""
+    get_nfvo_by_id(nfvo_id)
+    if not body or not body.get('callbackUri') or not body.get('nsInstanceId'):
+        raise BadRequest(description='callbackUri and nsInstanceId are required')
+    types = _filter_values(body, 'notificationTypes', NOTIFICATION_TYPES) or NOTIFICATION_TYPES
+    sub = SUBSCRIPTION(
+        nfvo_id=nfvo_id,
+        callback_uri=body['callbackUri'],
+        ns_instance_id=body['nsInstanceId'],
+        notification_types=[SUBSCRIPTION_NOTIFICATION_TYPE(notification_type=t)
+                            for t in types],
+        filters=[SUBSCRIPTION_FILTER(attribute=attribute, value=v)
+                 for attribute, accepted in FILTER_ATTRIBUTES.items()
+                 for v in _filter_values(body, attribute, accepted)])
+    db.session.add(sub)
+    db.session.commit()
+    return sub.serialize
 
 
 def get_subscription(nfvo_id: int, subscriptionId: int) -> Dict:
-    raise NotImplementedError("The method is not implemented")
+    sub = SUBSCRIPTION.query.filter_by(id=subscriptionId, nfvo_id=nfvo_id).first()
+    if sub is None:
+        raise SubscriptionNotFound(sub_id=subscriptionId)
+    return sub.serialize
 
 
 def delete_subscription(subscriptionId: int) -> None:
-    raise NotImplementedError("The method is not implemented")
+    sub = SUBSCRIPTION.query.filter_by(id=subscriptionId).first()
+    if sub is None:
+        raise SubscriptionNotFound(sub_id=subscriptionId)
+    db.session.delete(sub)
+    db.session.commit()
 
 
 def search_subs_by_ns_instance(ns_instance_id: str) -> List[Dict]:
-    raise NotImplementedError("The method is not implemented")
+    subs = SUBSCRIPTION.query.filter_by(ns_instance_id=ns_instance_id).all()
+    return [sub.serialize for sub in subs]
@@ -0,0 +1,85 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# module to read each backend resource once per API request
+
+import json
+import threading
+from contextlib import contextmanager
+from typing import Dict, Hashable, Optional
+
+from requests import Response
+
+_local = threading.local()
+
+
+class RequestCache(object):
+    """Successful GET responses of one API request, shared by its fan-out threads.
+
+    Any other method empties the cache, the resources read so far may have
+    changed. calls counts the requests actually sent to the backends.
+    """
+
+    def __init__(self):
+        self._responses: Dict[Hashable, Response] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hits = 0
+
+    @staticmethod
+    def key(url: str, params=None, headers=None) -> Hashable:
+        return (url, json.dumps(params, sort_keys=True, default=str),
+                tuple(sorted((headers or {}).items())))
+
+    def get(self, key: Hashable) -> Optional[Response]:
+        with self._lock:
+            resp = self._responses.get(key)
+            if resp is not None:
+                self.hits += 1
+            return resp
+
+    def sent(self, key: Optional[Hashable], resp: Response) -> None:
+        """Record resp, sent to a backend, key is None for methods other than GET."""
+        with self._lock:
+            self.calls += 1
+            if key is None:
+                self._responses.clear()
+            elif resp.ok:
+                self._responses[key] = resp
+
+
+def current() -> Optional[RequestCache]:
+    return getattr(_local, 'cache', None)
+
+
+def set_cache(cache: Optional[RequestCache]) -> None:
+    if cache is None and current() is not None:
+        _local.last = current()
+    _local.cache = cache
+
+
+def last() -> Optional[RequestCache]:
+    """Return the cache of the last request ended in this thread, e.g. to count its backend calls."""
+    return getattr(_local, 'last', None)
+
+
+@contextmanager
+def bound(cache: Optional[RequestCache]):
+    """Install cache in the running thread, e.g. a worker of a thread pool."""
+    previous = getattr(_local, 'cache', None)
+    _local.cache = cache
+    try:
+        yield cache
+    finally:
+        _local.cache = previous
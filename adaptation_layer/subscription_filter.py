@@ -0,0 +1,107 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# module to evaluate the SOL005 filters of subscriptions against notifications
+
+import hashlib
+import json
+import threading
+from typing import Dict, FrozenSet, List, Optional
+
+NOTIFICATION_TYPES = ('NsLcmOperationOccurrenceNotification',
+                      'NsIdentifierCreationNotification',
+                      'NsIdentifierDeletionNotification')
+OPERATION_TYPES = ('INSTANTIATE', 'SCALE', 'UPDATE', 'TERMINATE', 'HEAL')
+OPERATION_STATES = ('PROCESSING', 'COMPLETED', 'PARTIALLY_COMPLETED', 'FAILED_TEMP',
+                    'FAILED', 'ROLLING_BACK', 'ROLLED_BACK')
+# attributes of a subscription read by its filter
+FILTER_ATTRIBUTES = ('nsInstanceId', 'notificationTypes', 'operationTypes', 'operationStates', 'filter')
+# compiled filters kept by a worker, the cache is emptied when full
+CACHE_SIZE = 4096
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _values(*candidates) -> Optional[FrozenSet[str]]:
+    """Return the first attribute set, None if every candidate is empty."""
+    for candidate in candidates:
+        if candidate:
+            return frozenset([candidate] if isinstance(candidate, str) else candidate)
+    return None
+
+
+class SubscriptionFilter(object):
+    """The filter of a subscription, compiled once into sets of accepted values.
+
+    Attributes are read from the flat subscription, as stored by the
+    repositories, or from its SOL005 filter. An attribute absent from the
+    subscription accepts every value, an attribute absent from the
+    notification is not applied, e.g. operationTypes on
+    NsIdentifierCreationNotification. Checks run from the most selective
+    attribute, so most subscriptions are discarded by the first one.
+    """
+    __slots__ = ('ns_instance_ids', 'notification_types', 'operation_types', 'operation_states', '_checks')
+
+    def __init__(self, sub: Dict):
+        sub_filter = sub.get('filter') or {}
+        ns_filter = sub_filter.get('nsInstanceSubscriptionFilter') or {}
+        self.ns_instance_ids = _values(sub.get('nsInstanceId'), ns_filter.get('nsInstanceIds'))
+        self.notification_types = _values(sub.get('notificationTypes'), sub_filter.get('notificationTypes'))
+        self.operation_types = _values(sub.get('operationTypes'), sub_filter.get('operationTypes'))
+        self.operation_states = _values(sub.get('operationStates'), sub_filter.get('operationStates'))
+        checks = (('nsInstanceId', self.ns_instance_ids),
+                  ('operation', self.operation_types),
+                  ('operationState', self.operation_states),
+                  ('notificationType', self.notification_types))
+        self._checks = tuple((attr, values) for attr, values in checks if values is not None)
+
+    def matches(self, notification: Dict) -> bool:
+        for attr, values in self._checks:
+            value = notification.get(attr)
+            if value is not None and value not in values:
+                return False
+        return True
+
+
+def version(sub: Dict) -> str:
+    """Return a stamp of the filter of sub, changing with any of its attributes."""
+    attrs = {attr: sub.get(attr) for attr in FILTER_ATTRIBUTES}
+    return hashlib.sha1(json.dumps(attrs, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def compile_filter(sub: Dict) -> SubscriptionFilter:
+    """Return the compiled filter of sub.
+
+    Subscriptions stamped with their filterVersion, as the subscription index
+    stores them, are compiled once per version. Others are compiled each time.
+    """
+    filter_version = sub.get('filterVersion')
+    if filter_version is None:
+        return SubscriptionFilter(sub)
+    key = (sub['id'], filter_version)
+    with _cache_lock:
+        compiled = _cache.get(key)
+    if compiled is None:
+        compiled = SubscriptionFilter(sub)
+        with _cache_lock:
+            if len(_cache) >= CACHE_SIZE:
+                _cache.clear()
+            _cache[key] = compiled
+    return compiled
+
+
+def select(subs: List[Dict], notification: Dict) -> List[Dict]:
+    """Return the subscriptions in subs whose filter accepts notification."""
+    return [sub for sub in subs if compile_filter(sub).matches(notification)]
@@ -0,0 +1,131 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# module to index subscriptions by nsInstanceId and notification type
+
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from redis import RedisError
+
+from adaptation_layer import subscription_filter, transport
+
+logger = logging.getLogger('app.subscription_index')
+
+# seconds between two reconciliations of the index with the repository
+SUBS_RECONCILE_INTERVAL = int(os.getenv('SUBS_RECONCILE_INTERVAL')) if os.getenv('SUBS_RECONCILE_INTERVAL') else 300
+# TTL (seconds) of the index, lookups go to the repository if reconciliations stop
+READY_TTL = 3 * SUBS_RECONCILE_INTERVAL
+READY_KEY = 'subs_ready'
+# subscription id -> indexed subscription
+ALL_KEY = 'subs_all'
+FILTER_ATTRIBUTES = ('operationTypes', 'operationStates', 'filter')
+
+redis_client = transport.get_redis(7)
+
+
+def _type_key(ns_instance_id: str, notification_type: str) -> str:
+    return 'subs:{}:{}'.format(ns_instance_id, notification_type)
+
+
+def _entry(sub: Dict) -> Dict:
+    entry = {
+        'id': sub['id'],
+        'callbackUri': sub['callbackUri'],
+        'nsInstanceId': sub['nsInstanceId'],
+        'notificationTypes': sub['notificationTypes']
+    }
+    # evaluated by subscription_filter on the matched entries
+    for attr in FILTER_ATTRIBUTES:
+        if sub.get(attr):
+            entry[attr] = sub[attr]
+    # lets the workers reuse the filter compiled for a previous notification
+    entry['filterVersion'] = subscription_filter.version(entry)
+    return entry
+
+
+def _add(pipe, sub: Dict) -> None:
+    entry = _entry(sub)
+    s_entry = json.dumps(entry)
+    for notification_type in entry['notificationTypes']:
+        pipe.hset(_type_key(entry['nsInstanceId'], notification_type), entry['id'], s_entry)
+    pipe.hset(ALL_KEY, entry['id'], json.dumps(dict(entry, indexedAt=time.time())))
+
+
+def _remove(pipe, entry: Dict) -> None:
+    for notification_type in entry['notificationTypes']:
+        pipe.hdel(_type_key(entry['nsInstanceId'], notification_type), entry['id'])
+    pipe.hdel(ALL_KEY, entry['id'])
+
+
+def add(sub: Dict) -> None:
+    try:
+        pipe = redis_client.pipeline()
+        _add(pipe, sub)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning('cannot index subscription {}: {}'.format(sub['id'], str(e)))
+
+
+def remove(sub_id) -> None:
+    try:
+        s_entry = redis_client.hget(ALL_KEY, sub_id)
+        if s_entry:
+            pipe = redis_client.pipeline()
+            _remove(pipe, json.loads(s_entry))
+            pipe.execute()
+    except RedisError as e:
+        logger.warning('cannot remove subscription {} from index: {}'.format(sub_id, str(e)))
+
+
+def match(ns_instance_id: str, notification_type: str) -> Optional[List[Dict]]:
+    """Return the subscriptions to notify, None if the index is not usable."""
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.exists(READY_KEY)
+        pipe.hvals(_type_key(ns_instance_id, notification_type))
+        ready, s_entries = pipe.execute()
+    except RedisError as e:
+        logger.warning('subscription index not available: {}'.format(str(e)))
+        return None
+    if not ready:
+        return None
+    return [json.loads(s) for s in s_entries]
+
+
+def reconcile(subs: List[Dict], started: float) -> None:
+    """Align the index with subs, the subscriptions read from the repository at started.
+
+    Entries indexed after started are kept, the listing may predate them.
+    """
+    try:
+        indexed = redis_client.hgetall(ALL_KEY)
+        ids = {str(sub['id']) for sub in subs}
+        pipe = redis_client.pipeline()
+        removed = 0
+        for sub_id, s_entry in indexed.items():
+            entry = json.loads(s_entry)
+            if sub_id not in ids and entry['indexedAt'] < started:
+                _remove(pipe, entry)
+                removed += 1
+        for sub in subs:
+            _add(pipe, sub)
+        pipe.set(READY_KEY, started, ex=READY_TTL)
+        pipe.execute()
+        logger.info('subscription index reconciled: {} subscriptions, {} removed'.format(len(subs), removed))
+    except RedisError as e:
+        logger.error('cannot reconcile subscription index: {}'.format(str(e)))
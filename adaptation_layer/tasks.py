@@ -11,138 +11,385 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
+import hashlib
+import json
+import math
 import os
-from typing import Dict
-from urllib.error import HTTPError
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Dict, List
 
-import redis
 from celery import Celery
+from celery.signals import worker_ready, worker_shutdown
 from celery.utils.log import get_task_logger
-from requests import post, RequestException
+from flask import Flask
+from redis import RedisError
+from requests import HTTPError
+from sqlalchemy.exc import SQLAlchemyError
 
+from adaptation_layer import circuit_breaker, cluster, deadline, delivery, polling, subscription_filter, \
+    subscription_index, transport
+from adaptation_layer.config import Config
 from adaptation_layer.driver.osm import OSM
-from adaptation_layer.error_handler import ServerError, Error
-from adaptation_layer.repository import iwf_repository
+from adaptation_layer.error_handler import ServerError, Error, ServiceUnavailable, GatewayTimeout
+from adaptation_layer.repository import iwf_inventory, iwf_repository, sqlite
 
 IWFREPO = os.getenv('IWFREPO', 'false').lower()
 redis_host = os.getenv('REDIS_HOST') if os.getenv('REDIS_HOST') else 'redis'
 redis_port = int(os.getenv('REDIS_PORT')) if os.getenv('REDIS_PORT') else 6379
 # TTL for key in redis
 KEY_TTL = 21600  # 6 hours
+# OSMs polled concurrently by osm_notifications, VIM changes applied concurrently by post_osm_vims
+POLL_WORKERS = int(os.getenv('POLL_WORKERS')) if os.getenv('POLL_WORKERS') else 8
+# seconds a poll of one OSM may last, the OSM is not polled again in the meantime
+POLL_TIMEOUT = float(os.getenv('POLL_TIMEOUT')) if os.getenv('POLL_TIMEOUT') else 4
+# seconds the OSM list read by osm_notifications is reused
+OSM_LIST_TTL = 5
+# seconds re-read before the watermark of an OSM, covers operations entering a state
+# in the same second as the watermark and late writes on OSM side
+WATERMARK_OVERLAP = 10
 
 celery = Celery('tasks',
                 broker='redis://{0}:{1}/0'.format(redis_host, redis_port),
                 backend='redis://{0}:{1}/0'.format(redis_host, redis_port))
 
+celery.conf.beat_schedule = {
+    'add_retry_notifications': {
+        'task': 'adaptation_layer.tasks.retry_notifications',
+        'schedule': delivery.RETRY_INTERVAL
+    },
+    'add_reconcile_subscriptions': {
+        'task': 'adaptation_layer.tasks.reconcile_subscriptions',
+        'schedule': subscription_index.SUBS_RECONCILE_INTERVAL
+    }
+}
 if IWFREPO == 'true':
-    celery.conf.beat_schedule = {
+    celery.conf.beat_schedule.update({
+        'add_sync_inventory': {
+            'task': 'adaptation_layer.tasks.sync_inventory',
+            'schedule': iwf_inventory.INVENTORY_SYNC_INTERVAL
+        },
         'add_post_osm_vims_periodic': {
             'task': 'adaptation_layer.tasks.post_osm_vims',
             'schedule': iwf_repository.interval
         },
         'add_osm_notifications': {
             'task': 'adaptation_layer.tasks.osm_notifications',
-            'schedule': 5.0
+            'schedule': polling.POLL_MIN_INTERVAL
         }
-    }
+    })
 celery.conf.timezone = 'UTC'
+# every worker may run a beat, only the leader sends the due tasks
+celery.conf.beat_scheduler = 'adaptation_layer.cluster:LeaderScheduler'
+# a queue per worker, the shards of the orchestrators are sent to their owner
+celery.conf.worker_direct = True
 logger = get_task_logger(__name__)
 
-redis_client = redis.Redis(
-    host=redis_host, port=redis_port, db=1, decode_responses=True)
+redis_client = transport.get_redis(1)
+# created on first use, celery workers are forked after import
+_poll_pool = None
+_poll_pool_lock = threading.Lock()
+# application giving the sqlite repository its database session
+_sqlite_app = None
+# (expiry, OSM list) of the last read
+_osm_list = (0.0, [])
+
+
+def _get_poll_pool() -> ThreadPoolExecutor:
+    global _poll_pool
+    with _poll_pool_lock:
+        if _poll_pool is None:
+            _poll_pool = ThreadPoolExecutor(max_workers=POLL_WORKERS, thread_name_prefix='poll')
+        return _poll_pool
+
+
+@contextmanager
+def _subscriptions():
+    """Yield the repository storing subscriptions."""
+    global _sqlite_app
+    if IWFREPO == 'true':
+        yield iwf_repository
+        return
+    if _sqlite_app is None:
+        _sqlite_app = Flask(__name__)
+        _sqlite_app.config.from_object(Config)
+        sqlite.db.init_app(_sqlite_app)
+    with _sqlite_app.app_context():
+        yield sqlite
+
+
+def _get_vims_state(nfvo_id) -> Dict:
+    """Return the hash and the ids of the VIMs of the OSM at the last successful sync.
+
+    Reading renews the TTL, so only the state of OSMs no longer synced expires.
+    """
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.get('vims_{}'.format(nfvo_id))
+        pipe.expire('vims_{}'.format(nfvo_id), KEY_TTL)
+        state, renewed = pipe.execute()
+    except RedisError as e:
+        logger.warning(f'error with redis: {str(e)}')
+        return {}
+    return json.loads(state) if state else {}
+
+
+def _set_vims_state(nfvo_id, state: Dict):
+    try:
+        redis_client.setex('vims_{}'.format(nfvo_id), KEY_TTL, json.dumps(state))
+    except RedisError as e:
+        logger.warning(f'error with redis: {str(e)}')
+
+
+def _sync_vims(osm: Dict, vims: Dict[str, Dict], previous_ids: List[str], repo_vims: Dict[str, Dict]) -> bool:
+    """Apply to the repository the changes to the VIMs of an OSM, return True if all succeeded."""
+    nfvo_self = osm['_links']['self']['href']
+    changes = []
+    for vim_id, payload in vims.items():
+        repo_vim = repo_vims.get(vim_id)
+        if repo_vim is None:
+            changes.append((iwf_repository.create_vim, payload, nfvo_self))
+        elif any(repo_vim.get(k) != v for k, v in payload.items()):
+            changes.append((iwf_repository.update_vim, repo_vim, payload))
+    # VIMs removed from OSM since the last sync
+    for vim_id in set(previous_ids) - set(vims):
+        if vim_id in repo_vims:
+            changes.append((iwf_repository.delete_vim, repo_vims[vim_id]))
+    futures = [_get_poll_pool().submit(*change) for change in changes]
+    synced = True
+    for f in futures:
+        try:
+            f.result()
+        except (ServerError, GatewayTimeout, HTTPError) as e:
+            logger.error(f'error with iwf repository: {str(e)}')
+            synced = False
+    logger.info('OSM {0}: {1} VIM changes applied'.format(osm['id'], len(changes)))
+    return synced
+
+
+@celery.task
+def sync_inventory(full: bool = False):
+    try:
+        iwf_inventory.sync(full)
+    except (ServerError, GatewayTimeout, HTTPError, RedisError) as e:
+        logger.error(f'cannot sync inventory: {str(e)}')
 
 
 @celery.task
 def post_osm_vims():
-    osm_list = []
     try:
-        osm_list = iwf_repository.find_nfvos_by_type('osm')
-    except (ServerError, HTTPError) as e:
+        osm_list = iwf_inventory.find_nfvos_by_type('osm')
+    except (ServerError, GatewayTimeout, HTTPError) as e:
         logger.error(f'error with iwf repository: {str(e)}')
         logger.warning('skip post_osm_vims')
+        return
+    # read only if a VIM list changed
+    repo_vims = None
     for osm in osm_list:
-        osm_vims = []
-        if osm['credentials']:
-            try:
-                driver = OSM(iwf_repository.convert_nfvo_cred(osm))
-                osm_vims, headers = driver.get_vim_list()
-            except Error as e:
-                logger.error('error contacting OSM at {0}:{1}: {2}'.format(
-                    osm['credentials']['host'],
-                    osm['credentials']['port'],
-                    str(e)
-                ))
-                continue
-        for v in osm_vims:
+        if not osm['credentials']:
+            continue
+        try:
+            driver = circuit_breaker.guard(OSM(iwf_repository.convert_nfvo_cred(osm)), 'nfvo', osm['id'])
+            osm_vims, headers = driver.get_vim_list()
+        except ServiceUnavailable as e:
+            logger.info('skip OSM {0}: {1}'.format(osm['id'], str(e)))
+            continue
+        except Error as e:
+            logger.error('error contacting OSM at {0}:{1}: {2}'.format(
+                osm['credentials']['host'],
+                osm['credentials']['port'],
+                str(e)
+            ))
+            continue
+        vims = {v['_id']: iwf_repository.convert_osm_vim(v) for v in osm_vims}
+        vims_hash = hashlib.sha1(json.dumps(vims, sort_keys=True).encode()).hexdigest()
+        state = _get_vims_state(osm['id'])
+        if state.get('hash') == vims_hash:
+            logger.debug('VIMs of OSM {0} unchanged, skip'.format(osm['id']))
+            continue
+        if repo_vims is None:
             try:
-                iwf_repository.post_vim_safe(v, osm['_links']['self']['href'])
-            except (ServerError, HTTPError)as e:
+                repo_vims = {v['vimAccountNfvoId']: v for v in iwf_repository.iter_records('vimAccounts')}
+            except (ServerError, GatewayTimeout, HTTPError) as e:
                 logger.error(f'error with iwf repository: {str(e)}')
-                logger.warning(f'skip vim: {v}')
+                logger.warning('skip post_osm_vims')
+                return
+        if _sync_vims(osm, vims, state.get('ids', []), repo_vims):
+            _set_vims_state(osm['id'], {'hash': vims_hash, 'ids': list(vims)})
+
+
+@worker_ready.connect
+def join_cluster(sender, **kwargs):
+    cluster.start_heartbeat(sender.hostname)
+
+
+@worker_shutdown.connect
+def leave_cluster(sender, **kwargs):
+    cluster.stop_heartbeat(sender.hostname)
+
+
+def _get_osm_list() -> List[Dict]:
+    global _osm_list
+    expiry, osm_list = _osm_list
+    if time.monotonic() >= expiry:
+        osm_list = iwf_inventory.find_nfvos_by_type('osm')
+        _osm_list = (time.monotonic() + OSM_LIST_TTL, osm_list)
+    return osm_list
 
 
 @celery.task
 def osm_notifications():
-    osm_list = []
     try:
-        osm_list = iwf_repository.find_nfvos_by_type('osm')
-    except (ServerError, HTTPError)as e:
+        osm_list = _get_osm_list()
+    except (ServerError, GatewayTimeout, HTTPError)as e:
         logger.error(f'error with iwf repository: {str(e)}')
         logger.warning('skip osm notifications')
-    for osm in osm_list:
-        ops = []
-        if osm['credentials']:
-            try:
-                driver = OSM(iwf_repository.convert_nfvo_cred(osm))
-                ops, headers = driver.get_op_list({'args': {}})
-            except Error as e:
-                logger.error('error contacting OSM at {0}:{1}: {2}'.format(
-                    osm['credentials']['host'],
-                    osm['credentials']['port'],
-                    str(e)
-                ))
-                continue
-        for op in ops:
-            last_s = redis_client.get(op['id'])
-            logger.debug('last_s from redis: {}'.format(last_s))
-            if not last_s or last_s != op['operationState']:
-                logger.info('different op state, send notification')
-                logger.debug('{},{}'.format(last_s, op['operationState']))
-                redis_client.setex(op['id'], KEY_TTL, op['operationState'])
-                notify_payload = {
-                    "nsInstanceId": op['nsInstanceId'],
-                    "nsLcmOpOccId": op['id'],
-                    "operation": op['lcmOperationType'],
-                    "notificationType": "NsLcmOperationOccurrenceNotification",
-                    "timestamp": op['startTime'],
-                    "operationState": op['operationState']
-                }
-                logger.debug(notify_payload)
-                forward_notification.delay(notify_payload)
+        return
+    # each OSM has its own interval, see polling
+    due = set(polling.claim_due([osm['id'] for osm in osm_list], _poll_time(len(osm_list)) + 1))
+    osm_list = [osm for osm in osm_list if osm['id'] in due]
+    if not osm_list:
+        return
+    shards = cluster.shard(osm_list, lambda osm: osm['id'])
+    if shards is None:
+        logger.warning('live workers unknown, poll every OSM here')
+        poll_osm_shard(osm_list)
+        return
+    for node, shard in shards.items():
+        # a shard not taken before the next run is stale
+        poll_osm_shard.apply_async(args=[shard], queue=cluster.direct_queue(node),
+                                   expires=_poll_time(len(shard)) + 1)
+
+
+def _poll_time(count: int) -> float:
+    """Return the seconds needed to poll count OSMs, POLL_WORKERS at a time."""
+    return math.ceil(count / POLL_WORKERS) * POLL_TIMEOUT
 
 
 @celery.task
-def forward_notification(notification: Dict):
-    if IWFREPO == 'false':
-        logger.warning('iwf repository disabled, ignore notification')
-        return None
-    subs = []
-    try:
-        subs = iwf_repository.search_subs_by_ns_instance(notification['nsInstanceId'])
-    except (ServerError, HTTPError)as e:
-        logger.error(f'error with iwf repository: {str(e)}')
-        logger.warning('skip forward_notification')
+def poll_osm_shard(osm_list: List[Dict]):
+    # a slow OSM delays only its own poll, every poll ends within POLL_TIMEOUT of its start
+    futures = [_get_poll_pool().submit(_poll_osm, osm) for osm in osm_list]
+    timeout = _poll_time(len(osm_list))
+    done, not_done = wait(futures, timeout=timeout + 1)
+    for f in done:
+        if f.exception():
+            logger.error(f'error polling OSM: {str(f.exception())}')
+    if not_done:
+        logger.warning(f'{len(not_done)} OSM polls still running after {timeout}s')
+
+
+def _timestamp(sol_time: str) -> float:
+    fmt = '%Y-%m-%dT%H:%M:%S.%fZ' if '.' in sol_time else '%Y-%m-%dT%H:%M:%SZ'
+    return (datetime.strptime(sol_time, fmt) - datetime(1970, 1, 1)).total_seconds()
+
+
+def _get_watermark(nfvo_id) -> float:
+    """Return the time of the last operation state change seen on the OSM.
+
+    Without a watermark, start from the oldest state still remembered in redis.
+    """
+    watermark = redis_client.get('watermark_{}'.format(nfvo_id))
+    return float(watermark) if watermark else time.time() - KEY_TTL
+
+
+def _changed_ops(ops: List[Dict]) -> List[Dict]:
+    """Return the operations whose state differs from the one in redis, storing the new states.
+
+    Previous states are read with a single MGET and changes written with a single pipeline.
+    """
+    if not ops:
+        return []
+    last_states = redis_client.mget([op['id'] for op in ops])
+    changed = [op for op, last_s in zip(ops, last_states) if last_s != op['operationState']]
+    if changed:
+        pipe = redis_client.pipeline(transaction=False)
+        for op in changed:
+            pipe.setex(op['id'], KEY_TTL, op['operationState'])
+        pipe.execute()
+    return changed
+
+
+def _poll_osm(osm: Dict):
+    started = time.time()
+    if not osm['credentials']:
+        polling.record(osm['id'], started)
         return
+    watermark = _get_watermark(osm['id'])
+    since = watermark - WATERMARK_OVERLAP
+    # the deadline starts with the poll, not while it waits for a free pool thread
+    with deadline.bound(deadline.Deadline(POLL_TIMEOUT)):
+        try:
+            driver = circuit_breaker.guard(OSM(iwf_repository.convert_nfvo_cred(osm)), 'nfvo', osm['id'])
+            # operations still running change statusEnteredTime when they end
+            ops, headers = driver.get_op_list({'args': {'statusEnteredTime.gt': int(since)}})
+        except ServiceUnavailable as e:
+            logger.info('skip OSM {0}: {1}'.format(osm['id'], str(e)))
+            polling.record(osm['id'], started)
+            return
+        except Error as e:
+            logger.error('error contacting OSM at {0}:{1}: {2}'.format(
+                osm['credentials']['host'],
+                osm['credentials']['port'],
+                str(e)
+            ))
+            polling.record(osm['id'], started)
+            return
+    # filter again in case the NBI ignores the query
+    ops = [op for op in ops if _timestamp(op['stateEnteredTime']) > since]
+    changed = _changed_ops(ops)
+    for op in changed:
+        logger.info('different op state, send notification')
+        notify_payload = {
+            "nsInstanceId": op['nsInstanceId'],
+            "nsLcmOpOccId": op['id'],
+            "operation": op['lcmOperationType'],
+            "notificationType": "NsLcmOperationOccurrenceNotification",
+            "timestamp": op['startTime'],
+            "operationState": op['operationState']
+        }
+        logger.debug(notify_payload)
+        forward_notification.delay(notify_payload)
+    if ops:
+        watermark = max(watermark, max(_timestamp(op['stateEnteredTime']) for op in ops))
+        redis_client.setex('watermark_{}'.format(osm['id']), KEY_TTL, watermark)
+    polling.record(osm['id'], started, polling.update_active(osm['id'], changed), bool(changed))
+
+
+@celery.task
+def forward_notification(notification: Dict):
+    subs = subscription_index.match(notification['nsInstanceId'], notification['notificationType'])
+    if subs is None:
+        try:
+            with _subscriptions() as repository:
+                subs = repository.search_subs_by_ns_instance(notification['nsInstanceId'])
+        except (ServerError, GatewayTimeout, HTTPError, SQLAlchemyError)as e:
+            logger.error(f'error with subscription repository: {str(e)}')
+            logger.warning('skip forward_notification')
+            return
     if not subs:
         logger.warning('no subscriptions for nsInstanceId {0}'.format(
             notification['nsInstanceId']))
-    for s in subs:
-        try:
-            if notification['notificationType'] in s['notificationTypes']:
-                resp = post(s['callbackUri'], json=notification)
-                resp.raise_for_status()
-                logger.info(
-                    'Notification sent to {0}'.format(s['callbackUri']))
-        except RequestException as e:
-            logger.error(
-                'Cannot send notification to {0}: {1}'.format(s['callbackUri'], str(e)))
+    callbacks = [s['callbackUri'] for s in subscription_filter.select(subs, notification)]
+    delivery.deliver(callbacks, notification)
+
+
+@celery.task
+def retry_notifications():
+    delivery.retry_due()
+
+
+@celery.task
+def reconcile_subscriptions():
+    started = time.time()
+    try:
+        with _subscriptions() as repository:
+            subs = repository.get_all_subscriptions()
+    except (ServerError, GatewayTimeout, HTTPError, SQLAlchemyError)as e:
+        logger.error(f'error with subscription repository: {str(e)}')
+        logger.warning('skip reconcile_subscriptions')
+        return
+    subscription_index.reconcile(subs, started)
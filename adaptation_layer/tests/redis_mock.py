@@ -0,0 +1,416 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# redis clients for the tests: one with no server behind, to check that the
+# modules fail open, and an in-memory one covering the commands they use
+
+import fnmatch
+import threading
+import time
+import unittest
+import uuid
+
+import redis
+from redis.exceptions import LockError
+
+
+def dead_redis() -> redis.Redis:
+    """Return a client with no redis listening behind it."""
+    return redis.Redis(host='127.0.0.1', port=1)
+
+
+def use_redis(test: unittest.TestCase, client, *modules):
+    """Swap the redis_client of modules with client until the end of test.
+
+    The lua scripts of the modules are registered again on client and the
+    fail-open timers, if any, are reset.
+    """
+    for module in modules:
+        previous = module.redis_client
+        for name, value in list(vars(module).items()):
+            if getattr(value, 'registered_client', None) is previous:
+                setattr(module, name, client.register_script(value.script))
+                test.addCleanup(setattr, module, name, value)
+        module.redis_client = client
+        test.addCleanup(setattr, module, 'redis_client', previous)
+        if hasattr(module, '_redis_down_until'):
+            module._redis_down_until = 0.0
+            test.addCleanup(setattr, module, '_redis_down_until', 0.0)
+    return client
+
+
+def _str(value) -> str:
+    if isinstance(value, bytes):
+        return value.decode()
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _score(value) -> float:
+    value = _str(value)
+    if value in ('-inf', '+inf', 'inf'):
+        return float(value)
+    if value.startswith('('):
+        raise NotImplementedError('exclusive ranges')
+    return float(value)
+
+
+class _Pipeline(object):
+    """Commands queued and run in a row by execute, like a MULTI/EXEC block."""
+
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+
+    def __getattr__(self, name):
+        command = getattr(self._client, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((command, args, kwargs))
+            return self
+
+        return queue
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._commands = []
+
+    def execute(self):
+        with self._client._mutex:
+            commands, self._commands = self._commands, []
+            return [command(*args, **kwargs) for command, args, kwargs in commands]
+
+
+class _Script(object):
+
+    def __init__(self, client, script: str):
+        self.registered_client = client
+        self.script = script
+
+    def __call__(self, keys=(), args=(), client=None):
+        client = client or self.registered_client
+        with client._mutex:
+            return _scripts()[self.script](client, list(keys), [_str(a) for a in args])
+
+
+class _Lock(object):
+    """Lock held by setting name to a token of its own, like redis.lock.Lock."""
+
+    def __init__(self, client, name, timeout=None, blocking_timeout=None):
+        self._client = client
+        self.name = name
+        self.timeout = timeout
+        self.blocking_timeout = blocking_timeout
+        self.token = None
+
+    def acquire(self, blocking=True, blocking_timeout=None):
+        token = uuid.uuid4().hex
+        if blocking_timeout is None:
+            blocking_timeout = self.blocking_timeout
+        stop_at = None if blocking_timeout is None else time.time() + blocking_timeout
+        px = int(self.timeout * 1000) if self.timeout else None
+        while True:
+            if self._client.set(self.name, token, px=px, nx=True):
+                self.token = token
+                return True
+            if not blocking or (stop_at is not None and time.time() > stop_at):
+                return False
+            time.sleep(0.01)
+
+    def release(self):
+        token, self.token = self.token, None
+        with self._client._mutex:
+            if token is None or self._client.get(self.name) != token:
+                raise LockError('Cannot release a lock that is no longer owned')
+            self._client.delete(self.name)
+
+
+class MemoryRedis(object):
+    """In-memory redis with decoded responses, commands run atomically."""
+
+    def __init__(self):
+        self._mutex = threading.RLock()
+        self._data = {}
+        self._expires = {}
+
+    def _alive(self, name):
+        expires = self._expires.get(name)
+        if expires is not None and expires <= time.time():
+            del self._data[name]
+            del self._expires[name]
+        return self._data.get(name)
+
+    def _get(self, name, default):
+        with self._mutex:
+            value = self._alive(name)
+            if value is None:
+                value = default
+                self._data[name] = value
+            return value
+
+    def _cleanup(self, name):
+        if name in self._data and not self._data[name]:
+            self.delete(name)
+
+    def pipeline(self, transaction=True):
+        return _Pipeline(self)
+
+    def register_script(self, script: str):
+        return _Script(self, script)
+
+    def lock(self, name, timeout=None, blocking_timeout=None):
+        return _Lock(self, name, timeout, blocking_timeout)
+
+    def flushdb(self):
+        with self._mutex:
+            self._data.clear()
+            self._expires.clear()
+        return True
+
+    def keys(self, pattern='*'):
+        with self._mutex:
+            return [k for k in list(self._data) if self._alive(k) is not None and fnmatch.fnmatchcase(k, pattern)]
+
+    # keys
+
+    def delete(self, *names):
+        with self._mutex:
+            count = 0
+            for name in names:
+                if self._alive(name) is not None:
+                    count += 1
+                self._data.pop(name, None)
+                self._expires.pop(name, None)
+            return count
+
+    def exists(self, *names):
+        with self._mutex:
+            return sum(1 for name in names if self._alive(name) is not None)
+
+    def expire(self, name, time_s):
+        return self.pexpire(name, int(float(_str(time_s)) * 1000))
+
+    def pexpire(self, name, time_ms):
+        with self._mutex:
+            if self._alive(name) is None:
+                return False
+            self._expires[name] = time.time() + int(_str(time_ms)) / 1000.0
+            return True
+
+    def pttl(self, name):
+        with self._mutex:
+            if self._alive(name) is None:
+                return -2
+            if name not in self._expires:
+                return -1
+            return max(0, int((self._expires[name] - time.time()) * 1000))
+
+    def ttl(self, name):
+        pttl = self.pttl(name)
+        return pttl if pttl < 0 else int(round(pttl / 1000.0))
+
+    # strings
+
+    def get(self, name):
+        with self._mutex:
+            return self._alive(name)
+
+    def mget(self, keys, *args):
+        keys = list(keys) + list(args) if not isinstance(keys, str) else [keys] + list(args)
+        with self._mutex:
+            return [self._alive(k) for k in keys]
+
+    def set(self, name, value, ex=None, px=None, nx=False, xx=False):
+        with self._mutex:
+            exists = self._alive(name) is not None
+            if (nx and exists) or (xx and not exists):
+                return None
+            self._data[name] = _str(value)
+            self._expires.pop(name, None)
+            if ex is not None:
+                self.expire(name, ex)
+            elif px is not None:
+                self.pexpire(name, px)
+            return True
+
+    def setex(self, name, time_s, value):
+        return self.set(name, value, ex=time_s)
+
+    def incr(self, name, amount=1):
+        with self._mutex:
+            value = int(self._alive(name) or 0) + amount
+            self._data[name] = str(value)
+            return value
+
+    # hashes
+
+    def hget(self, name, key):
+        with self._mutex:
+            return (self._alive(name) or {}).get(_str(key))
+
+    def hmget(self, name, keys, *args):
+        keys = [keys] + list(args) if isinstance(keys, str) else list(keys) + list(args)
+        with self._mutex:
+            h = self._alive(name) or {}
+            return [h.get(_str(k)) for k in keys]
+
+    def hgetall(self, name):
+        with self._mutex:
+            return dict(self._alive(name) or {})
+
+    def hvals(self, name):
+        with self._mutex:
+            return list((self._alive(name) or {}).values())
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        with self._mutex:
+            h = self._get(name, {})
+            added = sum(1 for k in items if _str(k) not in h)
+            h.update({_str(k): _str(v) for k, v in items.items()})
+            return added
+
+    def hdel(self, name, *keys):
+        with self._mutex:
+            h = self._alive(name) or {}
+            count = sum(1 for k in keys if h.pop(_str(k), None) is not None)
+            self._cleanup(name)
+            return count
+
+    # sets
+
+    def sadd(self, name, *values):
+        with self._mutex:
+            s = self._get(name, set())
+            added = {_str(v) for v in values} - s
+            s.update(added)
+            return len(added)
+
+    def srem(self, name, *values):
+        with self._mutex:
+            s = self._alive(name) or set()
+            removed = {_str(v) for v in values} & s
+            s.difference_update(removed)
+            self._cleanup(name)
+            return len(removed)
+
+    def scard(self, name):
+        with self._mutex:
+            return len(self._alive(name) or set())
+
+    def smembers(self, name):
+        with self._mutex:
+            return set(self._alive(name) or set())
+
+    # sorted sets
+
+    def zadd(self, name, mapping, nx=False, xx=False):
+        with self._mutex:
+            z = self._get(name, {})
+            added = 0
+            for member, score in mapping.items():
+                member = _str(member)
+                if (nx and member in z) or (xx and member not in z):
+                    continue
+                added += member not in z
+                z[member] = float(score)
+            self._cleanup(name)
+            return added
+
+    def zrem(self, name, *values):
+        with self._mutex:
+            z = self._alive(name) or {}
+            count = sum(1 for v in values if z.pop(_str(v), None) is not None)
+            self._cleanup(name)
+            return count
+
+    def zcard(self, name):
+        with self._mutex:
+            return len(self._alive(name) or {})
+
+    def zrangebyscore(self, name, min, max, start=None, num=None, withscores=False):
+        with self._mutex:
+            low, high = _score(min), _score(max)
+            members = sorted(((s, m) for m, s in (self._alive(name) or {}).items() if low <= s <= high))
+            if start is not None:
+                members = members[start:] if num is None or num < 0 else members[start:start + num]
+            return [(m, s) for s, m in members] if withscores else [m for s, m in members]
+
+    def zremrangebyscore(self, name, min, max):
+        with self._mutex:
+            removed = self.zrangebyscore(name, min, max)
+            return self.zrem(name, *removed) if removed else 0
+
+
+# the lua scripts of the modules, ported to python
+
+
+def _bulkhead_acquire(r, keys, args):
+    r.zremrangebyscore(keys[0], '-inf', float(args[0]) - float(args[1]))
+    if r.zcard(keys[0]) < float(args[2]):
+        r.zadd(keys[0], {args[3]: args[0]})
+        r.expire(keys[0], args[1])
+        return 1
+    return 0
+
+
+def _cluster_acquire_lease(r, keys, args):
+    holder = r.get(keys[0])
+    if holder is None:
+        r.set(keys[0], args[0], px=args[1])
+        return 1
+    if holder == args[0]:
+        r.pexpire(keys[0], args[1])
+        return 1
+    return 0
+
+
+def _polling_record(r, keys, args):
+    now, min_interval = float(args[0]), float(args[4])
+    interval = float(r.hget(keys[0], 'interval') or min_interval)
+    woken_at = float(r.hget(keys[0], 'wokenAt') or 0)
+    if float(args[2]) > 0 or args[3] == '1' or woken_at >= float(args[1]):
+        interval = min_interval
+    else:
+        interval = min(interval * 2, float(args[5]))
+    r.hset(keys[0], mapping={'interval': interval, 'next': now + interval, 'lastPoll': now,
+                             'active': args[2], 'claimedUntil': 0})
+    return _str(interval)
+
+
+def _delivery_pop_due(r, keys, args):
+    due = r.zrangebyscore(keys[0], '-inf', args[0], start=0, num=int(args[1]))
+    for member in due:
+        r.zrem(keys[0], member)
+    return due
+
+
+_ports = {}
+
+
+def _scripts():
+    if not _ports:
+        from adaptation_layer import bulkhead, cluster, delivery, polling
+        _ports.update({
+            bulkhead._ACQUIRE.script: _bulkhead_acquire,
+            cluster._ACQUIRE_LEASE.script: _cluster_acquire_lease,
+            polling._RECORD.script: _polling_record,
+            delivery._POP_DUE.script: _delivery_pop_due
+        })
+    return _ports
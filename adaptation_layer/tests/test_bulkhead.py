@@ -0,0 +1,125 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import socket
+import time
+import unittest
+
+from adaptation_layer import bulkhead, create_app, transport
+from adaptation_layer.error_handler import ServiceUnavailable
+from .redis_mock import MemoryRedis, dead_redis, use_redis
+
+
+class BulkheadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # bulkheads must let requests through
+        use_redis(self, dead_redis(), bulkhead)
+
+    def test_parse_limits(self):
+        self.assertEqual(bulkhead._parse_limits('nfvo:1=2, rano:1=1,'), {'nfvo:1': 2, 'rano:1': 1})
+        self.assertEqual(bulkhead._parse_limits(''), {})
+
+    def test_limit_override(self):
+        bulkhead._limits['nfvo:42'] = 1
+        try:
+            self.assertEqual(bulkhead.get_limit('nfvo', 42), 1)
+            self.assertEqual(bulkhead.get_limit('nfvo', 43), bulkhead.BULKHEAD_LIMIT)
+        finally:
+            del bulkhead._limits['nfvo:42']
+
+    def test_fail_open_without_redis(self):
+        with bulkhead.slot('nfvo', 1) as taken:
+            self.assertIsNone(taken)
+        self.assertGreater(bulkhead._redis_down_until, 0)
+
+
+class BulkheadUnreachableRedisTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # packets to this address are dropped, connecting hangs until the timeout
+        self.addCleanup(setattr, transport, 'redis_host', transport.redis_host)
+        transport.redis_host = '10.255.255.1'
+        use_redis(self, transport.get_redis(5), bulkhead)
+
+    def test_fail_open_quickly(self):
+        start = time.time()
+        with bulkhead.slot('nfvo', 1) as taken:
+            self.assertIsNone(taken)
+        self.assertLess(time.time() - start, transport.REDIS_CONNECT_TIMEOUT + 0.5)
+        self.assertGreater(bulkhead._redis_down_until, 0)
+
+
+class BulkheadSilentRedisTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # connections are queued by the listening socket but never answered
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(8)
+        self.addCleanup(server.close)
+        for name in ('redis_host', 'redis_port', 'REDIS_TIMEOUT'):
+            self.addCleanup(setattr, transport, name, getattr(transport, name))
+        transport.redis_host, transport.redis_port = server.getsockname()
+        transport.REDIS_TIMEOUT = 0.2
+        use_redis(self, transport.get_redis(5), bulkhead)
+
+    def test_fail_open_quickly(self):
+        start = time.time()
+        with bulkhead.slot('nfvo', 1) as taken:
+            self.assertIsNone(taken)
+        self.assertLess(time.time() - start, 1)
+
+
+class BulkheadLimitTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = use_redis(self, MemoryRedis(), bulkhead)
+        self.slots = [bulkhead.acquire('nfvo', 'test') for i in range(bulkhead.BULKHEAD_LIMIT)]
+
+    def test_limit(self):
+        self.assertTrue(all(self.slots))
+        self.assertEqual(bulkhead.BULKHEAD_LIMIT, self.redis.zcard('bulkhead:nfvo:test'))
+        with self.assertRaises(ServiceUnavailable) as ctx:
+            bulkhead.acquire('nfvo', 'test', wait=0.1)
+        self.assertEqual(1, ctx.exception.retry_after)
+        # other orchestrators have their own slots
+        self.assertIsNotNone(bulkhead.acquire('nfvo', 'other', wait=0))
+
+    def test_release(self):
+        bulkhead.release(self.slots.pop())
+        self.assertIsNotNone(bulkhead.acquire('nfvo', 'test', wait=0))
+
+    def test_slot_released_on_error(self):
+        bulkhead.release(self.slots.pop())
+        with self.assertRaises(ValueError):
+            with bulkhead.slot('nfvo', 'test'):
+                raise ValueError()
+        self.assertIsNotNone(bulkhead.acquire('nfvo', 'test', wait=0))
+
+    def test_slot_expiry(self):
+        # the slots of a crashed worker are reclaimed after SLOT_TTL
+        ttl = bulkhead.SLOT_TTL
+        self.addCleanup(setattr, bulkhead, 'SLOT_TTL', ttl)
+        bulkhead.SLOT_TTL = 0.2
+        time.sleep(0.3)
+        self.assertIsNotNone(bulkhead.acquire('nfvo', 'test', wait=0))
+
+    def test_retry_after(self):
+        res = create_app().test_client().get('/nfvo/test/ns_instances')
+        self.assertEqual(503, res.status_code)
+        self.assertEqual('1', res.headers['Retry-After'])
+
+
+if __name__ == '__main__':
+    unittest.main()
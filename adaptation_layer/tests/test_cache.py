@@ -0,0 +1,172 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import adaptation_layer.driver.manager as manager
+import adaptation_layer.driver.osm as osm
+from adaptation_layer import create_app
+from adaptation_layer.cache import TTLCache
+from .redis_mock import MemoryRedis
+
+
+class CountingDB(object):
+    """Inventory double counting the lookups done to build a driver."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_nfvo_by_id(self, nfvo_id):
+        self.calls += 1
+        return {'id': nfvo_id, 'type': 'OSM'}
+
+    def get_nfvo_cred(self, nfvo_id):
+        self.calls += 1
+        return {'nfvo_id': nfvo_id, 'host': 'localhost', 'user': 'admin',
+                'password': 'admin', 'project': 'admin'}
+
+
+class VersionedDB(CountingDB):
+    """Replicated inventory telling the version of the credentials."""
+
+    version = '1'
+
+    def driver_version(self, orc_type, orc_id):
+        return self.version
+
+
+class TTLCacheTestCase(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(1, cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+
+    def test_ttl_expiry(self):
+        cache = TTLCache(maxsize=2, ttl=0.05)
+        cache.set('a', 1)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(0, len(cache))
+
+    def test_stats(self):
+        cache = TTLCache()
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('b')
+        stats = cache.stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(0.5, stats['hitRate'])
+
+
+class DriverCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        manager.invalidate_driver()
+
+    def test_get_driver_skips_inventory_on_hit(self):
+        db = CountingDB()
+        first = manager.get_driver('nfvo', 1, db)
+        second = manager.get_driver('nfvo', '1', db)
+        self.assertIs(first, second)
+        self.assertEqual(2, db.calls)
+
+    def test_invalidate_driver(self):
+        db = CountingDB()
+        first = manager.get_driver('nfvo', 1, db)
+        manager.invalidate_driver('nfvo', 1)
+        second = manager.get_driver('nfvo', 1, db)
+        self.assertIsNot(first, second)
+        self.assertEqual(4, db.calls)
+
+    def test_credentials_change(self):
+        db = VersionedDB()
+        first = manager.get_driver('nfvo', 1, db)
+        self.assertIs(first, manager.get_driver('nfvo', 1, db))
+        db.version = '2'
+        self.assertIsNot(first, manager.get_driver('nfvo', 1, db))
+        self.assertEqual(4, db.calls)
+
+    def test_stats(self):
+        before = manager.driver_cache_stats()
+        db = CountingDB()
+        manager.get_driver('nfvo', 1, db)
+        manager.get_driver('nfvo', 1, db)
+        res = create_app().test_client().get('/stats/drivers')
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(1, res.json['size'])
+        self.assertEqual(before['hits'] + 1, res.json['hits'])
+        self.assertEqual(before['misses'] + 1, res.json['misses'])
+
+
+class VnfPkgCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.driver = osm.OSM({'nfvo_id': 1, 'host': 'localhost', 'user': 'admin',
+                               'password': 'admin', 'project': 'admin'})
+        self.fetches = 0
+
+        def get_vnfpkg(vnfPkgId, args=None):
+            self.fetches += 1
+            return {'vdu': [{'id': 'vdu1', 'interface': [
+                {'name': 'eth0', 'external-connection-point-ref': 'mgmt'}]}]}, {}
+
+        self.driver._get_vnfpkg = get_vnfpkg
+        self.addCleanup(osm.vnfpkg_cache.pop, osm._vnfpkg_key(1, 'pkg'))
+
+    def test_no_refetch_on_hit(self):
+        vnfpkg, cp_index = self.driver._get_vnfpkg_cached('pkg')
+        self.assertEqual({('vdu1', 'eth0'): 'mgmt'}, cp_index)
+        self.assertIs(vnfpkg, self.driver._get_vnfpkg_cached('pkg')[0])
+        self.assertEqual(1, self.fetches)
+
+    def test_notification_invalidates(self):
+        self.driver._get_vnfpkg_cached('pkg')
+        res = create_app().test_client().post('/nfvo/1/notifications', json={
+            'notificationType': 'VnfPackageChangeNotification', 'vnfPkgId': 'pkg'})
+        self.assertEqual(204, res.status_code)
+        self.driver._get_vnfpkg_cached('pkg')
+        self.assertEqual(2, self.fetches)
+
+    def test_redis_stats(self):
+        self.addCleanup(setattr, osm, 'vnfpkg_redis_client', osm.vnfpkg_redis_client)
+        osm.vnfpkg_redis_client = MemoryRedis()
+        osm._redis_set_vnfpkg('hit', {})
+        before = osm.vnfpkg_cache_stats()
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(osm._redis_get_vnfpkg, ['hit', 'miss'] * 500))
+        after = osm.vnfpkg_cache_stats()
+        self.assertEqual(500, after['redisHits'] - before['redisHits'])
+        self.assertEqual(500, after['redisMisses'] - before['redisMisses'])
+
+    def test_notification_without_package(self):
+        res = create_app().test_client().post('/nfvo/1/notifications', json={
+            'notificationType': 'VnfPackageChangeNotification'})
+        self.assertEqual(400, res.status_code)
+
+    def test_stats(self):
+        key = osm._vnfpkg_key('1', 'pkg')
+        osm.vnfpkg_cache.set(key, ({}, {}))
+        self.addCleanup(osm.vnfpkg_cache.pop, key)
+        res = create_app().test_client().get('/stats/vnfpkg-cache')
+        self.assertEqual(200, res.status_code)
+        self.assertGreaterEqual(res.json['size'], 1)
+        self.assertIn('hitRate', res.json)
@@ -0,0 +1,160 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import time
+import unittest
+
+import adaptation_layer.driver.manager as manager
+from adaptation_layer import bulkhead, circuit_breaker, create_app
+from adaptation_layer.error_handler import NsNotFound, ServerError, ServiceUnavailable
+from .redis_mock import MemoryRedis, dead_redis, use_redis
+
+
+class FlakyDriver(object):
+
+    def __init__(self):
+        self.calls = 0
+        self._nfvoId = 1
+
+    def get_ns_list(self, args=None):
+        self.calls += 1
+        raise ServerError('connection refused')
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # breakers must let calls through
+        use_redis(self, dead_redis(), circuit_breaker)
+
+    def test_fail_open_without_redis(self):
+        driver = FlakyDriver()
+        guarded = circuit_breaker.GuardedDriver(driver, circuit_breaker.CircuitBreaker('nfvo:test', failures=1))
+        for i in range(3):
+            self.assertRaises(ServerError, guarded.get_ns_list)
+        self.assertEqual(driver.calls, 3)
+
+    def test_open_rejects_locally(self):
+        driver = FlakyDriver()
+        breaker = circuit_breaker.CircuitBreaker('nfvo:test', reset_timeout=30)
+        breaker._open_until = time.monotonic() + 30
+        guarded = circuit_breaker.GuardedDriver(driver, breaker)
+        with self.assertRaises(ServiceUnavailable) as ctx:
+            guarded.get_ns_list()
+        self.assertEqual(driver.calls, 0)
+        self.assertGreaterEqual(ctx.exception.retry_after, 29)
+
+    def test_private_attributes_pass_through(self):
+        guarded = circuit_breaker.guard(FlakyDriver(), 'nfvo', 1)
+        self.assertEqual(guarded._nfvoId, 1)
+
+    def test_breaker_per_orchestrator(self):
+        self.assertIs(circuit_breaker.get_breaker('nfvo', 1), circuit_breaker.get_breaker('nfvo', '1'))
+        self.assertIsNot(circuit_breaker.get_breaker('nfvo', 1), circuit_breaker.get_breaker('nfvo', 2))
+
+
+class CircuitStateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = use_redis(self, MemoryRedis(), circuit_breaker)
+        self.driver = FlakyDriver()
+        self.breaker = circuit_breaker.CircuitBreaker('nfvo:test', failures=2, reset_timeout=30)
+
+    def _open(self):
+        for i in range(2):
+            self.assertRaises(ServerError, self.breaker.call, self.driver.get_ns_list)
+
+    def _half_open(self):
+        # the open state expired, the failures are still counted
+        self._open()
+        self.redis.delete('breaker:nfvo:test:open')
+        self.breaker._open_until = 0.0
+
+    def test_opens_after_failures(self):
+        self._open()
+        self.assertEqual(2, self.driver.calls)
+        with self.assertRaises(ServiceUnavailable) as ctx:
+            self.breaker.call(self.driver.get_ns_list)
+        self.assertEqual(2, self.driver.calls)
+        self.assertGreaterEqual(ctx.exception.retry_after, 29)
+        self.assertIn('circuit open', ctx.exception.description)
+
+    def test_open_shared_among_workers(self):
+        self._open()
+        other = circuit_breaker.CircuitBreaker('nfvo:test', failures=2, reset_timeout=30)
+        with self.assertRaises(ServiceUnavailable) as ctx:
+            other.call(self.driver.get_ns_list)
+        self.assertGreater(ctx.exception.retry_after, 0)
+        self.assertEqual(2, self.driver.calls)
+
+    def test_single_probe(self):
+        self._half_open()
+        other = circuit_breaker.CircuitBreaker('nfvo:test', failures=2, reset_timeout=30)
+
+        def probe():
+            # the probe is in flight, the other workers keep waiting
+            with self.assertRaises(ServiceUnavailable) as ctx:
+                other.call(self.driver.get_ns_list)
+            self.assertEqual(1, ctx.exception.retry_after)
+            return 'ok'
+
+        self.assertEqual('ok', self.breaker.call(probe))
+        self.assertEqual(2, self.driver.calls)
+
+    def test_probe_success_closes(self):
+        self._half_open()
+        self.breaker.call(lambda: None)
+        self.assertEqual(0, self.redis.exists('breaker:nfvo:test:failures', 'breaker:nfvo:test:probe'))
+        # closed again, failures are counted from zero
+        self.assertRaises(ServerError, self.breaker.call, self.driver.get_ns_list)
+        self.assertIsNone(self.breaker.call(lambda: None))
+
+    def test_client_error_closes(self):
+        self._half_open()
+
+        def not_found():
+            raise NsNotFound(ns_id='test')
+
+        self.assertRaises(NsNotFound, self.breaker.call, not_found)
+        self.assertEqual(0, self.redis.exists('breaker:nfvo:test:failures'))
+
+    def test_probe_failure_reopens(self):
+        self._half_open()
+        self.assertRaises(ServerError, self.breaker.call, self.driver.get_ns_list)
+        self.assertGreater(self.redis.pttl('breaker:nfvo:test:open'), 0)
+        self.assertEqual(0, self.redis.exists('breaker:nfvo:test:probe'))
+        self.assertRaises(ServiceUnavailable, self.breaker.call, self.driver.get_ns_list)
+
+
+class CircuitOpenRouteTestCase(unittest.TestCase):
+
+    def setUp(self):
+        use_redis(self, MemoryRedis(), circuit_breaker, bulkhead)
+        self.driver = FlakyDriver()
+        circuit_breaker._breakers.pop('nfvo:test', None)
+        manager._drivers.set(('nfvo', 'test'), (None, circuit_breaker.guard(self.driver, 'nfvo', 'test')))
+        self.addCleanup(manager.invalidate_driver, 'nfvo', 'test')
+        self.addCleanup(circuit_breaker._breakers.pop, 'nfvo:test', None)
+        self.client = create_app().test_client()
+
+    def test_retry_after(self):
+        for i in range(circuit_breaker.BREAKER_FAILURES):
+            self.assertEqual(500, self.client.get('/nfvo/test/ns_instances').status_code)
+        res = self.client.get('/nfvo/test/ns_instances')
+        self.assertEqual(503, res.status_code)
+        self.assertGreaterEqual(int(res.headers['Retry-After']), 1)
+        self.assertEqual(circuit_breaker.BREAKER_FAILURES, self.driver.calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import time
+import unittest
+
+from adaptation_layer import cluster
+from .redis_mock import MemoryRedis, dead_redis, use_redis
+
+
+class HashRingTestCase(unittest.TestCase):
+    nodes = ['celery@w1', 'celery@w2', 'celery@w3']
+    keys = range(1000)
+
+    def test_every_node_owns_keys(self):
+        ring = cluster.HashRing(self.nodes)
+        owners = [ring.owner(k) for k in self.keys]
+        for node in self.nodes:
+            # 64 points per node keep each shard near a third of the keys
+            self.assertGreater(owners.count(node), 200)
+
+    def test_owner_is_stable(self):
+        self.assertEqual([cluster.HashRing(self.nodes).owner(k) for k in self.keys],
+                         [cluster.HashRing(list(reversed(self.nodes))).owner(k) for k in self.keys])
+
+    def test_joining_node_moves_only_its_keys(self):
+        before = cluster.HashRing(self.nodes)
+        after = cluster.HashRing(self.nodes + ['celery@w4'])
+        for k in self.keys:
+            if after.owner(k) != 'celery@w4':
+                self.assertEqual(after.owner(k), before.owner(k))
+
+
+class ClusterWithoutRedisTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # coordination must fail open
+        use_redis(self, dead_redis(), cluster)
+
+    def test_every_process_leads(self):
+        self.assertTrue(cluster.is_leader('beat'))
+
+    def test_run_once_runs(self):
+        self.assertTrue(cluster.run_once('startup_tasks', 1))
+
+    def test_shard_unknown(self):
+        self.assertIsNone(cluster.shard([{'id': 1}], lambda osm: osm['id']))
+
+
+class ClusterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = use_redis(self, MemoryRedis(), cluster)
+
+    def test_leader_lease(self):
+        self.assertTrue(cluster.is_leader('beat', 0.2))
+        # renewed by the holder
+        self.assertTrue(cluster.is_leader('beat', 0.2))
+        self.assertEqual(cluster.identity(), self.redis.get('cluster:leader:beat'))
+
+    def test_lease_held_by_other(self):
+        self.redis.set('cluster:leader:beat', 'other', px=200)
+        self.assertFalse(cluster.is_leader('beat'))
+        time.sleep(0.3)
+        # the other beat stopped renewing
+        self.assertTrue(cluster.is_leader('beat'))
+
+    def test_run_once(self):
+        self.assertTrue(cluster.run_once('startup_tasks', 1))
+        self.assertFalse(cluster.run_once('startup_tasks', 1))
+
+    def test_shard(self):
+        osm_list = [{'id': i} for i in range(50)]
+        for node in ('celery@w2', 'celery@w1'):
+            cluster.heartbeat(node)
+        self.assertEqual(['celery@w1', 'celery@w2'], cluster.members())
+        shards = cluster.shard(osm_list, lambda osm: osm['id'])
+        self.assertEqual({'celery@w1', 'celery@w2'}, set(shards))
+        ring = cluster.HashRing(['celery@w1', 'celery@w2'])
+        for node, shard in shards.items():
+            self.assertTrue(all(ring.owner(osm['id']) == node for osm in shard))
+        self.assertEqual(osm_list, sorted(sum(shards.values(), []), key=lambda osm: osm['id']))
+
+    def test_leaving_and_dead_workers(self):
+        osm_list = [{'id': i} for i in range(10)]
+        cluster.heartbeat('celery@w1')
+        cluster.heartbeat('celery@w2')
+        self.redis.zadd(cluster.MEMBERS_KEY, {'celery@dead': time.time() - cluster.MEMBER_TTL - 1})
+        cluster.stop_heartbeat('celery@w2')
+        self.assertEqual({'celery@w1': osm_list}, cluster.shard(osm_list, lambda osm: osm['id']))
+
+    def test_no_workers(self):
+        self.assertIsNone(cluster.shard([{'id': 1}], lambda osm: osm['id']))
+
+
+if __name__ == '__main__':
+    unittest.main()
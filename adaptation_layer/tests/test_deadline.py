@@ -0,0 +1,120 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from requests import Timeout
+
+from adaptation_layer import deadline, request_cache, transport
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _SlowHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        time.sleep(1)
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DeadlineTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        deadline.set_deadline(None)
+
+    def test_default_timeout(self):
+        self.assertEqual(deadline.timeout(),
+                         (deadline.HTTP_CONNECT_TIMEOUT, deadline.HTTP_READ_TIMEOUT))
+
+    def test_remaining_budget(self):
+        deadline.set_deadline(deadline.Deadline(2))
+        connect, read = deadline.timeout()
+        self.assertLessEqual(connect, 2)
+        self.assertLessEqual(read, 2)
+        self.assertGreater(read, 1)
+
+    def test_expired(self):
+        deadline.set_deadline(deadline.Deadline(0))
+        self.assertRaises(deadline.DeadlineExceeded, deadline.timeout)
+
+    def test_bound(self):
+        outer = deadline.Deadline(10)
+        deadline.set_deadline(outer)
+        with deadline.bound(deadline.Deadline(1)) as inner:
+            self.assertIs(deadline.current(), inner)
+        self.assertIs(deadline.current(), outer)
+
+    def test_thread_local(self):
+        deadline.set_deadline(deadline.Deadline(10))
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(deadline.current()))
+        thread.start()
+        thread.join()
+        self.assertEqual(seen, [None])
+
+    def test_map_bound(self):
+        current = deadline.Deadline(10)
+        cache = request_cache.RequestCache()
+        deadline.set_deadline(current)
+        request_cache.set_cache(cache)
+        self.addCleanup(request_cache.set_cache, None)
+
+        def seen(i):
+            return i, deadline.current(), request_cache.current()
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            self.assertEqual([(i, current, cache) for i in range(4)], list(deadline.map_bound(pool, seen, range(4))))
+            self.assertEqual((0, current, cache), deadline.submit_bound(pool, seen, 0).result())
+            # the pool threads are left as they were
+            self.assertEqual((0, None, None), pool.submit(seen, 0).result())
+
+
+class SessionDeadlineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = _Server(('127.0.0.1', 0), _SlowHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_port)
+
+    def tearDown(self):
+        deadline.set_deadline(None)
+        self.server.shutdown()
+        self.server.server_close()
+        transport.close_all()
+
+    def test_read_bounded_by_deadline(self):
+        deadline.set_deadline(deadline.Deadline(0.2))
+        start = time.monotonic()
+        self.assertRaises(Timeout, transport.get_session(self.url).get, self.url)
+        self.assertLess(time.monotonic() - start, 0.9)
+
+    def test_explicit_timeout(self):
+        deadline.set_deadline(deadline.Deadline(0.2))
+        resp = transport.get_session(self.url).get(self.url, timeout=5)
+        self.assertEqual(resp.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
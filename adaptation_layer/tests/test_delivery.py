@@ -0,0 +1,138 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from adaptation_layer import circuit_breaker, delivery, transport
+from adaptation_layer.error_handler import BadRequest, GatewayTimeout, ServerError, ServiceUnavailable
+from .redis_mock import MemoryRedis, dead_redis, use_redis
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _CallbackHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    codes = {'/ok': 204, '/slow': 204, '/fail': 500, '/reject': 400}
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        if self.path == '/slow':
+            time.sleep(0.5)
+        self.send_response(self.codes[self.path])
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DeliveryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = _Server(('127.0.0.1', 0), _CallbackHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        # retries are logged and dropped
+        use_redis(self, dead_redis(), circuit_breaker, delivery)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        transport.close_all()
+
+    def test_post_errors(self):
+        delivery._post(self.url + '/ok', {})
+        self.assertRaises(ServerError, delivery._post, self.url + '/fail', {})
+        self.assertRaises(BadRequest, delivery._post, self.url + '/reject', {})
+        timeout = delivery.DELIVERY_TIMEOUT
+        delivery.DELIVERY_TIMEOUT = 0.1
+        try:
+            self.assertRaises(GatewayTimeout, delivery._post, self.url + '/slow', {})
+        finally:
+            delivery.DELIVERY_TIMEOUT = timeout
+
+    def test_deliver(self):
+        sent = delivery.deliver([self.url + '/ok', self.url + '/fail', self.url + '/reject'], {'id': 1})
+        self.assertEqual(sent, [True, False, False])
+
+    def test_slow_callbacks_run_concurrently(self):
+        start = time.monotonic()
+        sent = delivery.deliver([self.url + '/slow'] * 4, {'id': 1})
+        self.assertEqual(sent, [True] * 4)
+        self.assertLess(time.monotonic() - start, 1.5)
+
+
+class RetryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = _Server(('127.0.0.1', 0), _CallbackHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.netloc = '127.0.0.1:{}'.format(self.server.server_port)
+        self.redis = use_redis(self, MemoryRedis(), circuit_breaker, delivery)
+        self.addCleanup(circuit_breaker._breakers.pop, 'callback:' + self.netloc, None)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        transport.close_all()
+
+    def _due(self):
+        # move every scheduled retry to now
+        retries = self.redis.zrangebyscore(delivery.RETRY_KEY, '-inf', '+inf')
+        self.redis.zadd(delivery.RETRY_KEY, {member: 0 for member in retries})
+        return len(retries)
+
+    def test_retry_scheduled(self):
+        self.assertEqual([False], delivery.deliver([self.url + '/fail'], {'id': 1}))
+        self.assertEqual(0, delivery.retry_due())
+        self.assertEqual(1, self._due())
+        self.assertEqual(1, delivery.retry_due())
+        # the retry failed again, a later attempt is scheduled
+        retry = delivery._POP_DUE(keys=[delivery.RETRY_KEY], args=['+inf', 10])
+        self.assertEqual(2, json.loads(retry[0])['attempt'])
+
+    def test_rejected_not_retried(self):
+        delivery.deliver([self.url + '/reject'], {'id': 1})
+        self.assertEqual(0, self._due())
+
+    def test_circuit_open(self):
+        for i in range(circuit_breaker.BREAKER_FAILURES):
+            delivery.deliver([self.url + '/fail'], {'id': 1})
+        breaker = circuit_breaker.get_breaker('callback', self.netloc)
+        with self.assertRaises(ServiceUnavailable) as ctx:
+            breaker.call(delivery._post, self.url + '/ok', {})
+        self.assertEqual('Callback {} is unavailable, circuit open.'.format(self.netloc), ctx.exception.description)
+        # the rejected delivery is retried once the circuit may close
+        self.assertEqual([False], delivery.deliver([self.url + '/ok'], {'id': 1}))
+        self.assertEqual(circuit_breaker.BREAKER_FAILURES + 1, self._due())
+
+    def test_breakers_disabled(self):
+        failures = circuit_breaker.BREAKER_FAILURES
+        self.addCleanup(setattr, circuit_breaker, 'BREAKER_FAILURES', failures)
+        circuit_breaker.BREAKER_FAILURES = 0
+        for i in range(failures + 1):
+            delivery.deliver([self.url + '/fail'], {'id': 1})
+        self.assertEqual([True], delivery.deliver([self.url + '/ok'], {'id': 1}))
+        self.assertEqual(0, self.redis.exists('breaker:callback:{}:failures'.format(self.netloc)))
+
+
+if __name__ == '__main__':
+    unittest.main()
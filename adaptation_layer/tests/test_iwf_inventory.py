@@ -0,0 +1,195 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from adaptation_layer import transport
+from adaptation_layer.error_handler import ServerError
+from adaptation_layer.repository import iwf_inventory, iwf_repository
+from .redis_mock import MemoryRedis, dead_redis, use_redis
+
+
+class InventoryWithoutRedisTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # no iwf repository listening here either
+        use_redis(self, dead_redis(), iwf_inventory)
+        self.url = iwf_repository.url
+        iwf_repository.url = 'http://127.0.0.1:1'
+
+    def tearDown(self):
+        iwf_repository.url = self.url
+
+    def test_version_unknown(self):
+        self.assertIsNone(iwf_inventory.driver_version('nfvo', 1))
+
+    def test_read_through(self):
+        # the repository is read when the replica is not available
+        self.assertRaises(ServerError, iwf_inventory.get_nfvo_by_id, 1)
+        self.assertRaises(ServerError, iwf_inventory.get_nfvo_list)
+        self.assertRaises(ServerError, iwf_inventory.get_site_networks, 1)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _RepositoryHandler(BaseHTTPRequestHandler):
+    """IWF repository with the NFVOs in nfvos, all in the same site."""
+    nfvos = {}
+    calls = []
+
+    def _href(self, path):
+        return 'http://127.0.0.1:{}{}'.format(self.server.server_port, path)
+
+    def _nfvo(self, nfvo_id):
+        return dict(self.nfvos[nfvo_id], id=nfvo_id, _links={
+            'self': {'href': self._href('/nfvOrchestrators/{}'.format(nfvo_id))},
+            'site': {'href': self._href('/nfvOrchestrators/{}/site'.format(nfvo_id))}})
+
+    def do_GET(self):
+        self.calls.append(self.path)
+        site = {'name': 'TURIN', '_links': {'self': {'href': self._href('/sites/1')},
+                                            'networks': {'href': self._href('/sites/1/networks')}}}
+        path = self.path.split('?')[0]
+        if path == '/nfvOrchestrators':
+            body = {'_embedded': {'nfvOrchestrators': [self._nfvo(i) for i in sorted(self.nfvos)]}, '_links': {}}
+        elif path == '/ranOrchestrators':
+            body = {'_embedded': {'ranOrchestrators': []}, '_links': {}}
+        elif path == '/sites':
+            body = {'_embedded': {'sites': [site]}, '_links': {}}
+        elif path.endswith('/site'):
+            body = site
+        elif path == '/sites/1/networks':
+            body = {'_embedded': {'networks': [{'vim_network_name': 'ext', 'floating_ip': True}]}}
+        elif path.startswith('/nfvOrchestrators/') and int(path.split('/')[2]) in self.nfvos:
+            body = self._nfvo(int(path.split('/')[2]))
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class InventoryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = use_redis(self, MemoryRedis(), iwf_inventory)
+        _RepositoryHandler.nfvos = {i: {
+            'name': 'osm{}'.format(i), 'type': 'OSM', 'uri': None, 'createdAt': None, 'updatedAt': None,
+            'credentials': {'id': i, 'host': '127.0.0.1', 'port': 9999, 'username': 'admin',
+                            'password': 'admin', 'project': 'admin'}} for i in (1, 2, 3)}
+        self.calls = _RepositoryHandler.calls = []
+        self.server = _Server(('127.0.0.1', 0), _RepositoryHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = iwf_repository.url
+        iwf_repository.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        iwf_inventory.sync()
+        del self.calls[:]
+
+    def tearDown(self):
+        iwf_repository.url = self.url
+        self.server.shutdown()
+        self.server.server_close()
+        transport.close_all()
+
+    def test_served_from_replica(self):
+        self.assertEqual('TURIN', iwf_inventory.get_nfvo_by_id(2)['site'])
+        self.assertEqual('admin', iwf_inventory.get_nfvo_cred(2)['user'])
+        self.assertEqual([1, 2, 3], [nfvo['id'] for nfvo in iwf_inventory.get_nfvo_list()])
+        self.assertEqual([1, 2, 3], [nfvo['id'] for nfvo in iwf_inventory.find_nfvos_by_type('osm')])
+        self.assertTrue(iwf_inventory.get_site_network('ext', 3)['floating_ip'])
+        self.assertEqual([], self.calls)
+
+    def test_delta_sync(self):
+        iwf_inventory.sync()
+        # the sites of unchanged orchestrators are not read again
+        self.assertEqual(['/nfvOrchestrators', '/ranOrchestrators', '/sites', '/sites/1/networks'],
+                         sorted(self.calls))
+
+    def test_versions(self):
+        version = iwf_inventory.driver_version('nfvo', 2)
+        self.assertIsNotNone(version)
+        _RepositoryHandler.nfvos[1]['name'] = 'renamed'
+        iwf_inventory.sync()
+        self.assertEqual('renamed', iwf_inventory.get_nfvo_by_id(1)['name'])
+        # a new name does not rebuild the drivers, new credentials do
+        self.assertEqual(version, iwf_inventory.driver_version('nfvo', 2))
+        _RepositoryHandler.nfvos[2]['credentials']['password'] = 'changed'
+        iwf_inventory.sync()
+        self.assertNotEqual(version, iwf_inventory.driver_version('nfvo', 2))
+        self.assertEqual('changed', iwf_inventory.get_nfvo_cred(2)['password'])
+
+    def test_removed(self):
+        del _RepositoryHandler.nfvos[3]
+        iwf_inventory.sync()
+        self.assertEqual([1, 2], [nfvo['id'] for nfvo in iwf_inventory.get_nfvo_list()])
+        self.assertIsNone(iwf_inventory.driver_version('nfvo', 3))
+        self.assertIsNone(self.redis.hget(iwf_inventory.NETWORKS_KEY, 3))
+
+    def test_read_through(self):
+        self.redis.hdel(iwf_inventory._key('nfvo'), 2)
+        self.assertEqual('osm2', iwf_inventory.get_nfvo_by_id(2)['name'])
+        self.assertEqual(['/nfvOrchestrators/2', '/nfvOrchestrators/2/site'], self.calls)
+        # stored back in the replica
+        iwf_inventory.get_nfvo_by_id(2)
+        self.assertEqual(2, len(self.calls))
+
+    def test_stale_replica(self):
+        self.redis.delete(iwf_inventory.SYNCED_KEY)
+        self.assertEqual(3, len(iwf_inventory.get_nfvo_list()))
+        self.assertIn('/nfvOrchestrators', self.calls)
+
+
+class RecordsWithoutRepositoryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.url = iwf_repository.url
+        iwf_repository.url = 'http://127.0.0.1:1'
+
+    def tearDown(self):
+        iwf_repository.url = self.url
+
+    def test_lazy_pages(self):
+        # nothing is read before the first record is needed
+        records = iwf_repository.iter_records('nfvOrchestrators')
+        self.assertRaises(ServerError, next, records)
+
+
+class ConvertCredentialsTestCase(unittest.TestCase):
+
+    def test_record_unchanged(self):
+        nfvo = {'id': 1, 'credentials': {'id': 3, 'host': '127.0.0.1', 'port': 9999,
+                                         'username': 'admin', 'password': 'admin', 'project': 'admin'}}
+        expected = {'nfvo_id': 1, 'host': '127.0.0.1', 'port': 9999,
+                    'user': 'admin', 'password': 'admin', 'project': 'admin'}
+        self.assertEqual(expected, iwf_repository.convert_nfvo_cred(nfvo))
+        # converted again, e.g. by the next poll of a cached OSM list
+        self.assertEqual(expected, iwf_repository.convert_nfvo_cred(nfvo))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,7 +20,7 @@ from adaptation_layer.repository.iwf_repository import get_nfvo_by_id, \
     get_rano_list, create_subscription, delete_subscription, get_subscription, \
     get_subscription_list, \
     search_subs_by_ns_instance, find_nfvos_by_type, post_vim_safe, \
-    get_site_network, add_network_test
+    get_site_network, add_network_test, site_names
 
 
 class TestIwfRepository(unittest.TestCase):
@@ -96,6 +96,13 @@ class TestIwfRepository(unittest.TestCase):
         length = len(get_rano_list())
         self.assertEqual(1, length)
 
+    def test_get_nfvo_list_sites(self):
+        site_names.clear()
+        nfvo = next(n for n in get_nfvo_list() if n['id'] == self.nfvo_id)
+        self.assertEqual(get_nfvo_by_id(self.nfvo_id)['site'], nfvo['site'])
+        # cached sites are the same as the ones read once
+        self.assertEqual(nfvo, next(n for n in get_nfvo_list() if n['id'] == self.nfvo_id))
+
     def test_get_subscription(self):
         sub = get_subscription(self.nfvo_id, self.sub_id)
         expected = {'_links': {'lccnSubscription': {'href': 'http://localhost:8087/subscriptions/19'},
@@ -14,13 +14,19 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import random
+import threading
+import time
 import unittest
-from urllib.parse import urlparse
+from urllib.parse import parse_qs, urlparse
 
 from jsonschema import validate
 from jsonschema.exceptions import ValidationError, SchemaError
 
 from adaptation_layer import create_app
+from adaptation_layer.driver import osm
+from adaptation_layer.driver.osm import OSM
+from .redis_mock import MemoryRedis, use_redis
 from .request_mock import mock_ns, mock_ns_scale
 from .response_schemas import ns_lcm_op_occ_schema, ns_list_schema, ns_schema, \
     ns_lcm_op_occ_list_schema
@@ -222,5 +228,136 @@ class OSMTestCase(unittest.TestCase):
         self.assertEqual(401, res.status_code)
 
 
+class OSMCpIndexTestCase(unittest.TestCase):
+
+    def test_cp_index(self):
+        vnfpkg = {'vdu': [
+            {'id': 'vdu1', 'interface': [
+                {'name': 'eth0', 'external-connection-point-ref': 'mgmt'},
+                {'name': 'eth1', 'internal-connection-point-ref': 'data'},
+                {'name': 'eth0', 'external-connection-point-ref': 'dup'}]},
+            {'id': 'vdu2', 'interface': [{'name': 'eth0'}]}]}
+        self.assertEqual({('vdu1', 'eth0'): 'mgmt', ('vdu1', 'eth1'): 'data'},
+                         OSM._cp_index(vnfpkg))
+
+
+class _Response(object):
+
+    def __init__(self, body):
+        self.body = body
+        self.headers = {'content-type': 'application/json'}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+
+class _Session(object):
+    """OSM session stub recording the GETs, VNF records are looked up by NS id."""
+
+    def __init__(self, ns_list, vnfs):
+        self.ns_list = ns_list
+        self.vnfs = vnfs
+        self.urls = []
+
+    def post(self, url, **kwargs):
+        return _Response({'id': 'token', 'expires': 4102444800})
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        url = urlparse(url)
+        if url.path.endswith('/nslcm/v1/ns_instances'):
+            return _Response(self.ns_list)
+        ns_ids = parse_qs(url.query)['nsr-id-ref'][0].split(',')
+        return _Response([vnf for vnf in self.vnfs if vnf['nsr-id-ref'] in ns_ids])
+
+    def vnf_queries(self):
+        return [parse_qs(urlparse(url).query)['nsr-id-ref'][0]
+                for url in self.urls if '/nslcm/v1/vnf_instances' in url]
+
+
+def _osm_ns(ns_id, vnf_ids):
+    return {'id': ns_id, 'name': ns_id, 'description': '', 'nsd-ref': 'nsd',
+            '_admin': {'nsState': 'NOT_INSTANTIATED'}, 'constituent-vnfr-ref': vnf_ids}
+
+
+def _osm_vnf(vnf_id, ns_id):
+    return {'id': vnf_id, 'nsr-id-ref': ns_id, 'vnfd-ref': 'vnfd', 'vim-account-id': 'vim'}
+
+
+class OSMVnfsByNsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        use_redis(self, MemoryRedis(), osm)
+        self.driver = OSM({'nfvo_id': 'vnfs_by_ns', 'host': 'osm', 'port': 9999, 'user': 'admin',
+                           'password': 'admin', 'project': 'admin'})
+        ns_list = [_osm_ns('a', ['a1', 'a2']), _osm_ns('b', ['b1']), _osm_ns('c', [])]
+        vnfs = [_osm_vnf('a1', 'a'), _osm_vnf('a2', 'a'), _osm_vnf('b1', 'b')]
+        self.session = self.driver._session = _Session(ns_list, vnfs)
+
+    def test_one_query_per_page(self):
+        sol_ns_list, headers = self.driver.get_ns_list()
+        # NSs without VNFs are left out of the query
+        self.assertEqual(['a,b'], self.session.vnf_queries())
+        self.assertEqual({'a': ['a1', 'a2'], 'b': ['b1'], 'c': []},
+                         {ns['id']: [vnf['id'] for vnf in ns['vnfInstance']] for ns in sol_ns_list})
+
+    def test_missing_vnf_skipped(self):
+        self.session.vnfs.pop()
+        sol_ns_list, headers = self.driver.get_ns_list()
+        self.assertEqual([], sol_ns_list[1]['vnfInstance'])
+
+    def test_chunked_query(self):
+        self.addCleanup(setattr, osm, 'NS_IDS_PER_QUERY', osm.NS_IDS_PER_QUERY)
+        osm.NS_IDS_PER_QUERY = 1
+        vnfs = self.driver._get_vnfs_by_ns(self.session.ns_list)
+        self.assertEqual(['a', 'b'], self.session.vnf_queries())
+        self.assertEqual(['a1', 'a2', 'b1'], sorted(vnfs))
+
+
+class OSMFanoutTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, osm, 'OSM_FANOUT_WORKERS', osm.OSM_FANOUT_WORKERS)
+        osm.OSM_FANOUT_WORKERS = 3
+        self.driver = OSM({'nfvo_id': 'fanout', 'host': 'osm', 'user': 'admin', 'password': 'admin',
+                           'project': 'admin'})
+        self.addCleanup(osm._fanout_pools.pop, 'fanout', None)
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def _call(self, item):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(random.uniform(0.001, 0.02))
+        with self.lock:
+            self.running -= 1
+        return item * 2
+
+    def test_order_and_cap(self):
+        items = list(range(30))
+        self.assertEqual([i * 2 for i in items], self.driver._map_concurrent(self._call, items))
+        self.assertEqual(3, self.max_running)
+
+    def test_cap_shared_by_requests(self):
+        # concurrent requests towards the same NFVO share its pool
+        threads = [threading.Thread(target=self.driver._map_concurrent, args=(self._call, list(range(10))))
+                   for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(3, self.max_running)
+
+    def test_disabled(self):
+        osm.OSM_FANOUT_WORKERS = 1
+        self.assertEqual([0, 2, 4], self.driver._map_concurrent(self._call, [0, 1, 2]))
+        self.assertEqual(1, self.max_running)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,138 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import time
+import unittest
+
+from adaptation_layer import circuit_breaker, create_app, deadline, polling, tasks
+from adaptation_layer.error_handler import ServiceUnavailable
+from .redis_mock import MemoryRedis, dead_redis, use_redis
+
+
+class PollingWithoutRedisTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = create_app().test_client
+
+    def setUp(self):
+        # every NFVO is polled at the fastest pace
+        use_redis(self, dead_redis(), polling)
+
+    def test_every_nfvo_due(self):
+        self.assertEqual(polling.claim_due([1, 2], 5), [1, 2])
+
+    def test_record_fast(self):
+        self.assertEqual(polling.record(1, time.time()), polling.POLL_MIN_INTERVAL)
+
+    def test_wake(self):
+        polling.wake(1)
+
+    def test_no_active_operations(self):
+        self.assertEqual(0, polling.update_active(1, [{'id': 'op', 'operationState': 'PROCESSING'}]))
+
+    def test_stats_unavailable(self):
+        self.assertRaises(ServiceUnavailable, polling.stats)
+        res = self.client().get('/stats/polling')
+        self.assertEqual(503, res.status_code)
+
+
+class PollingTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = create_app().test_client
+
+    def setUp(self):
+        self.redis = use_redis(self, MemoryRedis(), polling)
+
+    def _record(self, active=0, changed=False):
+        return polling.record(1, time.time() - 0.1, active, changed)
+
+    def test_backoff(self):
+        intervals = [self._record() for i in range(8)]
+        self.assertEqual([min(polling.POLL_MIN_INTERVAL * 2 ** i, polling.POLL_MAX_INTERVAL) for i in range(1, 9)],
+                         intervals)
+        self.assertEqual([], polling.claim_due([1], 5))
+
+    def test_fast_while_active(self):
+        self._record()
+        self._record()
+        self.assertEqual(polling.POLL_MIN_INTERVAL, self._record(active=1))
+        self.assertEqual(2 * polling.POLL_MIN_INTERVAL, self._record())
+        self.assertEqual(polling.POLL_MIN_INTERVAL, self._record(changed=True))
+
+    def test_wake(self):
+        for i in range(4):
+            self._record()
+        polling.wake(1)
+        self.assertEqual([1], polling.claim_due([1, 2], 5)[:1])
+        # the poll started before the wake up may have missed its changes
+        self.assertEqual(polling.POLL_MIN_INTERVAL, self._record())
+
+    def test_claim(self):
+        self.assertEqual([1, 2], polling.claim_due([1, 2], 5))
+        # claimed until recorded or hold expires
+        self.assertEqual([], polling.claim_due([1, 2], 5))
+        polling.record(2, time.time(), 1)
+        time.sleep(polling.POLL_MIN_INTERVAL)
+        self.assertEqual([2], polling.claim_due([1, 2], 5))
+
+    def test_update_active(self):
+        ops = [{'id': 'op1', 'operationState': 'PROCESSING'}, {'id': 'op2', 'operationState': 'ROLLING_BACK'}]
+        self.assertEqual(2, polling.update_active(1, ops))
+        self.assertEqual(1, polling.update_active(1, [{'id': 'op1', 'operationState': 'COMPLETED'}]))
+        self.assertEqual(1, polling.update_active(1, []))
+
+    def test_stats(self):
+        polling.claim_due([1], 5)
+        self._record()
+        res = self.client().get('/stats/polling')
+        self.assertEqual(200, res.status_code)
+        self.assertEqual('1', res.json[0]['nfvoId'])
+        self.assertEqual(2 * polling.POLL_MIN_INTERVAL, res.json[0]['interval'])
+
+
+class PollDeadlineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        use_redis(self, MemoryRedis(), tasks, polling, circuit_breaker)
+        timeout = tasks.POLL_TIMEOUT
+        self.addCleanup(setattr, tasks, 'POLL_TIMEOUT', timeout)
+        tasks.POLL_TIMEOUT = 0.3
+        self.addCleanup(setattr, tasks, 'OSM', tasks.OSM)
+        remaining = self.remaining = []
+
+        class SlowOSM(object):
+
+            def __init__(self, cred):
+                self._nfvoId = cred['nfvo_id']
+
+            def get_op_list(self, args=None):
+                remaining.append(deadline.current().remaining())
+                time.sleep(0.2)
+                return [], {}
+
+        tasks.OSM = SlowOSM
+
+    def test_deadline_per_poll(self):
+        # the polls queued for a pool thread get the whole POLL_TIMEOUT too
+        osm_list = [{'id': 'poll-{}'.format(i), 'credentials': {'username': 'admin'}}
+                    for i in range(tasks.POLL_WORKERS + 1)]
+        tasks.poll_osm_shard(osm_list)
+        self.assertEqual(len(osm_list), len(self.remaining))
+        self.assertGreater(min(self.remaining), 0.25)
+
+
+if __name__ == '__main__':
+    unittest.main()
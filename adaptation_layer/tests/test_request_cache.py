@@ -0,0 +1,108 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from adaptation_layer import create_app, request_cache, transport
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def _reply(self, code):
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        self._reply(404 if self.path == '/missing' else 200)
+
+    def do_POST(self):
+        self._reply(201)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RequestCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_port)
+        self.session = transport.get_session(self.url)
+        self.cache = request_cache.RequestCache()
+        request_cache.set_cache(self.cache)
+
+    def tearDown(self):
+        request_cache.set_cache(None)
+        self.server.shutdown()
+        self.server.server_close()
+        transport.close_all()
+
+    def test_get_sent_once(self):
+        first = self.session.get(self.url, params={'a': 1})
+        self.assertIs(first, self.session.get(self.url, params={'a': 1}))
+        self.session.get(self.url, params={'a': 2})
+        self.assertEqual(2, self.cache.calls)
+        self.assertEqual(1, self.cache.hits)
+
+    def test_write_empties(self):
+        self.session.get(self.url)
+        self.session.post(self.url)
+        self.session.get(self.url)
+        self.assertEqual(3, self.cache.calls)
+
+    def test_errors_not_cached(self):
+        self.session.get(self.url + 'missing')
+        self.session.get(self.url + 'missing')
+        self.assertEqual(2, self.cache.calls)
+
+    def test_without_cache(self):
+        request_cache.set_cache(None)
+        self.assertIs(self.cache, request_cache.last())
+        self.assertIsNot(self.session.get(self.url), self.session.get(self.url))
+
+    def test_bound(self):
+        def get():
+            with request_cache.bound(self.cache):
+                return self.session.get(self.url)
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            pool.submit(get).result()
+            pool.submit(get).result()
+        self.assertEqual(1, self.cache.calls)
+
+
+class RequestScopeTestCase(unittest.TestCase):
+
+    def test_cache_per_request(self):
+        client = create_app().test_client()
+        client.get('/stats/polling')
+        first = request_cache.last()
+        client.get('/stats/polling')
+        self.assertIsNot(first, request_cache.last())
+        self.assertIsNone(request_cache.current())
+        # no backend behind the polling stats
+        self.assertEqual(0, request_cache.last().calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
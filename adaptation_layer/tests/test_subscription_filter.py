@@ -0,0 +1,89 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import unittest
+
+from adaptation_layer import subscription_filter
+
+
+class SubscriptionFilterTestCase(unittest.TestCase):
+    ns_instance = '45f95003-4dd1-4e20-87cf-4373c9f4e946'
+    notification = {
+        'nsInstanceId': ns_instance,
+        'nsLcmOpOccId': '1',
+        'operation': 'INSTANTIATE',
+        'notificationType': 'NsLcmOperationOccurrenceNotification',
+        'operationState': 'COMPLETED'
+    }
+
+    def _sub(self, sub_id, **attrs):
+        sub = {
+            'id': sub_id,
+            'callbackUri': 'http://127.0.0.1:8082/{}'.format(sub_id),
+            'nsInstanceId': self.ns_instance,
+            'notificationTypes': ['NsLcmOperationOccurrenceNotification']
+        }
+        sub.update(attrs)
+        return sub
+
+    def test_flat_attributes(self):
+        subs = [
+            self._sub(1),
+            self._sub(2, operationTypes=['INSTANTIATE', 'TERMINATE']),
+            self._sub(3, operationTypes=['SCALE']),
+            self._sub(4, operationStates=['FAILED']),
+            self._sub(5, notificationTypes=['NsIdentifierCreationNotification']),
+            self._sub(6, nsInstanceId='other')
+        ]
+        selected = subscription_filter.select(subs, self.notification)
+        self.assertEqual([s['id'] for s in selected], [1, 2])
+
+    def test_sol005_filter(self):
+        sub = {
+            'id': 7,
+            'callbackUri': 'http://127.0.0.1:8082/7',
+            'filter': {
+                'nsInstanceSubscriptionFilter': {'nsInstanceIds': [self.ns_instance]},
+                'notificationTypes': ['NsLcmOperationOccurrenceNotification'],
+                'operationStates': ['PROCESSING', 'COMPLETED']
+            }
+        }
+        self.assertTrue(subscription_filter.compile_filter(sub).matches(self.notification))
+        sub['filter']['operationStates'] = ['PROCESSING']
+        self.assertFalse(subscription_filter.compile_filter(sub).matches(self.notification))
+
+    def test_missing_attribute_not_applied(self):
+        # operationTypes do not apply to identifier notifications
+        sub = self._sub(8, notificationTypes=None, operationTypes=['SCALE'])
+        creation = {'nsInstanceId': self.ns_instance, 'notificationType': 'NsIdentifierCreationNotification'}
+        self.assertTrue(subscription_filter.compile_filter(sub).matches(creation))
+        self.assertFalse(subscription_filter.compile_filter(sub).matches(self.notification))
+
+    def test_compiled_once(self):
+        sub = self._sub(9)
+        sub['filterVersion'] = subscription_filter.version(sub)
+        compiled = subscription_filter.compile_filter(sub)
+        self.assertIs(subscription_filter.compile_filter(dict(sub)), compiled)
+        changed = self._sub(9, operationStates=['FAILED'])
+        changed['filterVersion'] = subscription_filter.version(changed)
+        self.assertNotEqual(sub['filterVersion'], changed['filterVersion'])
+        self.assertIsNot(subscription_filter.compile_filter(changed), compiled)
+        self.assertFalse(subscription_filter.compile_filter(changed).matches(self.notification))
+
+    def test_unversioned_not_cached(self):
+        sub = self._sub(10)
+        self.assertIsNot(subscription_filter.compile_filter(sub), subscription_filter.compile_filter(sub))
+
+
+if __name__ == '__main__':
+    unittest.main()
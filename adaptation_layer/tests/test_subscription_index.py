@@ -0,0 +1,103 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import time
+import unittest
+
+from adaptation_layer import subscription_filter, subscription_index
+from .redis_mock import MemoryRedis, dead_redis, use_redis
+
+
+class SubscriptionIndexTestCase(unittest.TestCase):
+    sub = {
+        '_links': {'self': {'href': 'http://localhost:8087/subscriptions/19'}},
+        'callbackUri': 'http://127.0.0.1:8082/',
+        'id': 19,
+        'notificationTypes': ['NsLcmOperationOccurrenceNotification'],
+        'nsInstanceId': '45f95003-4dd1-4e20-87cf-4373c9f4e946'
+    }
+
+    def setUp(self):
+        # lookups must fall back to the repository
+        use_redis(self, dead_redis(), subscription_index)
+
+    def test_entry(self):
+        entry = subscription_index._entry(self.sub)
+        self.assertNotIn('_links', entry)
+        self.assertEqual(entry['callbackUri'], self.sub['callbackUri'])
+        self.assertEqual(subscription_filter.version(entry), entry['filterVersion'])
+
+    def test_fallback_without_redis(self):
+        subscription_index.add(self.sub)
+        subscription_index.remove(self.sub['id'])
+        self.assertIsNone(subscription_index.match(self.sub['nsInstanceId'], 'NsLcmOperationOccurrenceNotification'))
+
+
+class IndexTestCase(unittest.TestCase):
+    ns_instance = '45f95003-4dd1-4e20-87cf-4373c9f4e946'
+    lcm = 'NsLcmOperationOccurrenceNotification'
+
+    def setUp(self):
+        self.redis = use_redis(self, MemoryRedis(), subscription_index)
+        self.sub = dict(SubscriptionIndexTestCase.sub, operationStates=['COMPLETED'])
+        self.other = {
+            'callbackUri': 'http://127.0.0.1:8083/',
+            'id': 20,
+            'notificationTypes': [self.lcm, 'NsChangeNotification'],
+            'nsInstanceId': self.ns_instance
+        }
+
+    def _ids(self, notification_type=lcm, ns_instance=ns_instance):
+        return sorted(entry['id'] for entry in subscription_index.match(ns_instance, notification_type))
+
+    def test_not_ready(self):
+        # the index may miss subscriptions until the first reconciliation
+        subscription_index.add(self.sub)
+        self.assertIsNone(subscription_index.match(self.ns_instance, self.lcm))
+
+    def test_match(self):
+        subscription_index.reconcile([self.sub, self.other], time.time())
+        self.assertEqual([19, 20], self._ids())
+        self.assertEqual([20], self._ids('NsChangeNotification'))
+        self.assertEqual([], self._ids(ns_instance='other'))
+        entry = subscription_index.match(self.ns_instance, 'NsChangeNotification')[0]
+        self.assertEqual(self.other['callbackUri'], entry['callbackUri'])
+        filtered = [e for e in subscription_index.match(self.ns_instance, self.lcm) if e['id'] == 19][0]
+        self.assertEqual(['COMPLETED'], filtered['operationStates'])
+
+    def test_add_remove(self):
+        subscription_index.reconcile([self.sub], time.time())
+        subscription_index.add(self.other)
+        self.assertEqual([19, 20], self._ids())
+        subscription_index.remove(20)
+        self.assertEqual([19], self._ids())
+        self.assertEqual([], self._ids('NsChangeNotification'))
+        subscription_index.remove(20)
+
+    def test_reconcile_removes_deleted(self):
+        subscription_index.reconcile([self.sub, self.other], time.time())
+        subscription_index.reconcile([self.sub], time.time())
+        self.assertEqual([19], self._ids())
+        self.assertEqual(['19'], list(self.redis.hgetall(subscription_index.ALL_KEY)))
+
+    def test_reconcile_keeps_recent(self):
+        subscription_index.reconcile([self.sub], time.time())
+        started = time.time()
+        # created while the repository was listed
+        subscription_index.add(self.other)
+        subscription_index.reconcile([self.sub], started)
+        self.assertEqual([19, 20], self._ids())
+
+
+if __name__ == '__main__':
+    unittest.main()
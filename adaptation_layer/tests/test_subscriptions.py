@@ -0,0 +1,133 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import unittest
+import uuid
+
+from jsonschema import validate
+from jsonschema.exceptions import ValidationError, SchemaError
+
+from adaptation_layer import create_app, subscription_index, tasks
+from .redis_mock import MemoryRedis, dead_redis, use_redis
+from .response_schemas import subscription_schema, subscription_list_schema
+
+
+class SqliteSubscriptionsTestCase(unittest.TestCase):
+    client = None
+
+    @classmethod
+    def setUpClass(cls):
+        """Define test variables and initialize app."""
+        cls.client = create_app().test_client
+
+    def setUp(self):
+        # the index is skipped
+        use_redis(self, dead_redis(), subscription_index)
+        self.ns_instance = str(uuid.uuid4())
+        self.sub = {
+            'callbackUri': 'http://127.0.0.1:8080/callback',
+            'nsInstanceId': self.ns_instance,
+            'notificationTypes': ['NsLcmOperationOccurrenceNotification']
+        }
+
+    def _validate(self, body, schema):
+        try:
+            validate(body, schema)
+        except (ValidationError, SchemaError) as e:
+            self.fail(msg=e.message)
+
+    def test_subscription_lifecycle(self):
+        res = self.client().post('/nfvo/1/subscriptions', json=self.sub)
+        self.assertEqual(201, res.status_code)
+        self._validate(res.json, subscription_schema)
+        sub_id = res.json['id']
+
+        res = self.client().get('/nfvo/1/subscriptions/{}'.format(sub_id))
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(res.json['notificationTypes'], self.sub['notificationTypes'])
+
+        res = self.client().get('/nfvo/1/subscriptions')
+        self.assertEqual(200, res.status_code)
+        self._validate(res.json, subscription_list_schema)
+        self.assertIn(sub_id, [s['id'] for s in res.json['_embedded']['subscriptions']])
+
+        res = self.client().delete('/nfvo/1/subscriptions/{}'.format(sub_id))
+        self.assertEqual(204, res.status_code)
+        res = self.client().get('/nfvo/1/subscriptions/{}'.format(sub_id))
+        self.assertEqual(404, res.status_code)
+        res = self.client().delete('/nfvo/1/subscriptions/{}'.format(sub_id))
+        self.assertEqual(404, res.status_code)
+
+    def test_create_subscription_all_types(self):
+        del self.sub['notificationTypes']
+        res = self.client().post('/nfvo/1/subscriptions', json=self.sub)
+        self.assertEqual(201, res.status_code)
+        self.assertEqual(len(res.json['notificationTypes']), 3)
+        self.client().delete('/nfvo/1/subscriptions/{}'.format(res.json['id']))
+
+    def test_create_subscription_filters(self):
+        self.sub['operationTypes'] = ['INSTANTIATE', 'TERMINATE']
+        self.sub['operationStates'] = ['COMPLETED']
+        res = self.client().post('/nfvo/1/subscriptions', json=self.sub)
+        self.assertEqual(201, res.status_code)
+        self.assertEqual(res.json['operationTypes'], ['INSTANTIATE', 'TERMINATE'])
+        self.assertEqual(res.json['operationStates'], ['COMPLETED'])
+        self.client().delete('/nfvo/1/subscriptions/{}'.format(res.json['id']))
+
+    def test_create_subscription_400(self):
+        del self.sub['callbackUri']
+        res = self.client().post('/nfvo/1/subscriptions', json=self.sub)
+        self.assertEqual(400, res.status_code)
+
+    def test_create_subscription_404(self):
+        res = self.client().post('/nfvo/-1/subscriptions', json=self.sub)
+        self.assertEqual(404, res.status_code)
+
+    def test_create_subscription_422(self):
+        self.sub['notificationTypes'] = ['VnfLcmOperationOccurrenceNotification']
+        res = self.client().post('/nfvo/1/subscriptions', json=self.sub)
+        self.assertEqual(422, res.status_code)
+
+    def test_create_subscription_filters_422(self):
+        self.sub['operationStates'] = ['DONE']
+        res = self.client().post('/nfvo/1/subscriptions', json=self.sub)
+        self.assertEqual(422, res.status_code)
+
+    def test_get_subscription_of_other_nfvo_404(self):
+        sub_id = self.client().post('/nfvo/1/subscriptions', json=self.sub).json['id']
+        res = self.client().get('/nfvo/2/subscriptions/{}'.format(sub_id))
+        self.assertEqual(404, res.status_code)
+        self.client().delete('/nfvo/1/subscriptions/{}'.format(sub_id))
+
+    def test_search_subs_by_ns_instance(self):
+        sub_id = self.client().post('/nfvo/1/subscriptions', json=self.sub).json['id']
+        with tasks._subscriptions() as repository:
+            subs = repository.search_subs_by_ns_instance(self.ns_instance)
+            self.assertEqual([s['id'] for s in subs], [sub_id])
+            self.assertEqual(repository.search_subs_by_ns_instance(str(uuid.uuid4())), [])
+        self.client().delete('/nfvo/1/subscriptions/{}'.format(sub_id))
+
+    def test_worker_reads_api_subscriptions(self):
+        # the celery worker opens the database written by the flask app
+        use_redis(self, MemoryRedis(), subscription_index)
+        sub_id = self.client().post('/nfvo/1/subscriptions', json=self.sub).json['id']
+        tasks.reconcile_subscriptions()
+        subs = subscription_index.match(self.ns_instance, 'NsLcmOperationOccurrenceNotification')
+        self.assertEqual([sub_id], [s['id'] for s in subs])
+        self.client().delete('/nfvo/1/subscriptions/{}'.format(sub_id))
+        tasks.reconcile_subscriptions()
+        self.assertEqual([], subscription_index.match(self.ns_instance, 'NsLcmOperationOccurrenceNotification'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,287 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import time
+import unittest
+from datetime import datetime
+
+from adaptation_layer import circuit_breaker, polling, tasks
+from adaptation_layer.error_handler import ServerError
+from adaptation_layer.repository import iwf_inventory, iwf_repository
+from .redis_mock import MemoryRedis, use_redis
+
+NFVO_SELF = 'http://iwf-repository/nfvOrchestrators/1'
+
+
+def _osm_vim(vim_id, name):
+    return {'_id': vim_id, 'name': name, 'vim_type': 'openstack',
+            'vim_url': 'http://{}:5000/v3'.format(vim_id), 'vim_tenant_name': 'admin'}
+
+
+def _repo_vim(osm_vim):
+    repo_vim = iwf_repository.convert_osm_vim(osm_vim)
+    repo_vim['_links'] = {'self': {'href': 'http://iwf-repository/vimAccounts/' + osm_vim['_id']}}
+    return repo_vim
+
+
+def _sol_time(timestamp: float) -> str:
+    return datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def _op(op_id, state, timestamp):
+    return {'id': op_id, 'nsInstanceId': 'ns', 'lcmOperationType': 'INSTANTIATE', 'operationState': state,
+            'stateEnteredTime': _sol_time(timestamp), 'startTime': _sol_time(timestamp)}
+
+
+def _stub(test: unittest.TestCase, module, name, value):
+    test.addCleanup(setattr, module, name, getattr(module, name))
+    setattr(module, name, value)
+
+
+class VimSyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = use_redis(self, MemoryRedis(), tasks, circuit_breaker)
+        osm = {'id': 1, 'credentials': {'username': 'admin', 'host': 'osm', 'port': 9999},
+               '_links': {'self': {'href': NFVO_SELF}}}
+        self.osm_vims = [_osm_vim('vim1', 'one'), _osm_vim('vim2', 'two')]
+        # the repository, keyed by VIM id
+        self.repo = {}
+        self.calls = []
+        self.reads = 0
+        self.repo_down = False
+        test = self
+
+        class OSM(object):
+
+            def __init__(self, cred):
+                self._nfvoId = cred['nfvo_id']
+
+            def get_vim_list(self):
+                return test.osm_vims, {}
+
+        def iter_records(collection, href=None, params=None):
+            self.reads += 1
+            return iter(list(self.repo.values()))
+
+        def create_vim(payload, nfvo_self):
+            if self.repo_down:
+                raise ServerError('repository down')
+            self.calls.append(('create', payload['vimAccountNfvoId']))
+            self.assertEqual(NFVO_SELF, nfvo_self)
+
+        def update_vim(vim, payload):
+            self.calls.append(('update', vim['vimAccountNfvoId']))
+
+        def delete_vim(vim):
+            self.calls.append(('delete', vim['vimAccountNfvoId']))
+
+        _stub(self, tasks, 'OSM', OSM)
+        _stub(self, iwf_inventory, 'find_nfvos_by_type', lambda nfvo_type: [osm])
+        _stub(self, iwf_repository, 'iter_records', iter_records)
+        _stub(self, iwf_repository, 'create_vim', create_vim)
+        _stub(self, iwf_repository, 'update_vim', update_vim)
+        _stub(self, iwf_repository, 'delete_vim', delete_vim)
+
+    def _sync(self):
+        """Run post_osm_vims, then mirror the VIMs of OSM in the repository."""
+        self.calls = []
+        tasks.post_osm_vims()
+        self.repo = {v['_id']: _repo_vim(v) for v in self.osm_vims}
+        return sorted(self.calls)
+
+    def test_create(self):
+        self.assertEqual([('create', 'vim1'), ('create', 'vim2')], self._sync())
+        self.assertEqual(1, self.reads)
+
+    def test_skip_unchanged(self):
+        self._sync()
+        self.assertEqual([], self._sync())
+        # the repository is not even read
+        self.assertEqual(1, self.reads)
+
+    def test_update_and_delete(self):
+        self._sync()
+        self.osm_vims = [_osm_vim('vim1', 'renamed'), _osm_vim('vim3', 'three')]
+        self.assertEqual([('create', 'vim3'), ('delete', 'vim2'), ('update', 'vim1')], self._sync())
+        self.assertEqual([], self._sync())
+
+    def test_existing_vims_not_created(self):
+        self.repo = {v['_id']: _repo_vim(v) for v in self.osm_vims}
+        self.assertEqual([], self._sync())
+
+    def test_retry_failed_sync(self):
+        self.repo_down = True
+        tasks.post_osm_vims()
+        self.assertIsNone(self.redis.get('vims_1'))
+        self.repo_down = False
+        self.assertEqual([('create', 'vim1'), ('create', 'vim2')], self._sync())
+
+    def test_state_ttl(self):
+        self._sync()
+        self.assertGreater(self.redis.ttl('vims_1'), 0)
+        self.redis.expire('vims_1', 10)
+        # renewed by each sync of the OSM
+        self._sync()
+        self.assertGreater(self.redis.ttl('vims_1'), 10)
+
+
+class CountingRedis(MemoryRedis):
+    """In-memory redis recording its round trips, a pipeline counts as one."""
+
+    def __init__(self):
+        super().__init__()
+        self.round_trips = []
+        self._in_pipeline = False
+
+    def _sent(self, name):
+        if not self._in_pipeline:
+            self.round_trips.append(name)
+
+    def get(self, name):
+        self._sent('get')
+        return super().get(name)
+
+    def mget(self, keys, *args):
+        self._sent('mget')
+        return super().mget(keys, *args)
+
+    def set(self, name, value, ex=None, px=None, nx=False, xx=False):
+        self._sent('set')
+        return super().set(name, value, ex=ex, px=px, nx=nx, xx=xx)
+
+    def setex(self, name, time_s, value):
+        self._sent('setex')
+        return super().setex(name, time_s, value)
+
+    def pipeline(self, transaction=True):
+        pipe = super().pipeline(transaction)
+        execute = pipe.execute
+
+        def counted():
+            self._sent('pipeline')
+            self._in_pipeline = True
+            try:
+                return execute()
+            finally:
+                self._in_pipeline = False
+
+        pipe.execute = counted
+        return pipe
+
+
+class ChangedOpsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = use_redis(self, CountingRedis(), tasks)
+        self.ops = [_op('op{}'.format(i), 'PROCESSING', 0) for i in range(100)]
+
+    def test_round_trips(self):
+        self.assertEqual(self.ops, tasks._changed_ops(self.ops))
+        self.assertEqual(['mget', 'pipeline'], self.redis.round_trips)
+        self.assertEqual('PROCESSING', self.redis.get('op42'))
+
+    def test_only_changed(self):
+        tasks._changed_ops(self.ops)
+        self.redis.round_trips = []
+        self.ops[42]['operationState'] = 'COMPLETED'
+        self.assertEqual([self.ops[42]], tasks._changed_ops(self.ops))
+        self.assertEqual(['mget', 'pipeline'], self.redis.round_trips)
+
+    def test_unchanged_read_only(self):
+        tasks._changed_ops(self.ops)
+        self.redis.round_trips = []
+        self.assertEqual([], tasks._changed_ops(self.ops))
+        self.assertEqual(['mget'], self.redis.round_trips)
+        self.assertEqual([], tasks._changed_ops([]))
+        self.assertEqual(['mget'], self.redis.round_trips)
+
+
+class PollOsmTestCase(unittest.TestCase):
+    osm = {'id': 1, 'credentials': {'username': 'admin', 'host': 'osm', 'port': 9999}}
+
+    def setUp(self):
+        self.redis = use_redis(self, MemoryRedis(), tasks, polling, circuit_breaker)
+        # ops returned by OSM, the query args it got and the notifications sent
+        self.ops = []
+        self.queries = []
+        self.notified = []
+        test = self
+
+        class OSM(object):
+
+            def __init__(self, cred):
+                self._nfvoId = cred['nfvo_id']
+
+            def get_op_list(self, args=None):
+                test.queries.append(args['args'])
+                return test.ops, {}
+
+        class ForwardNotification(object):
+
+            @staticmethod
+            def delay(notification):
+                test.notified.append(notification['nsLcmOpOccId'])
+
+        _stub(self, tasks, 'OSM', OSM)
+        _stub(self, tasks, 'forward_notification', ForwardNotification)
+        self.now = int(time.time())
+
+    def test_timestamp(self):
+        self.assertEqual(0.5, tasks._timestamp('1970-01-01T00:00:00.5Z'))
+        self.assertEqual(60, tasks._timestamp('1970-01-01T00:01:00Z'))
+
+    def test_no_watermark(self):
+        # start from the oldest state still remembered
+        self.assertAlmostEqual(time.time() - tasks.KEY_TTL, tasks._get_watermark(1), delta=1)
+
+    def test_watermark_filter(self):
+        self.redis.set('watermark_1', self.now)
+        self.ops = [_op('old', 'COMPLETED', self.now - tasks.WATERMARK_OVERLAP - 5),
+                    _op('overlap', 'COMPLETED', self.now - tasks.WATERMARK_OVERLAP + 5),
+                    _op('new', 'PROCESSING', self.now + 5)]
+        tasks._poll_osm(self.osm)
+        self.assertEqual([{'statusEnteredTime.gt': self.now - tasks.WATERMARK_OVERLAP}], self.queries)
+        # an OSM ignoring the query is filtered here
+        self.assertEqual(['overlap', 'new'], self.notified)
+
+    def test_overlap_not_notified_twice(self):
+        self.ops = [_op('op', 'PROCESSING', self.now)]
+        tasks._poll_osm(self.osm)
+        # the op is read again within the overlap window, in the same state
+        tasks._poll_osm(self.osm)
+        self.ops = [_op('op', 'COMPLETED', self.now + 1)]
+        tasks._poll_osm(self.osm)
+        self.assertEqual(['op', 'op'], self.notified)
+
+    def test_watermark_advances(self):
+        self.ops = [_op('a', 'COMPLETED', self.now - 30), _op('b', 'COMPLETED', self.now - 20)]
+        tasks._poll_osm(self.osm)
+        self.assertEqual(self.now - 20, tasks._get_watermark(1))
+        tasks._poll_osm(self.osm)
+        self.assertEqual(self.now - 20 - tasks.WATERMARK_OVERLAP, self.queries[-1]['statusEnteredTime.gt'])
+        # ops within the overlap never move the watermark back
+        self.ops = [_op('a', 'FAILED', self.now - 25)]
+        tasks._poll_osm(self.osm)
+        self.assertEqual(self.now - 20, tasks._get_watermark(1))
+        self.assertEqual(tasks.KEY_TTL, self.redis.ttl('watermark_1'))
+
+    def test_watermark_kept_without_ops(self):
+        self.redis.set('watermark_1', self.now)
+        tasks._poll_osm(self.osm)
+        self.assertEqual(self.now, tasks._get_watermark(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
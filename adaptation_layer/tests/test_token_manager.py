@@ -0,0 +1,150 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from adaptation_layer.driver import osm
+from .redis_mock import MemoryRedis, dead_redis, use_redis
+
+TOKEN_KEY = 'nfvo_1'
+
+
+class Login(object):
+    """Login stub counting its calls, each returns a new token."""
+
+    def __init__(self, lifetime=3600, delay=0.0):
+        self.calls = 0
+        self.lifetime = lifetime
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        time.sleep(self.delay)
+        with self._lock:
+            self.calls += 1
+            return {'id': 'token{}'.format(self.calls), 'expires': time.time() + self.lifetime}
+
+
+def _token(name, lifetime):
+    return {'id': name, 'expires': time.time() + lifetime}
+
+
+class TokenManagerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = use_redis(self, MemoryRedis(), osm)
+        self.manager = osm.TokenManager()
+
+    def test_login_once(self):
+        login = Login()
+        token = self.manager.get(TOKEN_KEY, login)
+        self.assertIs(token, self.manager.get(TOKEN_KEY, login))
+        self.assertEqual(1, login.calls)
+        self.assertEqual(token, json.loads(self.redis.get(TOKEN_KEY)))
+        self.assertLessEqual(self.redis.ttl(TOKEN_KEY), osm.KEY_TTL)
+
+    def test_single_flight(self):
+        login = Login(delay=0.1)
+        # two workers sharing redis, each with threads asking for a token
+        workers = [self.manager, osm.TokenManager()]
+        with ThreadPoolExecutor(8) as pool:
+            tokens = list(pool.map(lambda i: workers[i % 2].get(TOKEN_KEY, login), range(8)))
+        self.assertEqual(1, login.calls)
+        self.assertEqual({'token1'}, {t['id'] for t in tokens})
+        self.assertIsNone(self.redis.get('lock_' + TOKEN_KEY))
+
+    def test_refresh_ahead_of_expiry(self):
+        login = Login()
+        self.manager._store(TOKEN_KEY, _token('old', osm.TOKEN_REFRESH_MARGIN - 1))
+        self.assertEqual('token1', self.manager.get(TOKEN_KEY, login)['id'])
+        self.assertEqual(1, login.calls)
+
+    def test_keep_token_out_of_margin(self):
+        login = Login()
+        self.manager._store(TOKEN_KEY, _token('old', osm.TOKEN_REFRESH_MARGIN + 30))
+        self.assertEqual('old', self.manager.get(TOKEN_KEY, login)['id'])
+        self.assertEqual(0, login.calls)
+
+    def test_read_token_of_other_worker(self):
+        login = Login()
+        osm.TokenManager()._store(TOKEN_KEY, _token('other', 3600))
+        self.assertEqual('other', self.manager.get(TOKEN_KEY, login)['id'])
+        self.assertEqual(0, login.calls)
+
+    def test_valid_token_while_other_refreshes(self):
+        login = Login()
+        self.manager._store(TOKEN_KEY, _token('old', osm.TOKEN_REFRESH_MARGIN - 1))
+        self.redis.set('lock_' + TOKEN_KEY, 'other', px=10000)
+        # no waiting, the token about to expire is still good
+        self.assertEqual('old', self.manager.get(TOKEN_KEY, login)['id'])
+        self.assertEqual(0, login.calls)
+
+    def test_wait_for_other_worker(self):
+        login = Login()
+        other = osm.TokenManager()
+        self.redis.set('lock_' + TOKEN_KEY, 'other', px=10000)
+
+        def other_login():
+            time.sleep(0.2)
+            other._store(TOKEN_KEY, _token('other', 3600))
+            self.redis.delete('lock_' + TOKEN_KEY)
+
+        thread = threading.Thread(target=other_login)
+        thread.start()
+        self.assertEqual('other', self.manager.get(TOKEN_KEY, login)['id'])
+        thread.join()
+        self.assertEqual(0, login.calls)
+
+    def test_invalidate(self):
+        login = Login()
+        token = self.manager.get(TOKEN_KEY, login)
+        self.manager.invalidate(TOKEN_KEY, token)
+        self.assertIsNone(self.redis.get(TOKEN_KEY))
+        self.assertEqual('token2', self.manager.get(TOKEN_KEY, login)['id'])
+        self.assertEqual(2, login.calls)
+
+    def test_invalidate_keeps_newer_token(self):
+        login = Login()
+        token = self.manager.get(TOKEN_KEY, login)
+        # another worker already replaced the rejected token
+        osm.TokenManager()._store(TOKEN_KEY, _token('other', 3600))
+        self.manager.invalidate(TOKEN_KEY, token)
+        self.assertEqual('other', json.loads(self.redis.get(TOKEN_KEY))['id'])
+
+
+class TokenManagerWithoutRedisTestCase(unittest.TestCase):
+
+    def setUp(self):
+        use_redis(self, dead_redis(), osm)
+        self.manager = osm.TokenManager()
+
+    def test_login_without_redis(self):
+        login = Login()
+        token = self.manager.get(TOKEN_KEY, login)
+        # still cached in process memory
+        self.assertIs(token, self.manager.get(TOKEN_KEY, login))
+        self.assertEqual(1, login.calls)
+
+    def test_invalidate_without_redis(self):
+        login = Login()
+        self.manager.invalidate(TOKEN_KEY, self.manager.get(TOKEN_KEY, login))
+        self.assertEqual('token2', self.manager.get(TOKEN_KEY, login)['id'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#  Copyright 2019 CNIT, Francesco Lombardo, Matteo Pergolesi
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# module to share pooled, keep-alive HTTP sessions among drivers and to
+# build the redis clients of the modules
+
+import logging
+import os
+import socket
+import threading
+from typing import Dict
+from urllib.parse import urlsplit
+
+import redis
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+from adaptation_layer import deadline, request_cache
+
+logger = logging.getLogger('app.transport')
+
+# number of connections kept open towards a single backend
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE')) if os.getenv('HTTP_POOL_MAXSIZE') else 10
+# number of per-host pools cached by a session (redirects may add hosts)
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS')) if os.getenv('HTTP_POOL_CONNECTIONS') else 4
+HTTP_KEEPALIVE = os.getenv('HTTP_KEEPALIVE', 'true').lower()
+
+redis_host = os.getenv('REDIS_HOST') if os.getenv('REDIS_HOST') else 'redis'
+redis_port = int(os.getenv('REDIS_PORT')) if os.getenv('REDIS_PORT') else 6379
+# seconds to connect to redis and to wait for one of its replies, the modules
+# fail open on errors so an unreachable redis must not stall requests
+REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT')) if os.getenv('REDIS_CONNECT_TIMEOUT') else 0.5
+REDIS_TIMEOUT = float(os.getenv('REDIS_TIMEOUT')) if os.getenv('REDIS_TIMEOUT') else 2
+
+_sessions: Dict[str, Session] = {}
+_lock = threading.Lock()
+
+
+class _PoolAdapter(HTTPAdapter):
+    """HTTPAdapter enabling TCP keep-alive on pooled sockets.
+
+    Connections (and their TLS sessions) stay open in the pool and are reused
+    by following requests, so only the first hop pays for the handshake.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        if HTTP_KEEPALIVE == 'true':
+            kwargs['socket_options'] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        super().init_poolmanager(*args, **kwargs)
+
+
+class _DeadlineSession(Session):
+    """Session bounding every request by the deadline of the running request.
+
+    An explicit timeout argument takes precedence. Within an API request,
+    GETs are answered from its request_cache when already sent.
+    """
+
+    def request(self, method, url, **kwargs):
+        cache = request_cache.current()
+        key = None
+        if cache is not None and method.upper() == 'GET' and not kwargs.get('stream'):
+            key = cache.key(url, kwargs.get('params'), kwargs.get('headers'))
+            resp = cache.get(key)
+            if resp is not None:
+                return resp
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = deadline.timeout()
+        resp = super().request(method, url, **kwargs)
+        if cache is not None:
+            cache.sent(key, resp)
+        return resp
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return '{0}://{1}'.format(parts.scheme, parts.netloc)
+
+
+def _new_session() -> Session:
+    session = _DeadlineSession()
+    adapter = _PoolAdapter(pool_connections=HTTP_POOL_CONNECTIONS,
+                           pool_maxsize=HTTP_POOL_MAXSIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session(url: str) -> Session:
+    """Return the pooled session for the backend serving url.
+
+    Sessions are shared per origin (scheme, host and port) inside the process.
+    """
+    origin = _origin(url)
+    session = _sessions.get(origin)
+    if session is None:
+        with _lock:
+            session = _sessions.get(origin)
+            if session is None:
+                logger.debug('new pooled session for {}'.format(origin))
+                session = _new_session()
+                _sessions[origin] = session
+    return session
+
+
+def close_all() -> None:
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def get_redis(db: int) -> redis.Redis:
+    """Return a client of the redis database db, with short socket timeouts."""
+    return redis.Redis(host=redis_host, port=redis_port, db=db, decode_responses=True,
+                       socket_connect_timeout=REDIS_CONNECT_TIMEOUT, socket_timeout=REDIS_TIMEOUT)